@@ -0,0 +1,121 @@
+"""Parity harness of the columnar engine (`ColumnarEngine` over the date
+index of `BTAnalyzer.time_index`) with the per-method path: on the sample
+payload and on reports generated from it, every attribute of
+`calculate_attributes(mode="columnar")` must have the same value and type as
+with `mode="method"`, and random `TransactionSpec` (windows, thresholds,
+directions, categories, internal transfers, months, explicit last dates)
+must give the same values as `calculate_transaction_spec`. Both paths are
+timed.
+
+Fails (exit 1) on any difference.
+
+Usage, from the root of the repository:
+    python -m benchmarks.attribute_parity --nb-reports 4 --nb-specs 300
+"""
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+from typing import List
+import pandas as pd
+from benchmarks.report_build import __SAMPLE__, generate_report
+from zbta.api.api import APIConnector
+from zbta.attributes.common import (
+    ColumnarEngine, TransactionSpec, calculate_transaction_spec)
+
+__CATEGORIES__ = ["is_salary", "is_benefit", "is_fee", "is_cash",
+                  "is_obligation", "is_payday", "is_consumer_loan"]
+
+
+def random_specs(rng: random.Random, last_date: pd.Timestamp,
+                 nb: int) -> List[TransactionSpec]:
+    """Returns random specs over the filters of `limit_transaction_dataset`.
+    """
+    specs = []
+    for _ in range(nb):
+        direction = rng.choice([(False, False), (True, False), (False, True)])
+        specs.append(TransactionSpec(
+            aggregation=rng.choice(["count", "amount"]),
+            ndays=rng.choice([0, 1, 7, 30, 31, 60, 90, 180, 365, 1000]),
+            amt_thr=rng.choice([0, 0, 1, 20, 100, 500]),
+            is_inc=direction[0],
+            is_out=direction[1],
+            remove_internal=rng.random() < .5,
+            categories=tuple(rng.sample(__CATEGORIES__, rng.choice(
+                [0, 0, 1, 2]))),
+            whichmonth=rng.choice([None, None, 0, -1, -2, -6, -13, 1]),
+            last_date=rng.choice([
+                "last-date", last_date - pd.Timedelta(days=rng.randint(
+                    0, 120))])))
+    return specs
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nb-reports", type=int, default=4,
+                        help="number of reports generated from the sample")
+    parser.add_argument("--nb-accounts", type=int, default=3)
+    parser.add_argument("--scale", type=int, default=2)
+    parser.add_argument("--nb-specs", type=int, default=300,
+                        help="number of random specs per report")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.disable(logging.CRITICAL)
+    rng = random.Random(args.seed)
+
+    with open(__SAMPLE__, "r", encoding="utf8") as hh:
+        sample = json.load(hh)
+    payloads = [("sample", sample)]
+    for ireport in range(args.nb_reports):
+        request = generate_report(sample["request"], args.nb_accounts,
+                                  args.scale, args.seed + ireport)
+        payloads.append((f"generated {ireport}", dict(sample,
+                                                      request=request)))
+
+    nb_diffs = 0
+    for label, payload in payloads:
+        connector = APIConnector(payload)
+        connector.process_payload()
+        engine = connector.engine
+        timings = {}
+        values = {}
+        for mode in ["method", "columnar"]:
+            start = time.perf_counter()
+            engine.calculate_attributes(mode=mode)
+            timings[mode] = time.perf_counter() - start
+            values[mode] = dict(engine.attributes)
+        expected, actual = values["method"], values["columnar"]
+        if list(expected) != list(actual):
+            nb_diffs += 1
+            print(f"{label}: the attributes differ", file=sys.stderr)
+        for name, value in expected.items():
+            if not (actual.get(name) == value
+                    and type(actual.get(name)) is type(value)):
+                nb_diffs += 1
+                print(f"{label}: {name} {value!r} != {actual.get(name)!r}",
+                      file=sys.stderr)
+
+        btanalyzer = connector.btanalyzer
+        specs = random_specs(rng, btanalyzer.dfs["date"].max(),
+                             args.nb_specs)
+        columnar = ColumnarEngine(btanalyzer).evaluate(
+            {str(i): el for i, el in enumerate(specs)})
+        for i, spec in enumerate(specs):
+            value = calculate_transaction_spec(btanalyzer, spec)
+            if not (columnar[str(i)] == value
+                    and type(columnar[str(i)]) is type(value)):
+                nb_diffs += 1
+                print(f"{label}: {spec} {value!r} != {columnar[str(i)]!r}",
+                      file=sys.stderr)
+        print(f"{label}: {len(btanalyzer.dfs)} transactions, "
+              f"{len(expected)} attributes, method "
+              f"{timings['method'] * 1e3:.1f}ms, columnar "
+              f"{timings['columnar'] * 1e3:.1f}ms, {len(specs)} specs")
+    print(f"{nb_diffs} different")
+    return 1 if nb_diffs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""Checks `ReportFiserv._get_end_of_day` (and the daily view built from it
+in `_merge_accts`) against the original day by day implementation on
+generated account histories, and times both.
+
+Usage, from the root of the repository:
+    python -m benchmarks.end_of_day --nb-histories 500 --max-days 1500
+"""
+import argparse
+import sys
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from zbta.parsers.fiserv import ReportFiserv
+
+
+def legacy_end_of_day(account):
+    """The original implementation, kept as the reference."""
+    df = account.transactions
+
+    dateloopvar = account.oldest_balance_date
+    ndays = int((account.most_recent_balance_date
+                 - account.oldest_balance_date).days)+1
+
+    if df.shape[0] == 0:
+        list_balances = [account.current_balance]*ndays
+        list_dates = [dateloopvar + timedelta(days=idays)
+                      for idays in range(0, ndays)]
+        return pd.DataFrame(
+            {"date": list_dates, "balance": list_balances})
+
+    list_dates = [0.]*ndays
+    list_balances = [0.]*ndays
+
+    df_endofday = df.loc[
+        :, ["date", "balance"]].groupby(by="date").last().reset_index(
+    ).sort_values(by="date")
+
+    df = df.sort_values(by="date", ascending=True)
+
+    day_bal = df["balance"].iloc[0] - df["amount"].iloc[0]
+    counter_orig = 0
+    Ncases = 0
+    while (dateloopvar <= account.most_recent_balance_date):
+        condition = dateloopvar == df_endofday["date"].values[counter_orig]
+
+        if condition:
+            day_bal = df_endofday["balance"].values[counter_orig]
+            if counter_orig < df_endofday.shape[0]-1:
+                counter_orig += 1
+        elif day_bal is not None:
+            list_dates[Ncases] = dateloopvar
+            list_balances[Ncases] = day_bal
+            Ncases += 1
+
+        dateloopvar += timedelta(days=1)
+
+    return pd.concat(
+        [
+            df_endofday,
+            pd.DataFrame(
+                {"date": list_dates[:Ncases],
+                 "balance": list_balances[:Ncases]}
+            )
+        ],
+        ignore_index=True
+    ).sort_values(by="date")
+
+
+def generate_account(rng: np.random.Generator, max_days: int):
+    """A random account: the transactions may start before the oldest
+    balance date, several transactions may share a day and some accounts
+    have no transaction at all."""
+    first = pd.Timestamp("2018-01-01") + pd.Timedelta(
+        days=int(rng.integers(0, 365)))
+    ndays = int(rng.integers(1, max_days))
+    last = first + pd.Timedelta(days=ndays - 1)
+    nb_trans = int(rng.integers(0, 3 * ndays)) if rng.random() > 0.05 else 0
+    start = -int(rng.integers(0, 5)) if rng.random() < 0.2 else 0
+    dates = first + pd.to_timedelta(
+        np.sort(rng.integers(start, ndays + 2, nb_trans)), unit="D")
+    amounts = np.round(rng.normal(0, 200, nb_trans), 2)
+    current_balance = float(np.round(rng.normal(1000, 500), 2))
+    transactions = pd.DataFrame({"date": dates, "amount": amounts})
+    transactions["balance"] = transactions["amount"].cumsum() + \
+        current_balance - amounts.sum()
+    return SimpleNamespace(
+        transactions=transactions, oldest_balance_date=first,
+        most_recent_balance_date=last, current_balance=current_balance)
+
+
+def daily(end_of_days):
+    """The cross account sum of `ReportFiserv._merge_accts`."""
+    return pd.concat(end_of_days).groupby(by="date")[
+        "balance"].sum().to_frame().reset_index()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nb-histories", type=int, default=200)
+    parser.add_argument("--max-days", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+
+    nb_diffs = 0
+    elapsed = {"legacy": 0., "current": 0.}
+    for i in range(args.nb_histories):
+        accounts = [generate_account(rng, args.max_days)
+                    for _ in range(int(rng.integers(1, 4)))]
+        results = {}
+        for name, func in [
+                ("legacy", legacy_end_of_day),
+                ("current", lambda acc: ReportFiserv._get_end_of_day(
+                    None, acc))]:
+            start = time.perf_counter()
+            results[name] = [func(acc) for acc in accounts]
+            elapsed[name] += time.perf_counter() - start
+        try:
+            for expected, actual in zip(results["legacy"], results["current"]):
+                pd.testing.assert_frame_equal(expected, actual)
+            pd.testing.assert_frame_equal(
+                daily(results["legacy"]), daily(results["current"]))
+        except AssertionError as err:
+            nb_diffs += 1
+            print(f"history {i}: {err}", file=sys.stderr)
+    print(f"{args.nb_histories} histories, {nb_diffs} different, "
+          f"legacy {elapsed['legacy']:.2f}s, "
+          f"current {elapsed['current']:.2f}s")
+    return 0 if nb_diffs == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Cold start gate: the time of `from zbta.api.api import APIConnector` in a
+fresh interpreter, from `python -X importtime`, and the modules that must
+not be imported by it (they are deferred to the first request).
+
+Fails (exit 1) if the median over the runs is over the budget or if one of
+the deferred modules is imported. With --first-request, also reports the
+time of the first request of a fresh interpreter, which pays for the
+deferred imports.
+
+Usage, from the root of the repository:
+    python -m benchmarks.import_time --runs 5 --budget-ms 150
+    python -m benchmarks.import_time --first-request
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+import numpy as np
+
+__STATEMENT__ = "from zbta.api.api import APIConnector"
+__TARGET__ = "zbta.api.api"
+__DEFERRED__ = ["pandas", "numpy", "jsonschema", "strsimpy"]
+__SAMPLE__ = os.path.join(
+    os.path.dirname(__file__), "..", "zbta", "data", "fiserv",
+    "415060515_AllData_single_file_nopii.json")
+__LINE__ = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+__ROOT__ = os.path.join(os.path.dirname(__file__), "..")
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.abspath(__ROOT__)] +
+        [el for el in [env.get("PYTHONPATH")] if el])
+    return env
+
+
+def import_times(statement: str) -> Dict[str, Tuple[int, int, int]]:
+    """Returns the self and cumulative times (us) and the depth of every
+    module imported by the statement in a fresh interpreter."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True, env=_env(), check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        match = __LINE__.match(line)
+        if match:
+            times[match.group(4)] = (
+                int(match.group(1)), int(match.group(2)),
+                len(match.group(3)) // 2)
+    return times
+
+
+def first_request(sample: str) -> float:
+    """Returns the seconds of the import and first request of a fresh
+    interpreter."""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"{__STATEMENT__}; "
+        "import logging; logging.getLogger('zbta').setLevel(logging.ERROR); "
+        f"payload = open({sample!r}, 'rb').read(); "
+        "response = APIConnector(payload).process_payload(); "
+        "assert 'error_code' not in response, response; "
+        "print(time.perf_counter() - start)")
+    proc = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True,
+        env=_env(), check=True)
+    return float(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=150.)
+    parser.add_argument("--top", type=int, default=10,
+                        help="number of slowest modules listed")
+    parser.add_argument("--first-request", action="store_true")
+    args = parser.parse_args(argv)
+
+    totals: List[float] = []
+    times = {}
+    for _ in range(args.runs):
+        times = import_times(__STATEMENT__)
+        totals.append(times[__TARGET__][1] / 1e3)
+    median = float(np.median(totals))
+    deferred = sorted(el for el in __DEFERRED__ if el in times)
+
+    print(f"{__STATEMENT__}: median {median:.1f}ms over {args.runs} runs "
+          f"(min {min(totals):.1f}ms, budget {args.budget_ms:.0f}ms)")
+    print("slowest modules (self time):")
+    for name, (own, cumul, _) in sorted(
+            times.items(), key=lambda el: -el[1][0])[:args.top]:
+        print(f"  {own / 1e3:7.1f}ms {cumul / 1e3:7.1f}ms  {name}")
+    if args.first_request:
+        print(f"import + first request: {first_request(__SAMPLE__):.2f}s")
+
+    failed = False
+    if deferred:
+        print(f"FAIL: imported eagerly: {deferred}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: over the budget of {args.budget_ms:.0f}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Overhead of the latency instrumentation (`zbta.core.tracing`) on
+`APIConnector.process_payload`.
+
+Compares the median time of a request with the instrumentation disabled,
+enabled (every request traced into the histograms) and without the spans
+at all (`span` replaced by the no-op), and prints the trace of a request
+and the Prometheus export of the histograms. Fails (exit 1) if the spans
+cost more than the budget with the instrumentation disabled.
+
+Usage, from the root of the repository:
+    python -m benchmarks.instrumentation --repeat 200 --budget 0.01
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, List
+import numpy as np
+from zbta.api.api import APIConnector, preload
+from zbta.core import tracing
+
+__SAMPLE__ = os.path.join(
+    os.path.dirname(__file__), "..", "zbta", "data", "fiserv",
+    "415060515_AllData_single_file_nopii.json")
+
+
+def _time(payload: bytes, repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        APIConnector(payload).process_payload()
+        times.append(time.perf_counter_ns() - start)
+    return times
+
+
+def _no_span(name: str) -> tracing._NoSpan:
+    return tracing.__NO_SPAN__
+
+
+def _without_spans(run: Callable[[], List[float]]) -> List[float]:
+    """Runs with `span` replaced by the no-op in the modules of the
+    pipeline, the baseline of the disabled instrumentation."""
+    from zbta.attributes import common
+    from zbta.btanalyzer import btanalyzer
+    from zbta.api import api
+    from zbta.parsers import fiserv
+    modules = [api, common, btanalyzer, fiserv]
+    spans = [el.span for el in modules]
+    for el in modules:
+        el.span = _no_span
+    try:
+        return run()
+    finally:
+        for el, orig in zip(modules, spans):
+            el.span = orig
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sample", default=__SAMPLE__)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--budget", type=float, default=.01,
+                        help="maximum relative overhead when disabled")
+    parser.add_argument("--rounds", type=int, default=3,
+                        help="the configurations are interleaved")
+    args = parser.parse_args(argv)
+
+    with open(args.sample, "rb") as hh:
+        payload = hh.read()
+    preload()
+    _time(payload, 10)  # warm up
+
+    baseline, disabled, enabled = [], [], []
+    for _ in range(args.rounds):
+        tracing.enable_instrumentation(False)
+        baseline += _without_spans(lambda: _time(payload, args.repeat))
+        disabled += _time(payload, args.repeat)
+        tracing.enable_instrumentation(True)
+        enabled += _time(payload, args.repeat)
+    tracing.enable_instrumentation(False)
+
+    base = float(np.median(baseline))
+    for name, times in [("no spans", baseline), ("disabled", disabled),
+                        ("enabled", enabled)]:
+        median = float(np.median(times))
+        print(f"{name:>9}: median {median / 1e6:7.3f}ms "
+              f"p99 {np.percentile(times, 99) / 1e6:7.3f}ms "
+              f"overhead {(median - base) / base:+.2%}")
+
+    # the cost of a span without tracer, per span of a request
+    nb = 100000
+    start = time.perf_counter_ns()
+    for _ in range(nb):
+        with tracing.span("x"):
+            pass
+    cost = (time.perf_counter_ns() - start) / nb
+    data = json.loads(payload)
+    data["request"]["meta"]["trace"] = True
+    trace = APIConnector(data).process_payload()["response"]["trace"]
+    estimate = cost * len(trace) / base
+    print(f"disabled span: {cost:.0f}ns x {len(trace)} spans per request "
+          f"= {estimate:.3%} of a request")
+    print("slowest spans:")
+    for el in sorted(trace, key=lambda el: -el["duration_ms"])[:10]:
+        print(f"  {el['duration_ms']:8.3f}ms  {'  ' * el['depth']}"
+              f"{el['name']}")
+    print(tracing.get_histograms().export().splitlines()[2])
+
+    overhead = (float(np.median(disabled)) - base) / base
+    # the medians are noisy, the estimate from the cost of the spans
+    # decides when they disagree
+    if min(overhead, estimate) > args.budget:
+        print(f"FAIL: disabled overhead over {args.budget:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
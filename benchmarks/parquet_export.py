@@ -0,0 +1,101 @@
+"""Round trip check of the Parquet export: payloads are scored by the worker
+pool of `process_batch` with an export directory, the datasets are read back
+and compared to the analyses of the payloads, and the `_common_metadata` of
+every dataset must be the schema unified over all its files.
+
+Skipped (exit 0) if pyarrow is not installed, fails (exit 1) on any
+mismatch.
+
+Usage, from the root of the repository:
+    python -m benchmarks.parquet_export --copies 6 --workers 2
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from zbta.api.api import APIConnector
+from zbta.api.batch import process_batch
+from zbta.api.export import __EXPORT_TABLES__, __PARTITION_COLUMN__
+
+__SAMPLE__ = os.path.join(
+    os.path.dirname(__file__), "..", "zbta", "data", "fiserv",
+    "415060515_AllData_single_file_nopii.json")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sample", default=__SAMPLE__)
+    parser.add_argument("--copies", type=int, default=6,
+                        help="number of payloads, with distinct ids")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-rows", type=int, default=1000,
+                        help="small, so that the workers flush many files")
+    args = parser.parse_args(argv)
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("SKIP: pyarrow is not installed")
+        return 0
+
+    with open(args.sample, "rb") as hh:
+        sample = json.load(hh)
+    connector = APIConnector(sample)
+    connector.process_payload()
+    expected = {
+        "transactions": len(connector.btanalyzer.dfs) * args.copies,
+        "daily_balances": len(connector.btanalyzer.dfs_daily) * args.copies,
+        "attributes": args.copies}
+    attributes = connector.engine.attributes
+
+    payloads = []
+    for icopy in range(args.copies):
+        sample["request"]["meta"]["application_details"][
+            "transaction_id"] = f"export-{icopy}"
+        payloads.append(json.dumps(sample))
+
+    failures = []
+    with tempfile.TemporaryDirectory() as root:
+        results = list(process_batch(
+            payloads, workers=args.workers, export_dir=root,
+            export_batch_rows=args.batch_rows))
+        if not all(el.ok for el in results):
+            failures.append("some payloads failed")
+        for table in __EXPORT_TABLES__:
+            directory = os.path.join(root, table)
+            files = [os.path.join(path, name)
+                     for path, _, names in os.walk(directory)
+                     for name in names if name.endswith(".parquet")]
+            dataset = ds.dataset(directory, format="parquet",
+                                 partitioning="hive").to_table()
+            print(f"{table}: {dataset.num_rows} rows in {len(files)} files")
+            if dataset.num_rows != expected[table]:
+                failures.append(f"{table}: {dataset.num_rows} rows, "
+                                f"expected {expected[table]}")
+            ids = set(dataset.column("report_id").to_pylist())
+            if ids != {f"export-{el}" for el in range(args.copies)}:
+                failures.append(f"{table}: unexpected report ids {ids}")
+            if __PARTITION_COLUMN__ not in dataset.column_names:
+                failures.append(f"{table}: no partition column")
+            unified = pa.unify_schemas([pq.read_schema(el) for el in files])
+            common = pq.read_schema(
+                os.path.join(directory, "_common_metadata"))
+            if not common.equals(unified):
+                failures.append(f"{table}: _common_metadata is not the "
+                                "unified schema of the files")
+            if table == "attributes":
+                for row in dataset.to_pylist():
+                    for name, value in attributes.items():
+                        if abs(row[name] - value) > 1e-6:
+                            failures.append(
+                                f"{row['report_id']}: {name} {row[name]} "
+                                f"!= {value}")
+    for el in failures:
+        print(f"FAIL: {el}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
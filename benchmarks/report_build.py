@@ -0,0 +1,210 @@
+"""Memory and time of the `ReportFiserv` build path (extraction of the
+accounts, merged transactions, daily balances): the single sort per account
+and the k-way merge are compared with the original copy and re-sort
+pipeline on reports generated from the sample payload. The outputs must be
+identical.
+
+Usage, from the root of the repository:
+    python -m benchmarks.report_build --nb-accounts 6 --scale 4
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import warnings
+import numpy as np
+import pandas as pd
+from zbta.parsers.fiserv import AccountFiserv, ReportFiserv
+
+__SAMPLE__ = os.path.join(
+    os.path.dirname(__file__), "..", "zbta", "data", "fiserv",
+    "415060515_AllData_single_file_nopii.json")
+
+
+class LegacyAccountFiserv(AccountFiserv):
+    """The original extraction (filter, sort, cumsum), kept as the
+    reference."""
+
+    def _extract_transactions(self) -> None:
+        self._get_trans()
+        self._compute_oldest_newest_dates()
+        self._nb_transactions = self._transactions.shape[0]
+        if self._nb_transactions == 0:
+            self._transactions = pd.DataFrame(columns=[
+                'date', 'amount', 'status', 'description', 'balance'])
+            return
+        self._transactions['status'] = (
+            self._transactions['status'].str.lower().apply(
+                lambda x: 'pending' if "pending" in x else 'posted'))
+        self._transactions = self._transactions.loc[
+            self._transactions.status != "pending"]
+        self._nb_transactions = self._transactions.shape[0]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)
+            self._transactions.loc[:, "date"] = pd.to_datetime(
+                self._transactions["date"], format="%Y-%m-%d")
+        self._transactions = self._transactions.sort_values(
+            by=["date", "id"], ascending=[True, True])
+        self._transactions.loc[:, "amount"] = \
+            self._transactions.loc[:, "amount"]
+        self._transactions.loc[:, "amount_collected"] = 0
+        self._transactions.loc[:, "amount_collected"] = (
+            self._transactions["amount"].cumsum())
+        starting_amount = self._current_balance - self._transactions[
+            "amount"].sum()
+        self._transactions.loc[:, "balance"] = (
+            self._transactions["amount_collected"] + starting_amount)
+
+    def _standardize_transactions(self) -> None:
+        self._transactions.date = pd.to_datetime(self._transactions.date)
+        self._transactions.loc[
+            :, ['amount', 'balance']] = self._transactions.loc[
+            :, ['amount', 'balance']].astype(float)
+        super()._standardize_transactions()
+
+
+class LegacyReportFiserv(ReportFiserv):
+    """The original merge (tag every account table, concat, sort, reset,
+    rename) and end of day re-sorts, kept as the reference."""
+
+    def _merge_accts(self) -> None:
+        for account in self._accts:
+            account.transactions.loc[:, "account_number"] = \
+                account.account_number
+        self._min_date = min(
+            x.oldest_balance_date for x in self._accts
+            if x.oldest_balance_date is not None)
+        self._max_date = max(
+            x.most_recent_balance_date for x in self._accts
+            if x.most_recent_balance_date is not None)
+        self._dfs = pd.concat([x.transactions for x in self._accts])
+        self._dfs = self._dfs.sort_values(
+            by=["date", "account_number"]).reset_index(drop=True).rename(
+                columns={"balance": "balance_acct"})
+        self._compact_dtypes()
+        if not self._lazy:
+            self._merge_daily()
+
+    def _get_end_of_day(self, account):
+        df = account.transactions
+        ndays = int((account.most_recent_balance_date
+                     - account.oldest_balance_date).days)+1
+        calendar = account.oldest_balance_date + pd.to_timedelta(
+            np.arange(ndays), unit="D")
+        if df.shape[0] == 0:
+            return pd.DataFrame(
+                {"date": calendar, "balance": [account.current_balance]*ndays})
+        df_endofday = df.loc[
+            :, ["date", "balance"]].groupby(by="date").last().reset_index(
+        ).sort_values(by="date")
+        df = df.sort_values(by="date", ascending=True)
+        day_bal = df["balance"].iloc[0] - df["amount"].iloc[0]
+        day = pd.Timedelta(days=1).value
+        offsets = df_endofday["date"].values.astype(
+            "datetime64[ns]").view(np.int64) - calendar[0].value
+        on_calendar = (offsets >= 0) & (offsets % day == 0) & \
+            (offsets < ndays * day)
+        nmatched = len(offsets) if on_calendar.all() else int(
+            np.argmin(on_calendar))
+        matched = offsets[:nmatched] // day
+        is_filler = np.ones(ndays, dtype=bool)
+        is_filler[matched] = False
+        if not is_filler.any():
+            fillers = pd.DataFrame({"date": [], "balance": []})
+        else:
+            balances = np.concatenate([
+                [day_bal], df_endofday["balance"].values[:nmatched]])
+            fillers = pd.DataFrame({
+                "date": calendar[is_filler],
+                "balance": balances[np.searchsorted(
+                    matched, np.flatnonzero(is_filler), side="right")]
+            })
+        return pd.concat(
+            [df_endofday, fillers], ignore_index=True).sort_values(by="date")
+
+
+def generate_report(sample: dict, nb_accounts: int, scale: int,
+                    seed: int) -> dict:
+    """Copies of the accounts of the sample, every record repeated `scale`
+    times with a new id, in a random order."""
+    rng = random.Random(seed)
+    accounts = [el for el in sample["bt_data"]["data"] if "banktrans" in el]
+    data = []
+    next_id = 1
+    for i in range(nb_accounts):
+        account = copy.deepcopy(accounts[i % len(accounts)])
+        trans = account["banktrans"]["result"]["DepAcctTrnInqRs"][
+            "DepAcctTrns"]
+        records = []
+        for record in trans["BankAcctTrnRec"] * scale:
+            record = dict(record, TrnID=next_id)
+            next_id += 1
+            records.append(record)
+        rng.shuffle(records)
+        trans["BankAcctTrnRec"] = records
+        data.append(account)
+    return dict(sample, bt_data=dict(sample["bt_data"], data=data))
+
+
+def measure(build, payload, repeat: int):
+    """Returns the report, the best wall time and the peak traced memory.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        report = build(payload)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    report = build(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return report, best, peak
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nb-accounts", type=int, default=6)
+    parser.add_argument("--scale", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    with open(__SAMPLE__, "r", encoding="utf8") as hh:
+        sample = json.load(hh)["request"]
+    payload = generate_report(
+        sample, args.nb_accounts, args.scale, args.seed)
+
+    results = {}
+    for name, build in [
+            ("legacy", lambda p: LegacyReportFiserv(p, LegacyAccountFiserv)),
+            ("current", lambda p: ReportFiserv(p, AccountFiserv))]:
+        results[name] = measure(build, payload, args.repeat)
+
+    legacy, current = results["legacy"][0], results["current"][0]
+    nb_diffs = 0
+    checks = [("dfs", legacy.dfs, current.dfs),
+              ("dfs_daily", legacy.dfs_daily, current.dfs_daily)]
+    checks += [
+        (f"account {i}", x.transactions.drop(columns="account_number"),
+         y.transactions)
+        for i, (x, y) in enumerate(zip(legacy.accounts, current.accounts))]
+    for name, expected, actual in checks:
+        try:
+            pd.testing.assert_frame_equal(expected, actual, check_exact=True)
+        except AssertionError as err:
+            nb_diffs += 1
+            print(f"{name}: {err}", file=sys.stderr)
+
+    print(f"{len(current.dfs)} transactions in {current.nb_accounts} "
+          f"accounts, {nb_diffs} different")
+    for name, (_, elapsed, peak) in results.items():
+        print(f"{name:>8}: {elapsed * 1000:8.1f}ms, "
+              f"peak {peak / 2 ** 20:8.2f}MB")
+    return 0 if nb_diffs == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
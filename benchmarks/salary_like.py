@@ -0,0 +1,133 @@
+"""Regression harness of `SalaryLikeTagger.tag_income_transactions`: the
+grouped matching is checked against the original pairwise loop on
+generated payroll histories, and both are timed.
+
+Usage, from the root of the repository:
+    python -m benchmarks.salary_like --nb-histories 100 --max-transactions 800
+"""
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+from zbta.btanalyzer.salary_like_tagger import SalaryLikeTagger
+
+__WORDS__ = [
+    "acme", "corp", "payroll", "direct", "dep", "gusto", "pay", "ssa",
+    "treas", "benefit", "zelle", "from", "john", "deposit", "mobile",
+    "venmo", "cashout", "uber", "earnings", "ach", "credit", "inc"]
+
+
+class LegacySalaryLikeTagger(SalaryLikeTagger):
+    """The original pairwise loop, kept as the reference."""
+
+    def _find_salary_like(self, transactions, nminfreq, diffmonths):
+        ntrans = transactions.shape[0]
+        tagged = []
+        for idx in range(ntrans-1):
+            splitdesc = transactions["description_split"].iloc[idx]
+            list_repeated = [idx]
+            for idx_second in range(idx+1, ntrans):
+                splitdesc_two = transactions["description_split"].iloc[
+                    idx_second]
+                stringbase = transactions["clean_description_salarylike"].iloc[
+                    idx_second]
+                if len(stringbase) == 0:
+                    continue
+
+                ncases = np.isin(splitdesc.split(),
+                                 splitdesc_two.split()).sum()
+                nlensplit = len(splitdesc.split())
+                nlensplit2 = len(splitdesc_two.split())
+                if nlensplit <= 3 and ncases == nlensplit and nlensplit2 > 0 and ncases > 0:
+                    list_repeated.append(idx_second)
+                elif nlensplit == 4 and ncases >= 3:
+                    list_repeated.append(idx_second)
+                elif ncases >= 4:
+                    list_repeated.append(idx_second)
+
+            if len(list_repeated) < nminfreq:
+                continue
+
+            if diffmonths > 1:
+                Nmonths = len(transactions.iloc[list_repeated].loc[
+                    :, "date"].dt.month.unique())
+                if Nmonths < diffmonths:
+                    continue
+
+            tagged.extend(transactions.iloc[list_repeated].index)
+        return pd.Index(sorted(set(tagged)), dtype=transactions.index.dtype)
+
+
+def generate_transactions(
+    rng: np.random.Generator,
+    max_transactions: int
+) -> pd.DataFrame:
+    """Random transactions with a few recurring deposits, noisy repeats
+    (extra, missing or shuffled words) and empty descriptions."""
+    ndays = int(rng.integers(30, 400))
+    ntrans = int(rng.integers(1, max_transactions))
+    sources = [" ".join(rng.choice(__WORDS__, int(rng.integers(0, 8))))
+               for _ in range(int(rng.integers(1, 12)))]
+    descriptions = []
+    for _ in range(ntrans):
+        words = rng.choice(sources).split()
+        if words and rng.random() < 0.3:
+            words.pop(int(rng.integers(0, len(words))))
+        if rng.random() < 0.2:
+            words.insert(int(rng.integers(0, len(words) + 1)),
+                         str(rng.choice(__WORDS__)))
+        if rng.random() < 0.1:
+            rng.shuffle(words)
+        descriptions.append(" ".join(words))
+    dates = pd.Timestamp("2021-01-01") + pd.to_timedelta(
+        np.sort(rng.integers(0, ndays, ntrans)), unit="D")
+    amounts = np.round(rng.choice([-1, 1, 1], ntrans) * rng.choice(
+        [50., 150., 1523.11, rng.uniform(0, 3000)], ntrans), 2)
+    return pd.DataFrame({
+        "date": dates,
+        "amount": amounts,
+        "clean_description": descriptions,
+        "is_internal": rng.random(ntrans) < 0.05,
+        "is_investment": rng.random(ntrans) < 0.02,
+        "is_taxes": rng.random(ntrans) < 0.02,
+    })
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nb-histories", type=int, default=100)
+    parser.add_argument("--max-transactions", type=int, default=800)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+
+    nb_diffs = 0
+    nb_tagged = 0
+    elapsed = {"legacy": 0., "current": 0.}
+    for i in range(args.nb_histories):
+        dfs = generate_transactions(rng, args.max_transactions)
+        results = {}
+        for name, tagger in [("legacy", LegacySalaryLikeTagger),
+                             ("current", SalaryLikeTagger)]:
+            tagger = tagger(dfs.copy(), dfs["date"].max())
+            start = time.perf_counter()
+            tagger.tag_income_transactions()
+            elapsed[name] += time.perf_counter() - start
+            results[name] = tagger.dfs["is_salary_like"]
+        try:
+            pd.testing.assert_series_equal(
+                results["legacy"], results["current"])
+        except AssertionError as err:
+            nb_diffs += 1
+            print(f"history {i}: {err}", file=sys.stderr)
+        nb_tagged += int(results["current"].sum())
+    print(f"{args.nb_histories} histories ({nb_tagged} salary like "
+          f"transactions), {nb_diffs} different, "
+          f"legacy {elapsed['legacy']:.2f}s, "
+          f"current {elapsed['current']:.2f}s")
+    return 0 if nb_diffs == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Soak test of a long-lived worker: scores the same payloads over and over
+in a single process and reports the resident memory and the latency
+percentiles, to check that the steady state neither leaks nor churns.
+
+Usage, from the root of the repository:
+    python -m benchmarks.soak --nb-requests 10000
+    python -m benchmarks.soak --nb-requests 10000 --gc-tuning
+    python -m benchmarks.soak --nb-requests 10000 --no-pool
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+from typing import List
+import numpy as np
+from zbta.api.api import APIConnector
+from zbta.core.buffers import (
+    BufferPool, deferred_gc, get_buffer_pool, set_buffer_pool, tune_gc)
+import logging
+
+__SAMPLE__ = os.path.join(
+    os.path.dirname(__file__), "..", "zbta", "data", "fiserv",
+    "415060515_AllData_single_file_nopii.json")
+
+
+def rss_mb() -> float:
+    """Returns the current resident memory, the peak if unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as hh:
+            return int(hh.read().split()[1]) * os.sysconf(
+                "SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def percentiles(latencies: List[float]) -> str:
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return f"p50 {p50:7.1f}ms  p99 {p99:7.1f}ms  max " \
+        f"{max(latencies) * 1000:7.1f}ms"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("payloads", nargs="*", default=[__SAMPLE__],
+                        help="json files, scored in turn")
+    parser.add_argument("--nb-requests", type=int, default=10000)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--report-every", type=int, default=1000)
+    parser.add_argument("--gc-tuning", action="store_true",
+                        help="freeze the warm heap and defer the collections")
+    parser.add_argument("--no-pool", action="store_true",
+                        help="disable the reuse of the scratch buffers")
+    args = parser.parse_args(argv)
+    logging.getLogger("zbta.api.api").setLevel(logging.ERROR)
+    payloads = []
+    for path in args.payloads:
+        with open(path, "rb") as hh:
+            payloads.append(hh.read())
+    if args.no_pool:
+        set_buffer_pool(BufferPool(max_bytes=0))
+
+    def score(i: int) -> None:
+        response = APIConnector(payloads[i % len(payloads)]).process_payload()
+        if "error_code" in response:
+            raise RuntimeError(response["error_message"])
+
+    for i in range(args.warmup):
+        score(i)
+    if args.gc_tuning:
+        tune_gc(freeze=True)
+    start_rss = rss_mb()
+    print(f"after {args.warmup} warm-up requests: rss {start_rss:.1f}MB")
+
+    latencies, window = [], []
+    start = time.perf_counter()
+    for i in range(args.nb_requests):
+        tic = time.perf_counter()
+        if args.gc_tuning:
+            with deferred_gc():
+                score(i)
+        else:
+            score(i)
+        window.append(time.perf_counter() - tic)
+        if len(window) == args.report_every or i == args.nb_requests - 1:
+            print(f"{i + 1:6d} requests: rss {rss_mb():7.1f}MB  "
+                  f"{percentiles(window)}")
+            latencies += window
+            window = []
+    elapsed = time.perf_counter() - start
+
+    pool = get_buffer_pool()
+    print(f"{args.nb_requests} requests in {elapsed:.1f}s "
+          f"({args.nb_requests / elapsed:.1f}/s): {percentiles(latencies)}")
+    print(f"rss {start_rss:.1f}MB -> {rss_mb():.1f}MB, buffer pool "
+          f"{pool.nb_hits} hits / {pool.nb_misses} misses, "
+          f"{pool.nb_bytes / 2 ** 10:.0f}KB kept, {pool.nb_lent} lent")
+    return 0 if pool.nb_lent == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -30,8 +30,14 @@ setup(name="zbta",
       author='zinclusive',
       author_email='florian@dataatc.com',
       install_requires=install_requires,
+      extras_require={
+          "fast-json": ["orjson"],
+          "parquet": ["pyarrow>=8"],
+      },
       packages=find_packages(),
       package_data={
           #'gdsbbta.models': ["short_term_subprime/v1.0.0/*"]
+          # python -m zbta.btanalyzer.keyword_matcher, before building
+          "zbta.btanalyzer": ["compiled/*.marshal"],
       }
       )
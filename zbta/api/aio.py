@@ -0,0 +1,242 @@
+"""asyncio front end of the API: `await score(payload)` never blocks the
+event loop.
+
+The payloads up to `inline_bytes` are decoded and validated on the loop,
+the invalid ones are answered without touching the executor. The parsing,
+the analysis and the attributes (`APIConnector.process_payload`) run in a
+thread or process pool, as do the decoding and the validation of the
+larger payloads.
+
+Example:
+    async with AsyncScorer(executor="process", max_workers=4,
+                           timeout=5.) as scorer:
+        response = await scorer.score(payload)
+"""
+import asyncio
+import os
+from concurrent.futures import (
+    Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor)
+from typing import Dict, Optional, Union
+from zbta.api import batch
+from zbta.api.api import APIConnector, open_cache
+import logging
+from zbta.core.logs import get_logger
+
+logger = get_logger(__name__, logging.INFO)
+
+__EXECUTOR_KINDS__ = ["thread", "process"]
+# the payloads decoded and validated on the event loop, in bytes
+__DEFAULT_INLINE_BYTES__ = 64 << 10
+
+
+class AsyncScorer:
+    """Scores payloads from coroutines, see the module documentation.
+
+    At most `max_in_flight` payloads are submitted to the executor, the
+    other calls of `score` wait for a slot. A payload that times out or is
+    cancelled keeps its slot until its worker is actually done with it (a
+    running payload cannot be interrupted), so that the executor is never
+    oversubscribed; a payload that did not start is withdrawn.
+    """
+
+    def __init__(
+        self,
+        executor: Union[str, Executor] = "thread",
+        max_workers: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        timeout: Optional[float] = None,
+        inline_bytes: int = __DEFAULT_INLINE_BYTES__,
+        cache_dir: Optional[str] = None,
+        gc_tuning: bool = False
+    ) -> None:
+        """
+        Parameters
+        ----------
+        executor : Union[str, Executor], optional
+            "thread", "process" or an executor, which the scorer does not
+            shut down, by default "thread"
+        max_workers : int, optional
+            the number of workers of the executor created, by default the
+            number of cpus
+        max_in_flight : int, optional
+            the maximum number of payloads in the executor, by default
+            2 x max_workers
+        timeout : float, optional
+            the default timeout of a payload in seconds, waiting for a slot
+            included, by default None (no timeout)
+        inline_bytes : int, optional
+            the size up to which the payloads are decoded and validated on
+            the event loop, by default 64KB
+        cache_dir : str, optional
+            the directory of the cache of the analyses, see `open_cache`, by
+            default None
+        gc_tuning : bool, optional
+            tune the garbage collector of the workers, process executors
+            only (the collector is global to a process), by default False
+
+        Raises
+        ------
+        ValueError
+            if the kind of executor is not recognized or the gc tuning is
+            requested with threads.
+        """
+        max_workers = max_workers or os.cpu_count() or 1
+        if isinstance(executor, Executor):
+            self._executor = executor
+            self._owned = False
+            self._processes = isinstance(executor, ProcessPoolExecutor)
+        elif executor not in __EXECUTOR_KINDS__:
+            msg = f"Unknown executor `{executor}`, valid are " \
+                f"{__EXECUTOR_KINDS__}"
+            logger.error(msg)
+            raise ValueError(msg)
+        else:
+            self._owned = True
+            self._processes = executor == "process"
+            if self._processes:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    initializer=batch._init_worker,
+                    initargs=(cache_dir, gc_tuning))
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix="zbta")
+        if gc_tuning and not self._processes:
+            raise ValueError("The gc tuning needs a process executor")
+        # the cache of the inline validation and of the threads
+        self._cache = open_cache(cache_dir) \
+            if cache_dir is not None and not self._processes else None
+        self._max_in_flight = max_in_flight or 2 * max_workers
+        self._timeout = timeout
+        self._inline_bytes = inline_bytes
+        self._nb_in_flight = 0
+        self._semaphore = None  # bound to the loop of the first call
+        self._loop = None
+        self._position = 0
+        self._closed = False
+
+    @property
+    def max_in_flight(self) -> int:
+        return self._max_in_flight
+
+    @property
+    def nb_in_flight(self) -> int:
+        """Returns the number of payloads held by the executor, the ones
+        abandoned on a timeout included."""
+        return self._nb_in_flight
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._nb_in_flight:
+                raise RuntimeError(
+                    "The scorer is in use by another event loop")
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self._max_in_flight)
+        return self._semaphore
+
+    def _release(self, _: Future) -> None:
+        """Run by the executor when it is done with a payload, whatever the
+        outcome."""
+        def release() -> None:
+            self._nb_in_flight -= 1
+            semaphore.release()
+
+        semaphore = self._semaphore
+        try:
+            self._loop.call_soon_threadsafe(release)
+        except RuntimeError:  # the loop is closed
+            pass
+
+    def _submit(self, payload: Union[str, bytes, Dict]) -> Future:
+        position = self._position
+        self._position += 1
+        size = len(payload) if isinstance(payload, (str, bytes)) else 0
+        connector = None
+        if size <= self._inline_bytes:
+            connector = APIConnector(payload, cache=self._cache)
+            if connector.response is not None:  # rejected on the loop
+                future = Future()
+                future.set_result(batch.BatchResult(
+                    position=position,
+                    transaction_id=connector.transaction_id,
+                    response=connector.response, elapsed=0., ok=False))
+                return future
+            if self._processes:  # not sent, the worker decodes again
+                connector = None
+        return self._executor.submit(
+            batch.score_payload, position, payload, connector, self._cache)
+
+    async def score(
+        self,
+        payload: Union[str, bytes, Dict],
+        timeout: Optional[float] = ...
+    ) -> Dict:
+        """Scores a payload.
+
+        Parameters
+        ----------
+        payload : Union[str, bytes, Dict]
+            the json payload, or the decoded payload
+        timeout : float, optional
+            the timeout in seconds, by default the one of the scorer
+
+        Returns
+        -------
+        Dict
+            the response, see `APIConnector.process_payload`. The failures
+            of the payload are error responses.
+
+        Raises
+        ------
+        asyncio.TimeoutError
+            if the payload is not scored in time.
+        """
+        if self._closed:
+            raise RuntimeError("The scorer is closed")
+        timeout = self._timeout if timeout is ... else timeout
+        return await asyncio.wait_for(self._score(payload), timeout)
+
+    async def _score(self, payload: Union[str, bytes, Dict]) -> Dict:
+        semaphore = self._get_semaphore()
+        await semaphore.acquire()
+        try:
+            future = self._submit(payload)
+        except BaseException:
+            semaphore.release()
+            raise
+        self._nb_in_flight += 1
+        # the slot is given back when the executor is done, not when the
+        # caller gives up, see `_release`
+        future.add_done_callback(self._release)
+        result = await asyncio.wrap_future(future)
+        return result.response
+
+    async def close(self) -> None:
+        """Waits for the payloads in flight and shuts the executor down, if
+        created by the scorer."""
+        self._closed = True
+        if self._owned:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._executor.shutdown, True)
+
+    async def __aenter__(self) -> "AsyncScorer":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+
+__DEFAULT_SCORER__ = None
+
+
+async def score(
+    payload: Union[str, bytes, Dict],
+    timeout: Optional[float] = None
+) -> Dict:
+    """Scores a payload with a default `AsyncScorer` (threads), created on
+    first use. See `AsyncScorer.score`."""
+    global __DEFAULT_SCORER__
+    if __DEFAULT_SCORER__ is None:
+        __DEFAULT_SCORER__ = AsyncScorer()
+    return await __DEFAULT_SCORER__.score(payload, timeout=timeout)
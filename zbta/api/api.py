@@ -1,38 +1,121 @@
-import json
-import time
-from zbta.attributes.attributes import ZBTAGeneral
-import jsonschema
 from zbta.core.status import Statuses
-from typing import Dict
-from zbta.core.schemas import __API_SCHEMA__
-from zbta.core.common import validate_schema, APIError
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Union
+from zbta import __version__
+from zbta.core.schemas import __ACCOUNT_SCHEMA__, __API_SCHEMA__
+from zbta.core.common import validate_schema, APIError, compile_schema, hash_version
+from zbta.core.decoder import decode_json
+from zbta.core.tracing import get_histograms, is_instrumentation_enabled, span, tracing
 from zbta.parsers.parser import Parser
-from zbta.btanalyzer.btanalyzer import BTAnalyzer
+from zbta.parsers.registry import __DEFAULT_PROVIDER__, available_providers, get_provider
 from zbta.btanalyzer.assets.categories_general_contained import __DICT_CATEGORIES_GENERAL_CONTAINED__
 from zbta.btanalyzer.assets.categories_general_match import __DICT_CATEGORIES_GENERAL_MATCH__
+from zbta.btanalyzer.assets.categories_salary_like_fp import __DICT_EXCLUSIONS_SALARY_LIKE_FP__
+from zbta.btanalyzer.assets.categories_priorities import __DICT_CATEGORIES_PRIORITIES__
+from zbta.btanalyzer.assets.us_states import __DICT_STATES_US__
 import logging
+from zbta.core.logs import get_logger
 
+# pandas, numpy and jsonschema are imported by the first request (or by
+# `preload`), importing the API stays cheap for the short-lived processes
+if TYPE_CHECKING:
+    import pandas as pd
+    from zbta.attributes.attributes import ZBTAGeneral
+    from zbta.btanalyzer.btanalyzer import BTAnalyzer
+    from zbta.core.cache import AnalysisCache, AnalyzerSnapshot
 
-logger = logging.getLogger(__name__)
-fh = logging.StreamHandler()
-fh_formatter = logging.Formatter(
-    "[%(levelname)s] [%(asctime)s] [%(funcName)s] %(message)s")
-fh.setFormatter(fh_formatter)
-logger.addHandler(fh)
-logger.setLevel(logging.DEBUG)
+
+logger = get_logger(__name__, logging.ERROR)
+
+# the parameters of the BTAnalyzer of the API (the lists are copied for
+# every request, the analyzer extends them)
+__ANALYZER_PARAMETERS__ = {
+    "limit_kw_id_match": [
+        "is_salary",
+        "is_benefit",
+        "is_fee",
+        "is_cash",
+    ],
+    "limit_kw_id_contained": [
+        "is_obligation",
+        "is_benefit",
+        "is_salary",
+        "is_fee",
+        "is_cash",
+        "is_payday",
+        "is_consumer_loan"
+    ],
+    "do_nweek_nmonth_id": True,
+    "do_weekend_id": True,
+    "do_enforce_priorities": False,
+    "do_salary_like": True,
+    "do_internal_transfers": True,
+}
+# the version of the analysis, any change of the dictionaries or the
+# parameters invalidates the cached analyses
+__ANALYSIS_VERSION__ = hash_version(
+    __version__,
+    __ANALYZER_PARAMETERS__,
+    __DICT_CATEGORIES_GENERAL_MATCH__,
+    __DICT_CATEGORIES_GENERAL_CONTAINED__,
+    __DICT_EXCLUSIONS_SALARY_LIKE_FP__,
+    __DICT_CATEGORIES_PRIORITIES__,
+    __DICT_STATES_US__,
+)
+
+
+def preload() -> None:
+    """Imports and compiles everything the requests need, once: the
+    pipeline, the parsers of the providers, the keyword matchers of the
+    dictionaries (see `compile_assets`) and the schemas. Otherwise the
+    first request pays for it, which suits the short-lived processes; the
+    long-lived workers call it at boot.
+    """
+    from zbta.attributes.attributes import ZBTAGeneral  # noqa: F401
+    from zbta.core.cache import AnalysisCache  # noqa: F401
+    from zbta.btanalyzer.keyword_matcher import (
+        get_contained_matcher, get_exact_matcher)
+    get_exact_matcher(__DICT_CATEGORIES_GENERAL_MATCH__)
+    get_contained_matcher(__DICT_CATEGORIES_GENERAL_CONTAINED__)
+    compile_schema(__API_SCHEMA__)
+    compile_schema(__ACCOUNT_SCHEMA__)
+    for name in available_providers():
+        provider = get_provider(name)
+        provider.report_class
+        if provider.schema is not None:
+            compile_schema(provider.schema)
+
+
+def open_cache(directory: str, max_bytes: int = 1 << 30) -> "AnalysisCache":
+    """Opens the cache of the analyses of the API, see `AnalysisCache`.
+
+    Parameters
+    ----------
+    directory : str
+        the directory of the cache
+    max_bytes : int, optional
+        the maximum size of the cache, by default 1GB
+
+    Returns
+    -------
+    AnalysisCache
+        the cache of the current version of the analysis
+    """
+    from zbta.core.cache import AnalysisCache
+    return AnalysisCache(directory, __ANALYSIS_VERSION__, max_bytes=max_bytes)
 
 
 class Response:
 
     def __init__(self, payload, error_code=None, error_message=None) -> None:
         self._payload = payload
-        self._error_code = None
-        self._error_message = None
+        self._error_code = error_code
+        self._error_message = error_message
 
     def as_payload(self):
         res = {"response": self._payload}
         if self._error_code is not None:
-            res["error_code"] = self._error_code
+            res["error_code"] = getattr(
+                self._error_code, "value", self._error_code)
         if self._error_message is not None:
             res["error_message"] = self._error_message
         return res
@@ -45,8 +128,29 @@ class APIConnector:
     the calculation.
     """
 
-    def __init__(self, payload: Dict) -> None:
+    def __init__(
+        self,
+        payload: Union[str, bytes, Dict],
+        cache: Optional["AnalysisCache"] = None,
+        trace: bool = False
+    ) -> None:
+        """
+        Parameters
+        ----------
+        payload : Union[str, bytes, Dict]
+            the json request, or the already decoded request
+        cache : AnalysisCache, optional
+            the cache of the analyses, see `open_cache`. On a hit the
+            report is neither parsed nor analyzed and `parser` stays None,
+            by default None
+        trace : bool, optional
+            attach the spans of the stages to the response (as does a
+            `meta.trace` request), see `zbta.core.tracing`, by default
+            False
+        """
         self._payload = payload
+        self._cache = cache
+        self._trace = trace
         self._response = None
         self._parser = None
         self._btanalyzer = None
@@ -66,18 +170,18 @@ class APIConnector:
         return self._parser
 
     @property
-    def btanalyzer(self) -> BTAnalyzer:
+    def btanalyzer(self) -> Union["BTAnalyzer", "AnalyzerSnapshot"]:
         """Returns the Analyzer object
 
         Returns
         -------
-        BTAnalyzer
-            the analyzer object
+        Union[BTAnalyzer, AnalyzerSnapshot]
+            the analyzer object, or its snapshot if read from the cache
         """
         return self._btanalyzer
 
     @property
-    def engine(self) -> ZBTAGeneral:
+    def engine(self) -> "ZBTAGeneral":
         """Returns the Engine object
 
         Returns
@@ -87,78 +191,170 @@ class APIConnector:
         """
         return self._engine
 
+    @property
+    def response(self) -> Dict:
+        """Returns the response, None until the payload is processed.
+
+        Returns
+        -------
+        Dict
+            the response as a payload
+        """
+        return self._response
+
+    @property
+    def transaction_id(self) -> str:
+        """Returns the transaction id of the request if available.
+
+        Returns
+        -------
+        str
+            the `application_details.transaction_id` of the request
+        """
+        try:
+            return self._payload["request"]["meta"][
+                "application_details"]["transaction_id"]
+        except (KeyError, TypeError):
+            return None
+
     def _validate_payload(self) -> None:
         logger.debug("validating payload...")
         try:
-            self._payload = json.loads(self._payload)
+            self._payload = decode_json(self._payload)
         except Exception as err:
             response = f"Error reading the payload, invalid json: `{err}`"
             logger.error(response)
             self._response = Response(
                 {}, error_message=response, error_code=Statuses.HTTP_400_BAD_REQUEST).as_payload()
+            return
         is_valid, error_msg = validate_schema(
             self._payload, __API_SCHEMA__, "api_schema"
         )
+        if is_valid:
+            is_valid, error_msg = self._validate_bt_data()
         if not is_valid:
             logger.error(error_msg)
             self._response = Response(
                 {}, error_code=Statuses.HTTP_400_BAD_REQUEST, error_message=error_msg).as_payload()
 
-    def process_payload(self) -> Response:
+    def _validate_bt_data(self) -> Tuple[bool, Optional[str]]:
+        """Validates the `bt_data` against the schema of its provider.
+
+        Returns
+        -------
+        Tuple[bool, Optional[str]]
+            True if valid, else False and the error message.
+        """
+        request = self._payload["request"]
+        try:
+            provider = get_provider(
+                request["meta"].get("data_provider", __DEFAULT_PROVIDER__))
+        except APIError as err:
+            return False, str(err)
+        if provider.schema is None:
+            return True, None
+        return validate_schema(
+            request["bt_data"], provider.schema,
+            f"{provider.name}_schema", mode=provider.validation_mode)
+
+    def _analyze(self) -> None:
+        """Parses and analyzes the report."""
+        from zbta.btanalyzer.btanalyzer import BTAnalyzer
+        # 1. create the parser object
+        # lazy: the daily balances and the PII are only computed if an
+        # attribute needs them
+        self._parser = Parser(self._payload["request"], lazy=True)
+        # 2. parse
+        with span("parse"):
+            self._parser.parse()
+        # 3. BT Analyser
+        with span("analyze"):
+            self._btanalyzer = BTAnalyzer(
+                report=self._parser.report,
+                dict_kw_id_match=__DICT_CATEGORIES_GENERAL_MATCH__,
+                dict_kw_id_contained=__DICT_CATEGORIES_GENERAL_CONTAINED__,
+                lazy=True,
+                **{key: list(val) if isinstance(val, list) else val
+                   for key, val in __ANALYZER_PARAMETERS__.items()}
+            )
+
+    def _load_daily(self) -> "pd.DataFrame":
+        """Builds the daily balances of the report, for a cache hit that
+        does not have them."""
+        parser = Parser(self._payload["request"], lazy=True)
+        parser.parse()
+        return parser.report.dfs_daily
+
+    def analyze(self) -> "BTAnalyzer":
+        """Parses and analyzes the report again, without the cache and
+        without the attributes, e.g. to profile the attributes.
+
+        Returns
+        -------
+        BTAnalyzer
+            the analyzer, see `btanalyzer`
+
+        Raises
+        ------
+        APIError
+            if the payload is invalid.
+        """
+        if self._response is not None and "error_code" in self._response:
+            raise APIError(self._response["error_message"])
+        self._analyze()
+        return self._btanalyzer
+
+    def process_payload(self) -> Dict:
         """Processed the payload json received.
 
         Returns
         -------
-        Response: the response object
-            returns the response object.
+        Dict
+            the response object as a payload, with the attributes keyed
+            by method name or the error code and message.
         """
         logger.info("processing payload...")
         if self._response is not None:
             return self._response
-        # 1. create the parser object
-        init = time.time()
-        st = time.time()
-        self._parser = Parser(self._payload["request"])
-        # 2. parse
-        self._parser.parse()
-        logger.debug("time to parse the report %s", time.time() -st )
-        # 3. BT Analyser
-        st = time.time()
-        self._btanalyzer = BTAnalyzer(
-            report=self._parser.report,
-            dict_kw_id_match=__DICT_CATEGORIES_GENERAL_MATCH__,
-            dict_kw_id_contained=__DICT_CATEGORIES_GENERAL_CONTAINED__,
-            limit_kw_id_match=[
-                "is_salary",
-                "is_benefit",
-                "is_fee",
-                "is_cash",
-            ],
-            limit_kw_id_contained=[
-                "is_obligation",
-                "is_benefit",
-                "is_salary",
-                "is_fee",
-                "is_cash",
-                "is_payday",
-                "is_consumer_loan"
-            ],
-            do_nweek_nmonth_id=True,
-            do_weekend_id=True,
-            do_enforce_priorities=False, 
-            do_salary_like=True,
-            do_internal_transfers=True
-        )
-        logger.debug("time to analyzer transactions: %s", time.time() - st)
+        trace = self._trace or bool(
+            self._payload["request"]["meta"].get("trace", False))
+        if not trace and not is_instrumentation_enabled():
+            self._process()
+            return self._response
+        with tracing() as tracer:
+            self._process()
+        if is_instrumentation_enabled():
+            get_histograms().add(tracer)
+        if trace:
+            self._response["response"]["trace"] = tracer.as_payload()
+        return self._response
+
+    def _process(self) -> None:
+        key = None
+        if self._cache is not None:
+            key = self._cache.key(self._payload["request"])
+            with span("cache.get"):
+                self._btanalyzer = self._cache.get(
+                    key, load_daily=self._load_daily)
+            logger.debug("cache %s", "miss" if self._btanalyzer is None
+                         else "hit")
+        if self._btanalyzer is None:
+            self._analyze()
+            if key is not None:
+                with span("cache.put"):
+                    self._cache.put(key, self._btanalyzer)
         # 3. generate triggers
+        from zbta.attributes.attributes import ZBTAGeneral
         self._engine = ZBTAGeneral(
             btanalyzer=self._btanalyzer
         )
-        st = time.time()
-        self._engine.calculate_attributes()
-        logger.debug("time to calculate the attributes: %s", time.time() - st)
-        logger.debug("time total %s", time.time() - init)
+        with span("attributes"):
+            self._engine.calculate_attributes()
         # 4. generate attributes
+        self._response = Response({
+            "transaction_id": self.transaction_id,
+            "attributes": self._engine.attributes
+        }).as_payload()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,355 @@
+"""Batch scoring: fans `APIConnector.process_payload` out across a pool of
+worker processes and streams the responses back as they finish.
+
+Usage:
+    python -m zbta.api.batch payload_1.json payload_2.json --workers 4
+"""
+import argparse
+import json
+import multiprocessing.util
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Union
+from zbta.api.api import APIConnector, Response, open_cache, preload
+from zbta.core.cache import AnalysisCache
+from zbta.api.export import ParquetExporter, write_common_metadata
+from zbta.core.buffers import deferred_gc, tune_gc
+from zbta.core.common import APIError, NoTransactionError, NoValidAccountError
+from zbta.core.status import Statuses
+import logging
+from zbta.core.logs import get_logger
+
+logger = get_logger(__name__, logging.INFO)
+
+__CACHE__ = None  # the cache of the analyses of the worker, if any
+__GC_TUNING__ = False  # defer the collections of the worker to the payloads
+__EXPORTER__ = None  # the Parquet exporter of the worker, if any
+
+
+class BatchResult(NamedTuple):
+    """The outcome of one payload of a batch."""
+    position: int  # the position of the payload in the input
+    transaction_id: Optional[str]
+    response: Dict  # the response payload, see `Response.as_payload`
+    elapsed: float  # seconds spent in the worker
+    ok: bool
+
+
+class BatchStats:
+    """Keeps track of the throughput of a batch.
+    """
+
+    def __init__(self) -> None:
+        self._start = time.perf_counter()
+        self._end = None
+        self._nb_ok = 0
+        self._nb_failed = 0
+        self._busy = 0.  # total time spent in the workers
+
+    def add(self, result: BatchResult) -> None:
+        if result.ok:
+            self._nb_ok += 1
+        else:
+            self._nb_failed += 1
+        self._busy += result.elapsed
+        self._end = time.perf_counter()
+
+    @property
+    def nb_payloads(self) -> int:
+        return self._nb_ok + self._nb_failed
+
+    @property
+    def nb_ok(self) -> int:
+        return self._nb_ok
+
+    @property
+    def nb_failed(self) -> int:
+        return self._nb_failed
+
+    @property
+    def elapsed(self) -> float:
+        """Returns the wall time in seconds between the start of the batch
+        and the last result received."""
+        return (self._end or time.perf_counter()) - self._start
+
+    @property
+    def throughput(self) -> float:
+        """Returns the number of payloads processed per second."""
+        return self.nb_payloads / self.elapsed if self.elapsed > 0 else 0.
+
+    def summary(self) -> str:
+        return (
+            f"{self.nb_payloads} payloads ({self._nb_failed} failed) in "
+            f"{self.elapsed:.2f}s: {self.throughput:.2f} payloads/s, "
+            f"{self._busy / max(self.nb_payloads, 1):.3f}s per payload "
+            "in the workers"
+        )
+
+
+def _init_worker(
+    cache_dir: Optional[str] = None,
+    gc_tuning: bool = False,
+    export_dir: Optional[str] = None,
+    export_batch_rows: int = 500_000
+) -> None:
+    """Runs once in every worker process. Everything the pipeline needs
+    (pandas, jsonschema, the keyword dictionaries) is imported and compiled
+    here, see `preload`, so that the payloads do not pay for it. The
+    workers share the cache directory, if any. With the gc tuning, the
+    objects of the imports are frozen and the collections run once at the
+    end of every payload, see `deferred_gc`. With an export directory,
+    every worker buffers the reports it scores in its own
+    `ParquetExporter`, flushed when the worker exits; the
+    `_common_metadata` of the datasets is written by `process_batch` once
+    the workers are done.
+    """
+    global __CACHE__, __GC_TUNING__, __EXPORTER__
+    logging.getLogger("zbta.api.api").setLevel(logging.ERROR)
+    preload()
+    if cache_dir is not None:
+        __CACHE__ = open_cache(cache_dir)
+    __GC_TUNING__ = gc_tuning
+    if export_dir is not None:
+        __EXPORTER__ = ParquetExporter(
+            export_dir, batch_rows=export_batch_rows, write_metadata=False)
+        # run by the worker process on its way out
+        multiprocessing.util.Finalize(
+            __EXPORTER__, __EXPORTER__.close, exitpriority=10)
+    if gc_tuning:
+        tune_gc(freeze=True)
+
+
+def score_payload(
+    position: int,
+    payload: Union[str, bytes, Dict],
+    connector: Optional[APIConnector] = None,
+    cache: Optional[AnalysisCache] = None
+) -> BatchResult:
+    """Scores a single payload, never raises.
+
+    Parameters
+    ----------
+    position : int
+        the position of the payload in the batch
+    payload : Union[str, bytes, Dict]
+        the json payload, or the decoded payload
+    connector : APIConnector, optional
+        the connector of the payload, already validated, by default
+        created from `payload`
+    cache : AnalysisCache, optional
+        the cache of the analyses, by default the one of the worker
+
+    Returns
+    -------
+    BatchResult
+        the result, with an error response if the payload failed.
+    """
+    start = time.perf_counter()
+    try:
+        if connector is None:
+            connector = APIConnector(
+                payload, cache=cache if cache is not None else __CACHE__)
+        if __GC_TUNING__:
+            with deferred_gc():
+                response = connector.process_payload()
+        else:
+            response = connector.process_payload()
+        ok = "error_code" not in response
+        if ok and __EXPORTER__ is not None:
+            __EXPORTER__.add(connector)
+    except (APIError, NoValidAccountError, NoTransactionError) as err:
+        response = Response(
+            {}, error_code=Statuses.HTTP_400_BAD_REQUEST,
+            error_message=f"{type(err).__name__}: {err}").as_payload()
+        ok = False
+    except Exception as err:
+        logger.error("payload %s failed: %s", position, err)
+        response = Response(
+            {}, error_code=Statuses.HTTP_500_INTERNAL_SERVER_ERROR,
+            error_message=f"{type(err).__name__}: {err}").as_payload()
+        ok = False
+    return BatchResult(
+        position=position,
+        transaction_id=connector.transaction_id if connector else None,
+        response=response,
+        elapsed=time.perf_counter() - start,
+        ok=ok
+    )
+
+
+def process_batch(
+    payloads: Iterable[Union[str, bytes, Dict]],
+    workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    stats: Optional[BatchStats] = None,
+    ordered: bool = False,
+    cache_dir: Optional[str] = None,
+    gc_tuning: bool = False,
+    export_dir: Optional[str] = None,
+    export_batch_rows: int = 500_000
+) -> Iterator[BatchResult]:
+    """Scores many payloads across a process pool.
+
+    By default the results are yielded as soon as they are available, i.e.
+    not in the order of the input (see `BatchResult.position`). A payload
+    that fails yields an error response instead of stopping the batch.
+
+    Parameters
+    ----------
+    payloads : Iterable[Union[str, bytes, Dict]]
+        the json payloads, consumed lazily
+    workers : int, optional
+        the number of worker processes, by default the number of cpus
+    max_in_flight : int, optional
+        the maximum number of payloads submitted and not yet yielded, which
+        bounds the memory used by the batch, by default 2 x workers
+    stats : BatchStats, optional
+        updated with every result, by default None
+    ordered : bool, optional
+        yield the results in the order of the input. The results waiting
+        for an earlier payload count as in flight, by default False
+    cache_dir : str, optional
+        the directory of the cache of the analyses, see `open_cache`. The
+        payloads already analyzed are not parsed again, by default None
+    gc_tuning : bool, optional
+        tune the garbage collector of the workers, see `_init_worker`, by
+        default False
+    export_dir : str, optional
+        export the analyzed reports to the Parquet datasets of the
+        directory, see `ParquetExporter`. Their `_common_metadata` is
+        written once the workers are done, by default None
+    export_batch_rows : int, optional
+        the number of transactions buffered by a worker before a flush of
+        the export, by default 500k
+
+    Yields
+    ------
+    BatchResult
+        the result of every payload
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+    stats = stats if stats is not None else BatchStats()
+    payloads = iter(payloads)
+    try:
+        yield from _process_batch(
+            payloads, workers, max_in_flight, stats, ordered, cache_dir,
+            gc_tuning, export_dir, export_batch_rows)
+    finally:
+        # the workers have exited and flushed their exports
+        if export_dir is not None:
+            write_common_metadata(export_dir)
+    logger.info(stats.summary())
+
+
+def _process_batch(
+    payloads: Iterator[Union[str, bytes, Dict]],
+    workers: int,
+    max_in_flight: int,
+    stats: BatchStats,
+    ordered: bool,
+    cache_dir: Optional[str],
+    gc_tuning: bool,
+    export_dir: Optional[str],
+    export_batch_rows: int
+) -> Iterator[BatchResult]:
+    with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(cache_dir, gc_tuning, export_dir,
+                      export_batch_rows)) as executor:
+        in_flight = {}
+        pending = {}  # results waiting for an earlier position, if ordered
+        next_position = 0  # the next position to yield, if ordered
+        position = 0
+        exhausted = False
+        while True:
+            while not exhausted and \
+                    len(in_flight) + len(pending) < max_in_flight:
+                try:
+                    payload = next(payloads)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = executor.submit(score_payload, position, payload)
+                in_flight[future] = position
+                position += 1
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                pos = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as err:  # the worker itself died
+                    logger.error("payload %s failed: %s", pos, err)
+                    result = BatchResult(
+                        position=pos, transaction_id=None,
+                        response=Response(
+                            {},
+                            error_code=Statuses.HTTP_500_INTERNAL_SERVER_ERROR,
+                            error_message=f"{type(err).__name__}: {err}"
+                        ).as_payload(),
+                        elapsed=0., ok=False)
+                stats.add(result)
+                if not ordered:
+                    yield result
+                    continue
+                pending[pos] = result
+                while next_position in pending:
+                    yield pending.pop(next_position)
+                    next_position += 1
+
+
+def to_json(obj):
+    """`default` hook of `json.dumps` for the numpy scalars found in the
+    attributes."""
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} "
+                    "is not JSON serializable")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Scores many payloads across a process pool.")
+    parser.add_argument("payloads", nargs="+",
+                        help="json files, one payload per file")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument("--output", default="-",
+                        help="ndjson file receiving the responses")
+    parser.add_argument("--cache-dir", default=None,
+                        help="directory of the cache of the analyses")
+    parser.add_argument("--gc-tuning", action="store_true",
+                        help="tune the garbage collector of the workers")
+    args = parser.parse_args(argv)
+
+    def read_payloads():
+        for path in args.payloads:
+            with open(path, "rb") as hh:
+                yield hh.read()
+
+    stats = BatchStats()
+    out = sys.stdout if args.output == "-" else open(
+        args.output, "w", encoding="utf8")
+    try:
+        for result in process_batch(
+                read_payloads(), workers=args.workers, stats=stats,
+                cache_dir=args.cache_dir, gc_tuning=args.gc_tuning):
+            row = {"position": result.position,
+                   "file": args.payloads[result.position],
+                   "transaction_id": result.transaction_id,
+                   "elapsed": result.elapsed}
+            row.update(result.response)
+            out.write(json.dumps(row, default=to_json) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(stats.summary(), file=sys.stderr)
+    return 0 if stats.nb_failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Client of the scoring server (see `zbta.api.server`) and load test.
+
+Usage:
+    python -m zbta.api.client http://127.0.0.1:8080 payload.json \
+        --nb-requests 1000 --concurrency 8
+    python -m zbta.api.client unix:///tmp/zbta.sock payload.json
+"""
+import argparse
+import http.client
+import json
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence, Tuple, Union
+from urllib.parse import urlsplit
+import numpy as np
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path: str, timeout: float) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class ScoringClient:
+    """Sends payloads to a scoring server, one connection per request.
+    """
+
+    def __init__(
+        self,
+        url: str = "http://127.0.0.1:8080",
+        timeout: float = 60.
+    ) -> None:
+        """
+        Parameters
+        ----------
+        url : str, optional
+            "http://host:port" or "unix:///path/of/the/socket", by default
+            "http://127.0.0.1:8080"
+        timeout : float, optional
+            the timeout of a request in seconds, by default 60
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ["http", "unix"]:
+            raise ValueError(f"Unknown scheme `{parts.scheme}`")
+        self._url = url
+        self._parts = parts
+        self._timeout = timeout
+
+    @property
+    def url(self) -> str:
+        return self._url
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self._parts.scheme == "unix":
+            return _UnixHTTPConnection(self._parts.path, self._timeout)
+        return http.client.HTTPConnection(
+            self._parts.hostname, self._parts.port or 80,
+            timeout=self._timeout)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: bytes = None
+    ) -> Tuple[int, Dict]:
+        """Returns the HTTP status and the decoded body of a request."""
+        connection = self._connection()
+        try:
+            headers = {"Content-Type": "application/json"} if body else {}
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def score(self, payload: Union[str, bytes, Dict]) -> Tuple[int, Dict]:
+        """Scores a payload.
+
+        Returns
+        -------
+        Tuple[int, Dict]
+            the HTTP status and the response of the API
+        """
+        if isinstance(payload, dict):
+            payload = json.dumps(payload)
+        if isinstance(payload, str):
+            payload = payload.encode("utf8")
+        return self.request("POST", "/score", payload)
+
+    def stats(self) -> Dict:
+        """Returns the latencies recorded by the server."""
+        return self.request("GET", "/stats")[1]
+
+    def health(self) -> Dict:
+        return self.request("GET", "/health")[1]
+
+
+def run_load(
+    client: ScoringClient,
+    payloads: Sequence[bytes],
+    nb_requests: int,
+    concurrency: int
+) -> Dict[str, float]:
+    """Sends `nb_requests` payloads (in turn) from `concurrency` threads.
+
+    Returns
+    -------
+    Dict[str, float]
+        the throughput, the number of errors and the latency percentiles in
+        milliseconds, measured by the client
+    """
+    def send(i: int) -> Tuple[float, bool]:
+        start = time.perf_counter()
+        try:
+            status, _ = client.score(payloads[i % len(payloads)])
+        except (OSError, http.client.HTTPException, ValueError):
+            status = None
+        return time.perf_counter() - start, status == 200
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(nb_requests)))
+    elapsed = time.perf_counter() - start
+    latencies = np.array([el[0] for el in results]) * 1e3
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {
+        "nb_requests": nb_requests,
+        "nb_errors": sum(not el[1] for el in results),
+        "throughput": nb_requests / elapsed,
+        "p50_ms": p50,
+        "p90_ms": p90,
+        "p99_ms": p99,
+        "max_ms": latencies.max(),
+    }
+
+
+def _format(summary: Dict[str, float]) -> str:
+    return ", ".join(
+        f"{key} {value:.1f}" if isinstance(value, float) else f"{key} {value}"
+        for key, value in summary.items())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Load test of a scoring server.")
+    parser.add_argument("url", help="http://host:port or unix:///path")
+    parser.add_argument("payloads", nargs="+",
+                        help="json files, sent in turn")
+    parser.add_argument("--nb-requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=60.)
+    args = parser.parse_args(argv)
+    payloads: List[bytes] = []
+    for path in args.payloads:
+        with open(path, "rb") as hh:
+            payloads.append(hh.read())
+    client = ScoringClient(args.url, timeout=args.timeout)
+    print(f"server {client.health()}")
+    summary = run_load(client, payloads, args.nb_requests, args.concurrency)
+    print(f"client: {_format(summary)}")
+    print(f"server: {_format(client.stats())}")
+    return 0 if summary["nb_errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
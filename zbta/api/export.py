@@ -0,0 +1,345 @@
+"""Export of the analyzed reports to partitioned Parquet datasets, for the
+training of the models: the tagged transactions (`BTAnalyzer.dfs`), the
+daily balances (`BTAnalyzer.dfs_daily`) and the attributes, one row per
+report. The reports are buffered and written in large batches, every
+table being a dataset partitioned by the month of the report:
+
+    <root>/transactions/report_month=2021-02/<part>.parquet
+    <root>/daily_balances/report_month=2021-02/<part>.parquet
+    <root>/attributes/report_month=2021-02/<part>.parquet
+
+The rows of a report are keyed by `report_id` (the transaction id of the
+request). The `_common_metadata` file of every dataset holds the schema
+unified over all its files, see `write_common_metadata`. The Parquet writer
+is optional: pip install zbta[parquet].
+
+Usage:
+    python -m zbta.api.export backfill.ndjson exports/ --workers 4
+"""
+import argparse
+import importlib
+import os
+import sys
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+import logging
+from zbta.core.logs import get_logger
+
+logger = get_logger(__name__, logging.INFO)
+
+__EXPORT_TABLES__ = ["transactions", "daily_balances", "attributes"]
+__PARTITION_COLUMN__ = "report_month"
+# the integer columns of the tables, the other numeric columns are exported
+# as floats so that the schema does not depend on the missing values of a
+# batch
+__INTEGER_COLUMNS__ = [
+    "account_number", "out", "day_ordinal", "month", "week", "day",
+    "matched_internal"]
+# exported as strings whatever their type in the report
+__STRING_COLUMNS__ = ["id", "report_id"]
+
+
+def _import_pyarrow():
+    """Returns the pyarrow modules, raises an ImportError with the extra to
+    install if missing."""
+    try:
+        return (importlib.import_module("pyarrow"),
+                importlib.import_module("pyarrow.parquet"))
+    except ImportError as err:
+        raise ImportError(
+            "The Parquet export requires pyarrow: "
+            "pip install zbta[parquet]") from err
+
+
+def normalize_frame(dataset: pd.DataFrame) -> pd.DataFrame:
+    """Returns a copy of a table with the types of the export: booleans,
+    timestamps, int64 for `__INTEGER_COLUMNS__`, float64 for the other
+    numbers and strings for everything else (the categoricals included).
+
+    Parameters
+    ----------
+    dataset : pd.DataFrame
+        a table of an analyzed report
+
+    Returns
+    -------
+    pd.DataFrame
+        the table to export, with a RangeIndex
+    """
+    columns = {}
+    for column, values in dataset.items():
+        dtype = values.dtype
+        as_string = column in __STRING_COLUMNS__
+        if column in __INTEGER_COLUMNS__:
+            columns[column] = values.astype(np.int64)
+        elif not as_string and (
+                pd.api.types.is_bool_dtype(dtype) or
+                pd.api.types.is_datetime64_any_dtype(dtype)):
+            columns[column] = values
+        elif not as_string and pd.api.types.is_numeric_dtype(dtype):
+            columns[column] = values.astype(np.float64)
+        else:
+            columns[column] = values.astype(object).where(
+                values.notna(), None).astype("string")
+    return pd.DataFrame(columns).reset_index(drop=True)
+
+
+class ParquetExporter:
+    """Buffers the tables of analyzed reports and writes them to the
+    partitioned datasets of a directory, see the module documentation.
+
+    Every flush writes new files, several exporters (e.g. one per worker
+    process) can write to the same directory. The schema of every table is
+    unified across the flushes of an exporter. The `_common_metadata` of
+    the datasets is written on `close`, unless disabled for the exporters
+    of the workers: their coordinator writes it once they are all done.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        batch_rows: int = 500_000,
+        compression: str = "snappy",
+        tables: Sequence[str] = tuple(__EXPORT_TABLES__),
+        write_metadata: bool = True
+    ) -> None:
+        """
+        Parameters
+        ----------
+        root : str
+            the directory of the datasets
+        batch_rows : int, optional
+            the number of transactions buffered before a flush, by default
+            500k
+        compression : str, optional
+            the compression codec of the files, by default "snappy"
+        tables : Sequence[str], optional
+            the tables to export, by default all of `__EXPORT_TABLES__`
+        write_metadata : bool, optional
+            write the `_common_metadata` of the datasets on `close`, see
+            `write_common_metadata`, by default True
+
+        Raises
+        ------
+        ValueError
+            if a table is not recognized.
+        ImportError
+            if pyarrow is not installed.
+        """
+        unknown = [el for el in tables if el not in __EXPORT_TABLES__]
+        if unknown:
+            msg = f"Unknown export tables `{unknown}`"
+            logger.error(msg)
+            raise ValueError(msg)
+        self._pa, self._pq = _import_pyarrow()
+        self._root = root
+        self._batch_rows = batch_rows
+        self._compression = compression
+        self._tables = list(tables)
+        self._write_metadata = write_metadata
+        self._buffers = {el: [] for el in self._tables}
+        self._schemas = {}  # the unified schema of every table
+        self._nb_buffered = 0  # the number of transactions buffered
+        self._nb_reports = 0
+        self._nb_flushes = 0
+        self._closed = False
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    @property
+    def nb_reports(self) -> int:
+        """Returns the number of reports added."""
+        return self._nb_reports
+
+    @property
+    def nb_flushes(self) -> int:
+        """Returns the number of flushes, each writes new files."""
+        return self._nb_flushes
+
+    def add_report(
+        self,
+        report_id: Optional[str],
+        btanalyzer: Any,
+        attributes: Dict[str, Any]
+    ) -> None:
+        """Buffers the tables of a report, flushed when the buffer exceeds
+        `batch_rows` transactions.
+
+        Parameters
+        ----------
+        report_id : str, optional
+            the key of the report, a random one if None
+        btanalyzer : Any
+            the `BTAnalyzer` of the report, or its cached snapshot
+        attributes : Dict[str, Any]
+            the attributes of the report, keyed by method name
+        """
+        if self._closed:
+            raise ValueError("The exporter is closed")
+        report_id = report_id if report_id is not None else \
+            uuid.uuid4().hex
+        month = pd.Timestamp(btanalyzer.report.max_date).strftime("%Y-%m")
+        keys = {"report_id": report_id, __PARTITION_COLUMN__: month}
+        if "transactions" in self._buffers:
+            self._buffers["transactions"].append(
+                btanalyzer.dfs.assign(**keys))
+        if "daily_balances" in self._buffers:
+            self._buffers["daily_balances"].append(
+                btanalyzer.dfs_daily.assign(**keys))
+        if "attributes" in self._buffers:
+            self._buffers["attributes"].append(
+                pd.DataFrame([dict(keys, **attributes)]))
+        self._nb_buffered += len(btanalyzer.dfs)
+        self._nb_reports += 1
+        if self._nb_buffered >= self._batch_rows:
+            self.flush()
+
+    def add(self, connector: Any) -> None:
+        """Buffers the report of a processed `APIConnector`, see
+        `add_report`."""
+        self.add_report(
+            connector.transaction_id,
+            connector.btanalyzer,
+            connector.engine.attributes)
+
+    def _write(self, table: str, frames: List[pd.DataFrame]) -> None:
+        dataset = normalize_frame(pd.concat(frames, ignore_index=True))
+        arrow_table = self._pa.Table.from_pandas(
+            dataset, preserve_index=False)
+        if table in self._schemas:
+            schema = self._pa.unify_schemas(
+                [self._schemas[table], arrow_table.schema])
+            arrow_table = self._align(arrow_table, schema)
+        else:
+            schema = arrow_table.schema
+        self._schemas[table] = schema
+        self._pq.write_to_dataset(
+            arrow_table,
+            root_path=os.path.join(self._root, table),
+            partition_cols=[__PARTITION_COLUMN__],
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            compression=self._compression,
+            existing_data_behavior="overwrite_or_ignore")
+
+    def _align(self, arrow_table: Any, schema: Any) -> Any:
+        """Adds the missing columns (nulls) and casts to the schema."""
+        for field in schema:
+            if field.name not in arrow_table.column_names:
+                arrow_table = arrow_table.append_column(
+                    field, self._pa.nulls(len(arrow_table), field.type))
+        return arrow_table.select(schema.names).cast(schema)
+
+    def flush(self) -> None:
+        """Writes the reports buffered."""
+        if not any(self._buffers.values()):
+            return
+        for table, frames in self._buffers.items():
+            if frames:
+                self._write(table, frames)
+            self._buffers[table] = []
+        self._nb_buffered = 0
+        self._nb_flushes += 1
+        logger.debug("flushed %s reports to %s", self._nb_reports, self._root)
+
+    def close(self) -> None:
+        """Flushes the reports buffered and writes the schemas, if
+        enabled."""
+        if self._closed:
+            return
+        self.flush()
+        if self._write_metadata and self._schemas:
+            write_common_metadata(self._root, list(self._schemas))
+        self._closed = True
+
+    def __enter__(self) -> "ParquetExporter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def write_common_metadata(
+    root: str,
+    tables: Sequence[str] = tuple(__EXPORT_TABLES__)
+) -> Dict[str, Any]:
+    """Writes the `_common_metadata` file of the datasets of a directory:
+    the schema unified over the footers of all their files, whoever wrote
+    them. The file is replaced atomically.
+
+    Parameters
+    ----------
+    root : str
+        the directory of the datasets
+    tables : Sequence[str], optional
+        the tables, the missing ones are skipped, by default all of
+        `__EXPORT_TABLES__`
+
+    Returns
+    -------
+    Dict[str, Any]
+        the schema written for every table, a `pyarrow.Schema`
+
+    Raises
+    ------
+    ImportError
+        if pyarrow is not installed.
+    """
+    pa, pq = _import_pyarrow()
+    schemas = {}
+    for table in tables:
+        directory = os.path.join(root, table)
+        paths = sorted(
+            os.path.join(path, name)
+            for path, _, names in os.walk(directory) for name in names
+            if name.endswith(".parquet"))
+        if not paths:
+            continue
+        schema = pa.unify_schemas([pq.read_schema(el) for el in paths])
+        if __PARTITION_COLUMN__ in schema.names:
+            schema = schema.remove(
+                schema.get_field_index(__PARTITION_COLUMN__))
+        target = os.path.join(directory, "_common_metadata")
+        tmp = f"{target}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        pq.write_metadata(schema, tmp)
+        os.replace(tmp, target)
+        schemas[table] = schema
+    return schemas
+
+
+def main(argv=None) -> int:
+    # imported here, the batch workers import this module
+    from zbta.api.batch import BatchStats, process_batch
+    from zbta.api.stream import read_ndjson
+    parser = argparse.ArgumentParser(
+        description="Exports the analyses of a newline delimited file of "
+                    "payloads to Parquet.")
+    parser.add_argument("input", help="newline delimited payloads")
+    parser.add_argument("output", help="directory of the datasets")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument("--batch-rows", type=int, default=500_000,
+                        help="transactions buffered per worker and flush")
+    parser.add_argument("--cache-dir", default=None,
+                        help="directory of the cache of the analyses")
+    args = parser.parse_args(argv)
+    try:
+        _import_pyarrow()  # fail before starting the workers
+    except ImportError as err:
+        print(err, file=sys.stderr)
+        return 2
+    stats = BatchStats()
+    for _ in process_batch(
+            (line for _, _, line in read_ndjson(args.input)),
+            workers=args.workers, stats=stats, cache_dir=args.cache_dir,
+            export_dir=args.output, export_batch_rows=args.batch_rows):
+        pass
+    print(stats.summary(), file=sys.stderr)
+    return 0 if stats.nb_failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,508 @@
+"""Scoring server: a long-running HTTP server wrapping `APIConnector`.
+
+The parent process imports and warms up the whole pipeline once (pandas,
+jsonschema, the compiled schemas and keyword dictionaries, the attribute
+registries) by scoring a sample payload, freezes the warm heap and forks
+the workers. The workers share the listening socket and serve one request
+at a time, the kernel spreading the connections among them. A worker that
+dies is replaced, after a growing delay if the workers keep dying early;
+the server stops if they keep failing at boot. The latencies of all the
+workers are recorded in a histogram shared by the processes.
+
+With the instrumentation (see `zbta.core.tracing`), every worker writes the
+histograms of its spans to its own file of a metrics directory, at most
+once a second, and `/metrics` serves their sum.
+
+Endpoints:
+    POST /score    the json payload, returns the response of the API, with
+                   the error code of the response as the HTTP status
+    GET  /stats    the number of requests and the latency percentiles
+    GET  /health   the pid of the worker
+    GET  /metrics  the histograms of the spans of all the workers, in the
+                   Prometheus text format
+
+Usage:
+    python -m zbta.api.server --port 8080 --workers 4 --instrumentation
+    python -m zbta.api.server --unix /tmp/zbta.sock --workers 4
+
+See `zbta.api.client` for the client and the load test.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import signal
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, Optional
+from zbta.api import api, batch
+from zbta.api.api import APIConnector
+from zbta.core.buffers import tune_gc
+from zbta.core import tracing
+import logging
+from zbta.core.logs import get_logger
+
+logger = get_logger(__name__, logging.INFO)
+
+__SAMPLE_PAYLOAD__ = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "fiserv",
+    "415060515_AllData_single_file_nopii.json")
+# the latency histogram: buckets of 2^(1/8) (9%) from 0.1ms to 100s
+__LATENCY_MIN__ = 1e-4
+__BUCKETS_PER_OCTAVE__ = 8
+__NB_BUCKETS__ = 20 * __BUCKETS_PER_OCTAVE__ + 1
+__MAX_BODY_BYTES__ = 64 << 20
+# the exit status of a worker that fails before serving
+__BOOT_FAILURE_STATUS__ = 3
+# the server stops after this many consecutive boot failures
+__MAX_BOOT_FAILURES__ = 5
+# a worker dying sooner after its fork is restarted after a delay, doubled
+# at every consecutive early death
+__MIN_WORKER_UPTIME__ = 5.
+__RESTART_BACKOFF__ = .5
+__MAX_RESTART_BACKOFF__ = 30.
+# the minimum interval between two exports of the spans of a worker
+__METRICS_INTERVAL__ = 1.
+__METRICS_FILE__ = "worker-{pid}.prom"
+
+
+class LatencyStats:
+    """Latency histogram shared by the processes forked after its creation.
+    The percentiles are the upper bounds of the buckets, i.e. at most 9%
+    over the exact values.
+    """
+
+    def __init__(self) -> None:
+        self._lock = multiprocessing.Lock()
+        # the buckets, then the number of errors and the total in us
+        self._counts = multiprocessing.RawArray("q", __NB_BUCKETS__ + 2)
+
+    @staticmethod
+    def _bucket(elapsed: float) -> int:
+        if elapsed <= __LATENCY_MIN__:
+            return 0
+        bucket = math.ceil(
+            math.log2(elapsed / __LATENCY_MIN__) * __BUCKETS_PER_OCTAVE__)
+        return min(bucket, __NB_BUCKETS__ - 1)
+
+    @staticmethod
+    def _upper_bound(bucket: int) -> float:
+        return __LATENCY_MIN__ * 2 ** (bucket / __BUCKETS_PER_OCTAVE__)
+
+    def add(self, elapsed: float, ok: bool = True) -> None:
+        """Records the latency of a request, in seconds."""
+        with self._lock:
+            self._counts[self._bucket(elapsed)] += 1
+            if not ok:
+                self._counts[__NB_BUCKETS__] += 1
+            self._counts[__NB_BUCKETS__ + 1] += int(elapsed * 1e6)
+
+    def reset(self) -> None:
+        with self._lock:
+            for i in range(len(self._counts)):
+                self._counts[i] = 0
+
+    def summary(self) -> Dict[str, float]:
+        """Returns the number of requests, of errors and the latency
+        percentiles in milliseconds."""
+        with self._lock:
+            counts = self._counts[:]
+        buckets = counts[:__NB_BUCKETS__]
+        nb_requests = sum(buckets)
+        summary = {
+            "nb_requests": nb_requests,
+            "nb_errors": counts[__NB_BUCKETS__],
+            "mean_ms": counts[__NB_BUCKETS__ + 1] / 1e3 / nb_requests
+            if nb_requests else None,
+        }
+        for name, quantile in [("p50", .5), ("p90", .9), ("p99", .99),
+                               ("max", 1.)]:
+            value, cumul = None, 0
+            if nb_requests:
+                rank = max(1, math.ceil(quantile * nb_requests))
+                for bucket, count in enumerate(buckets):
+                    cumul += count
+                    if cumul >= rank:
+                        value = self._upper_bound(bucket) * 1e3
+                        break
+            summary[f"{name}_ms"] = value
+        return summary
+
+
+def preload(sample: Optional[str] = __SAMPLE_PAYLOAD__) -> None:
+    """Warms up the pipeline of the current process: imports and compiles
+    everything (see `zbta.api.api.preload`), scores a sample payload for
+    the caches built on first use and freezes the objects alive, which the
+    forked workers then share.
+
+    Parameters
+    ----------
+    sample : str, optional
+        a json payload, by default the bundled Fiserv sample. None only
+        freezes the heap.
+    """
+    start = time.perf_counter()
+    api.preload()
+    if sample is not None and os.path.isfile(sample):
+        with open(sample, "rb") as hh:
+            response = APIConnector(hh.read()).process_payload()
+        if "error_code" in response:
+            logger.warning("the warm-up payload failed: %s",
+                           response.get("error_message"))
+    tune_gc(freeze=True)
+    logger.info("pipeline preloaded in %.2fs", time.perf_counter() - start)
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """The requests of a worker, see the module documentation."""
+    server_version = "zbta"
+    stats = None  # the LatencyStats of the server, set by `serve`
+    metrics_dir = None  # the exports of the spans of the workers, if any
+    position = 0  # the number of payloads scored by the worker
+    last_export = 0.  # the time of the last export of the spans
+
+    def address_string(self) -> str:
+        # the client address of a unix socket is empty
+        return str(self.client_address[0]) if self.client_address else "-"
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("%s %s", self.address_string(), format % args)
+
+    def _send_json(self, status: int, obj: Dict) -> None:
+        body = json.dumps(obj, default=batch.to_json).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @classmethod
+    def export_metrics(cls, force: bool = False) -> None:
+        """Writes the histograms of the spans of the worker to its file of
+        the metrics directory, at most once per `__METRICS_INTERVAL__`."""
+        now = time.monotonic()
+        if cls.metrics_dir is None or \
+                (not force and now - cls.last_export < __METRICS_INTERVAL__):
+            return
+        cls.last_export = now
+        tracing.export_prometheus(os.path.join(
+            cls.metrics_dir, __METRICS_FILE__.format(pid=os.getpid())))
+
+    def _send_metrics(self) -> None:
+        self.export_metrics(force=True)
+        texts = []
+        for name in sorted(os.listdir(self.metrics_dir)):
+            if not name.endswith(".prom"):
+                continue
+            try:
+                with open(os.path.join(self.metrics_dir, name), "r",
+                          encoding="utf8") as hh:
+                    texts.append(hh.read())
+            except OSError:  # replaced in the meantime
+                continue
+        body = tracing.merge_prometheus(texts).encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "pid": os.getpid()})
+        elif self.path == "/stats":
+            self._send_json(200, self.stats.summary())
+        elif self.path == "/metrics":
+            if self.metrics_dir is None:
+                self._send_json(404, {"error_message": "The instrumentation "
+                                                       "is disabled"})
+            else:
+                self._send_metrics()
+        else:
+            self._send_json(404, {"error_message": f"Unknown `{self.path}`"})
+
+    def do_POST(self) -> None:
+        if self.path != "/score":
+            self._send_json(404, {"error_message": f"Unknown `{self.path}`"})
+            return
+        start = time.perf_counter()
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > __MAX_BODY_BYTES__:
+            self._send_json(400, {"error_message": "Missing or too large "
+                                                   "payload"})
+            return
+        result = batch.score_payload(
+            ScoringHandler.position, self.rfile.read(length))
+        ScoringHandler.position += 1
+        # recorded first, the client may ask for the stats once answered
+        self.stats.add(time.perf_counter() - start, ok=result.ok)
+        self._send_json(result.response.get("error_code", 200),
+                        result.response)
+        self.export_metrics()
+
+
+def _remove_stale_socket(path: str) -> None:
+    """Removes the unix socket left by a server that did not stop cleanly.
+
+    Raises
+    ------
+    FileExistsError
+        if the path is not a socket, or is the socket of a live server.
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(
+            f"`{path}` exists and is not a socket, not removing it")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:  # nobody listening
+        os.unlink(path)
+    else:
+        raise FileExistsError(f"`{path}` is in use by another server")
+    finally:
+        probe.close()
+
+
+def _listen(
+    host: str,
+    port: int,
+    unix_socket: Optional[str],
+    backlog: int
+) -> socket.socket:
+    if unix_socket is not None:
+        _remove_stale_socket(unix_socket)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(unix_socket)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def _close_listener(sock: socket.socket, unix_socket: Optional[str]) -> None:
+    sock.close()
+    if unix_socket is None:
+        return
+    try:
+        if stat.S_ISSOCK(os.stat(unix_socket).st_mode):
+            os.unlink(unix_socket)
+    except FileNotFoundError:
+        pass
+
+
+def _run_worker(
+    sock: socket.socket,
+    stats: LatencyStats,
+    cache_dir: Optional[str],
+    gc_tuning: bool,
+    metrics_dir: Optional[str] = None
+) -> None:
+    """The loop of a forked worker, never returns. Exits with
+    `__BOOT_FAILURE_STATUS__` if it fails before serving."""
+    status = __BOOT_FAILURE_STATUS__
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # stopped by the parent
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        batch._init_worker(cache_dir=cache_dir, gc_tuning=gc_tuning)
+        ScoringHandler.stats = stats
+        ScoringHandler.metrics_dir = metrics_dir
+        server = HTTPServer(
+            sock.getsockname(), ScoringHandler, bind_and_activate=False)
+        server.socket.close()
+        server.socket = sock
+        status = 1
+        server.serve_forever()
+        status = 0
+    except Exception as err:
+        logger.error("worker %s failed: %s", os.getpid(), err)
+    finally:
+        os._exit(status)
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    unix_socket: Optional[str] = None,
+    workers: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+    gc_tuning: bool = False,
+    sample: Optional[str] = __SAMPLE_PAYLOAD__,
+    backlog: int = 128,
+    instrumentation: bool = False,
+    metrics_dir: Optional[str] = None
+) -> None:
+    """Preloads the pipeline, forks the workers and serves until SIGINT or
+    SIGTERM, or until the workers keep failing at boot.
+
+    Parameters
+    ----------
+    host : str, optional
+        the address to listen on, by default "127.0.0.1"
+    port : int, optional
+        the port to listen on, 0 for any free port, by default 8080
+    unix_socket : str, optional
+        the path of a unix socket to listen on instead of `host`/`port`, by
+        default None
+    workers : int, optional
+        the number of worker processes, by default the number of cpus
+    cache_dir : str, optional
+        the directory of the cache of the analyses, see `open_cache`, by
+        default None
+    gc_tuning : bool, optional
+        defer the collections to the end of every request, see
+        `deferred_gc`, by default False
+    sample : str, optional
+        the warm-up payload, see `preload`
+    backlog : int, optional
+        the connections waiting for a free worker, by default 128
+    instrumentation : bool, optional
+        record the spans of the requests and serve them on `/metrics`, see
+        `zbta.core.tracing`, by default False
+    metrics_dir : str, optional
+        the directory of the exports of the spans of the workers, emptied
+        of them at start, by default a temporary directory removed at exit
+
+    Raises
+    ------
+    RuntimeError
+        if the platform cannot fork, or if the workers keep failing at
+        boot.
+    FileExistsError
+        if `unix_socket` is not a stale socket.
+    """
+    if not hasattr(os, "fork"):
+        raise RuntimeError("The scoring server needs os.fork")
+    workers = workers or os.cpu_count() or 1
+    # before the preload, a wrong address fails at once
+    sock = _listen(host, port, unix_socket, backlog)
+    try:
+        preload(sample)
+    except BaseException:
+        _close_listener(sock, unix_socket)
+        raise
+    own_metrics_dir = False
+    if instrumentation:
+        tracing.enable_instrumentation()
+        if metrics_dir is None:
+            metrics_dir = tempfile.mkdtemp(prefix="zbta-metrics-")
+            own_metrics_dir = True
+        os.makedirs(metrics_dir, exist_ok=True)
+        for name in os.listdir(metrics_dir):  # of a previous run
+            if name.endswith(".prom"):
+                os.unlink(os.path.join(metrics_dir, name))
+    else:
+        metrics_dir = None
+    stats = LatencyStats()
+    address = unix_socket if unix_socket is not None else \
+        "http://%s:%s" % sock.getsockname()[:2]
+    children = {}
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(sock, stats, cache_dir, gc_tuning, metrics_dir)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    previous = signal.signal(signal.SIGTERM, stop)
+    nb_early_deaths = 0  # consecutive deaths soon after the fork
+    nb_boot_failures = 0  # consecutive failures before serving
+    try:
+        for _ in range(workers):
+            spawn()
+        logger.info("listening on %s with %s workers", address, workers)
+        while True:
+            pid, status = os.wait()
+            started = children.pop(pid, None)
+            if started is None:
+                continue
+            if os.WIFEXITED(status) and \
+                    os.WEXITSTATUS(status) == __BOOT_FAILURE_STATUS__:
+                nb_boot_failures += 1
+                if nb_boot_failures >= __MAX_BOOT_FAILURES__:
+                    raise RuntimeError(
+                        f"The workers failed at boot {nb_boot_failures} "
+                        "times in a row, stopping")
+            else:
+                nb_boot_failures = 0
+            if time.monotonic() - started < __MIN_WORKER_UPTIME__:
+                nb_early_deaths += 1
+            else:
+                nb_early_deaths = 0
+            delay = 0. if nb_early_deaths == 0 else min(
+                __MAX_RESTART_BACKOFF__,
+                __RESTART_BACKOFF__ * 2 ** (nb_early_deaths - 1))
+            logger.error("worker %s exited (%s), restarting it in %.1fs",
+                         pid, status, delay)
+            time.sleep(delay)
+            spawn()
+    except KeyboardInterrupt:
+        logger.info("stopping: %s", stats.summary())
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        _close_listener(sock, unix_socket)
+        if own_metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Serves the scoring of payloads over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", default=None,
+                        help="path of a unix socket, instead of the port")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument("--cache-dir", default=None,
+                        help="directory of the cache of the analyses")
+    parser.add_argument("--gc-tuning", action="store_true",
+                        help="defer the collections to the end of every "
+                             "request")
+    parser.add_argument("--warmup", default=__SAMPLE_PAYLOAD__,
+                        help="payload scored at boot")
+    parser.add_argument("--instrumentation", action="store_true",
+                        help="record the spans of the requests, served on "
+                             "/metrics")
+    parser.add_argument("--metrics-dir", default=None,
+                        help="directory of the exports of the spans of the "
+                             "workers, e.g. for a textfile collector")
+    args = parser.parse_args(argv)
+    try:
+        serve(host=args.host, port=args.port, unix_socket=args.unix,
+              workers=args.workers, cache_dir=args.cache_dir,
+              gc_tuning=args.gc_tuning, sample=args.warmup,
+              instrumentation=args.instrumentation,
+              metrics_dir=args.metrics_dir)
+    except (RuntimeError, FileExistsError) as err:
+        logger.error(str(err))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
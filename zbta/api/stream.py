@@ -0,0 +1,252 @@
+"""Streaming pipeline for newline delimited payloads (one Fiserv request per
+line): read line -> `APIConnector` -> attributes -> output row.
+
+The memory stays flat whatever the size of the input: the lines are read
+lazily and at most `max_in_flight` of them are held at any time. Every
+output row records the byte offsets of its input line, the output file is
+therefore its own checkpoint and a crashed run can be resumed.
+
+Usage:
+    python -m zbta.api.stream backfill.ndjson attributes.csv --workers 4
+    python -m zbta.api.stream backfill.ndjson attributes.csv --resume
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+from zbta.api.batch import BatchResult, BatchStats, process_batch, to_json
+from zbta.attributes.attributes import ZBTAGeneral
+import logging
+from zbta.core.logs import get_logger
+
+logger = get_logger(__name__, logging.INFO)
+
+__OUTPUT_FORMATS__ = ["csv", "ndjson"]
+__KEY_COLUMNS__ = [
+    "transaction_id", "offset", "next_offset", "error_code", "error_message"]
+
+
+def read_ndjson(
+    path: str,
+    offset: int = 0
+) -> Iterator[Tuple[int, int, bytes]]:
+    """Reads a newline delimited file lazily.
+
+    Parameters
+    ----------
+    path : str
+        the input file
+    offset : int, optional
+        the byte offset to start from, must be the start of a line, by
+        default 0
+
+    Yields
+    ------
+    Tuple[int, int, bytes]
+        the offset of the line, the offset of the next line and the line.
+        Blank lines are skipped.
+    """
+    with open(path, "rb") as hh:
+        hh.seek(offset)
+        for line in hh:
+            next_offset = offset + len(line)
+            if line.strip():
+                yield offset, next_offset, line
+            offset = next_offset
+
+
+def _last_line(path: str) -> Optional[bytes]:
+    """Returns the last complete line of a file and truncates a partial
+    last line, i.e. a row that was being written when the run crashed.
+    """
+    with open(path, "rb+") as hh:
+        end = hh.seek(0, os.SEEK_END)
+        position = end
+        tail = b""
+        while position > 0:
+            step = min(65536, position)
+            position -= step
+            hh.seek(position)
+            tail = hh.read(step) + tail
+            if tail.count(b"\n") >= 2 or (position == 0 and b"\n" in tail):
+                break
+        if not tail:
+            return None
+        if not tail.endswith(b"\n"):
+            cut = tail.rfind(b"\n") + 1
+            hh.truncate(end - len(tail) + cut)
+            tail = tail[:cut]
+        lines = tail.splitlines()
+        return lines[-1] if lines else None
+
+
+def find_resume_offset(output: str, fmt: str) -> int:
+    """Returns the input offset following the last row of an output file.
+
+    Parameters
+    ----------
+    output : str
+        the output file of a previous run
+    fmt : str
+        the format of the output file
+
+    Returns
+    -------
+    int
+        the offset to resume from, 0 if the file does not exist or has no
+        row.
+    """
+    if not os.path.isfile(output):
+        return 0
+    line = _last_line(output)
+    if line is None:
+        return 0
+    if fmt == "ndjson":
+        return int(json.loads(line)["next_offset"])
+    row = next(csv.reader([line.decode("utf8")]))
+    if row == _csv_columns():  # only the header
+        return 0
+    return int(row[__KEY_COLUMNS__.index("next_offset")])
+
+
+def _csv_columns() -> List[str]:
+    return __KEY_COLUMNS__ + [el.method for el in ZBTAGeneral.registry()]
+
+
+def _as_row(
+    result: BatchResult,
+    offsets: Tuple[int, int]
+) -> Dict:
+    row = {"transaction_id": result.transaction_id,
+           "offset": offsets[0],
+           "next_offset": offsets[1],
+           "error_code": result.response.get("error_code"),
+           "error_message": result.response.get("error_message")}
+    if row["error_message"] is not None:  # keep one row per line
+        row["error_message"] = " ".join(row["error_message"].splitlines())
+    if result.ok:
+        row.update(result.response["response"]["attributes"])
+    return row
+
+
+def stream_ndjson(
+    input_path: str,
+    output_path: str,
+    fmt: str = "csv",
+    workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    offset: int = 0,
+    resume: bool = False,
+    cache_dir: Optional[str] = None,
+    gc_tuning: bool = False
+) -> BatchStats:
+    """Scores every payload of a newline delimited file and writes one row
+    per payload, keyed by `application_details.transaction_id`, in the
+    order of the input.
+
+    Parameters
+    ----------
+    input_path : str
+        the newline delimited payloads
+    output_path : str
+        the output file
+    fmt : str, optional
+        "csv" or "ndjson", by default "csv"
+    workers : int, optional
+        the number of worker processes, by default the number of cpus
+    max_in_flight : int, optional
+        the maximum number of payloads held in memory, by default
+        2 x workers
+    offset : int, optional
+        the byte offset of the input to start from, by default 0
+    resume : bool, optional
+        resume after the last row of an existing output file, by default
+        False
+    cache_dir : str, optional
+        the directory of the cache of the analyses, by default None
+    gc_tuning : bool, optional
+        tune the garbage collector of the workers, by default False
+
+    Returns
+    -------
+    BatchStats
+        the throughput of the run
+
+    Raises
+    ------
+    ValueError
+        if the format is not recognized.
+    """
+    if fmt not in __OUTPUT_FORMATS__:
+        msg = f"Unknown output format `{fmt}`"
+        logger.error(msg)
+        raise ValueError(msg)
+    if resume:
+        offset = find_resume_offset(output_path, fmt)
+        logger.info("resuming from byte offset %s", offset)
+    append = (resume or offset > 0) and os.path.isfile(output_path) \
+        and os.path.getsize(output_path) > 0
+    offsets = {}  # position -> offsets of the lines in flight
+
+    def payloads():
+        for position, (start, end, line) in enumerate(
+                read_ndjson(input_path, offset)):
+            offsets[position] = (start, end)
+            yield line
+
+    stats = BatchStats()
+    with open(output_path, "a" if append else "w", encoding="utf8",
+              newline="") as out:
+        if fmt == "csv":
+            writer = csv.DictWriter(
+                out, fieldnames=_csv_columns(), extrasaction="ignore")
+            if not append:
+                writer.writeheader()
+        for result in process_batch(
+                payloads(), workers=workers, max_in_flight=max_in_flight,
+                stats=stats, ordered=True, cache_dir=cache_dir,
+                gc_tuning=gc_tuning):
+            row = _as_row(result, offsets.pop(result.position))
+            if fmt == "csv":
+                writer.writerow(row)
+            else:
+                out.write(json.dumps(row, default=to_json) + "\n")
+            out.flush()
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Scores a newline delimited file of payloads.")
+    parser.add_argument("input", help="newline delimited payloads")
+    parser.add_argument("output", help="output file")
+    parser.add_argument("--format", choices=__OUTPUT_FORMATS__, default=None,
+                        help="output format, by default from the extension")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="maximum number of payloads held in memory")
+    parser.add_argument("--offset", type=int, default=0,
+                        help="byte offset of the input to start from")
+    parser.add_argument("--resume", action="store_true",
+                        help="resume after the last row of the output")
+    parser.add_argument("--cache-dir", default=None,
+                        help="directory of the cache of the analyses")
+    parser.add_argument("--gc-tuning", action="store_true",
+                        help="tune the garbage collector of the workers")
+    args = parser.parse_args(argv)
+    fmt = args.format or (
+        "ndjson" if args.output.endswith((".ndjson", ".jsonl")) else "csv")
+    stats = stream_ndjson(
+        args.input, args.output, fmt=fmt, workers=args.workers,
+        max_in_flight=args.max_in_flight, offset=args.offset,
+        resume=args.resume, cache_dir=args.cache_dir,
+        gc_tuning=args.gc_tuning)
+    print(stats.summary(), file=sys.stderr)
+    return 0 if stats.nb_failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
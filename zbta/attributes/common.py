@@ -1,26 +1,66 @@
 from zbta.btanalyzer.btanalyzer import BTAnalyzer
+from zbta.core.buffers import get_buffer_pool
+from zbta.core.tracing import count_rows, span
 import inspect
-from typing import List, Union
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
 import pandas as pd
 import numpy as np
 from datetime import timedelta
 from functools import wraps
 import csv
 import logging
+from zbta.core.logs import get_logger
+
+logger = get_logger(__name__, logging.ERROR)
+
+class TransactionSpec(NamedTuple):
+    """Declarative description of an attribute computed over a window of
+    the transaction table. The fields mirror the arguments of
+    `limit_transaction_dataset` plus the aggregation applied to the
+    selected transactions ("count" or "amount").
+    """
+    aggregation: str
+    ndays: int
+    amt_thr: float = 0
+    is_inc: bool = False
+    is_out: bool = False
+    remove_internal: bool = True
+    categories: Tuple[str, ...] = ()
+    whichmonth: Optional[int] = None
+    last_date: Union[str, pd.Timestamp] = "last-date"
+
+
+class AttributeSpec(NamedTuple):
+    """An entry of the attribute registry, i.e. a row of
+    `attribute_list.csv` plus the optional `TransactionSpec` used by the
+    columnar engine.
+    """
+    method: str
+    name: str
+    code: str
+    module: str
+    description: str
+    spec: Optional[TransactionSpec] = None
+
+    def as_row(self) -> Dict[str, str]:
+        """Returns the entry as a row of the attribute list csv."""
+        return {'Method': self.method,
+                'Attribute Name': self.name,
+                'Attribute Code': self.code,
+                'Module': self.module,
+                'Description': self.description}
+
+
+__ATTRIBUTES_CSV_COLUMNS__ = [
+    'Method', 'Attribute Name', 'Attribute Code', 'Module', 'Description']
 
-logger = logging.getLogger(__name__)
-fh = logging.StreamHandler()
-fh_formatter = logging.Formatter(
-    "[%(levelname)s] [%(asctime)s] [%(funcName)s] %(message)s")
-fh.setFormatter(fh_formatter)
-logger.addHandler(fh)
-logger.setLevel(logging.ERROR)
 
 class auto_short_doc(object):
 
-    def __init__(self, short_description, full_name):
+    def __init__(self, short_description, full_name, spec=None):
         self._short_description = short_description
         self._full_name = full_name
+        self._spec = spec
 
     def __call__(self, f):
         @wraps(f)
@@ -29,10 +69,114 @@ class auto_short_doc(object):
                 return self._short_description, self._full_name
             else:
                 return f(*args)
+        # exposed so that the registry can be built from the class itself
+        # and the columnar engine can compute the attribute without calling
+        # the method.
+        wrapped_f.short_description = self._short_description
+        wrapped_f.full_name = self._full_name
+        wrapped_f.spec = self._spec
         return wrapped_f
 
+
+def register_attributes(
+    cls: type,
+    module: str,
+    table: List[Tuple[str, str, str, TransactionSpec]]
+) -> type:
+    """Generates the `__ZBTA_<module>_<name>__` methods of a mixin from a
+    declarative table of attributes.
+
+    Parameters
+    ----------
+    cls : type
+        the mixin receiving the attributes
+    module : str
+        the module of the attributes, e.g. "CORE"
+    table : List[Tuple[str, str, str, TransactionSpec]]
+        the attributes as (name, code, description, spec) rows
+
+    Returns
+    -------
+    type
+        the mixin
+
+    Raises
+    ------
+    ValueError
+        if an attribute name or code is declared twice.
+    """
+    codes = set()
+    for name, code, description, spec in table:
+        method_name = f"__ZBTA_{module}_{name}__"
+        if method_name in cls.__dict__ or code in codes:
+            msg = f"Attribute `{method_name}` ({code}) declared twice"
+            logger.error(msg)
+            raise ValueError(msg)
+        codes.add(code)
+
+        def method(self, _spec=spec):
+            return calculate_transaction_spec(self._btanalyzer, _spec)
+
+        method.__name__ = method_name
+        method.__qualname__ = f"{cls.__name__}.{method_name}"
+        method.__doc__ = description
+        setattr(cls, method_name,
+                auto_short_doc(description, code, spec=spec)(method))
+    return cls
+
+
+def build_attribute_registry(cls: type) -> List[AttributeSpec]:
+    """Lists the attributes implemented by a class, sorted by method name.
+
+    Parameters
+    ----------
+    cls : type
+        the class to inspect
+
+    Returns
+    -------
+    List[AttributeSpec]
+        the registry of the attributes
+    """
+    registry = []
+    for method_name, method in inspect.getmembers(cls):
+        if "__ZBTA_" not in method_name:
+            continue
+        registry.append(AttributeSpec(
+            method=method_name,
+            name=method_name.split("_")[4],
+            code=method.full_name,
+            module=method_name.split("_")[3],
+            description=method.short_description,
+            spec=method.spec
+        ))
+    return registry
+
+
+def load_list_attributes_csv(input_file: str) -> List[Dict[str, str]]:
+    """Reads a csv file generated by `create_list_attributes_csv`.
+
+    Parameters
+    ----------
+    input_file : str
+        the name of the csv file
+
+    Returns
+    -------
+    List[Dict[str, str]]
+        the rows of the file
+    """
+    with open(input_file, "r", newline="") as ff:
+        return [dict(row) for row in csv.DictReader(ff)]
+
+
 class ZBTACore:
+    __CALCULATION_MODES__ = ["method", "columnar"]
+    _registry = []  # built once per class, see __init_subclass__
 
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._registry = build_attribute_registry(cls)
 
     def __init__(self, btanalyzer: BTAnalyzer) -> None:
         self._btanalyzer = btanalyzer
@@ -44,37 +188,35 @@ class ZBTACore:
         self._generic_codes = {} # mapping between method names and attribute id
         self._extract_attributes_names()
         self._extract_info_from_methods()
-    
+
+    @classmethod
+    def registry(cls) -> List[AttributeSpec]:
+        """Returns the registry of the attributes implemented in the class."""
+        return cls._registry
+
+    @property
+    def attributes(self) -> Dict[str, Any]:
+        """Returns the calculated attributes keyed by method name."""
+        return self._attributes
+
     @property
     def nb_attributes(self) -> int:
         """Returns the number of attributes."""
         return self._nb_attributes
 
     def _extract_attributes_names(self) -> None:
-        """Inspects the attributes implemented in the class.
+        """Lists the attributes implemented in the class.
         """
-        self._attribute_names = [
-            el[0] for el in inspect.getmembers(self) if "__ZBTA_" in el[0]]
+        self._attribute_names = [el.method for el in self._registry]
         self._attribute_methods = [
-            el[1] for el in inspect.getmembers(self) if "__ZBTA_" in el[0]]
+            getattr(self, el) for el in self._attribute_names]
         self._nb_attributes = len(self._attribute_names)
 
     def _extract_info_from_methods(self):
-        """Generates the description list which contains all the info
-        stored in the decorator
+        """Generates the description list from the registry of the class.
         """
-        # the way the doc is generated is by calling each one of the attributes with the "generate_doc=True" flag
-        # this triggers the wrapper to return the short description.
-        self._descriptions = []
-        self._generic_codes = {}
-        for el in inspect.getmembers(self):
-             if "__ZBTA" in el[0]:
-                self._descriptions.append({'Attribute Name': el[0].split("_")[4],
-                               'Attribute Code': el[1](generate_doc=True)[1],
-                               'Module': el[0].split('_')[3],
-                               'Description': el[1](generate_doc=True)[0],
-                               'Method': el[0]})
-                self._generic_codes[el[0]] = self._descriptions[-1]['Attribute Code']
+        self._descriptions = [el.as_row() for el in self._registry]
+        self._generic_codes = {el.method: el.code for el in self._registry}
 
     def create_list_attributes_csv(self, output_file):
         """Generates a csv file with the description of the attributes.
@@ -89,10 +231,9 @@ class ZBTACore:
         if not "csv" in output_file[-3:]:
             logger.warning("adding .csv to the file extension.")
             output_file += ".csv"
-        csv_columns = ['Method', 'Attribute Name', 'Attribute Code', 'Module', 'Description']
         try:
             with open(output_file, "w") as ff:
-                writer = csv.DictWriter(ff, fieldnames=csv_columns)
+                writer = csv.DictWriter(ff, fieldnames=__ATTRIBUTES_CSV_COLUMNS__)
                 writer.writeheader()
                 for data in self._descriptions:
                     writer.writerow(data)
@@ -100,12 +241,157 @@ class ZBTACore:
             logger.error("Error writing to csv: `{}`".format(err))
             pass
 
-    def calculate_attributes(self) -> None:
+    def calculate_attributes(self, mode: str = "columnar") -> None:
         """Generates all the attributes.
+
+        Parameters
+        ----------
+        mode : str, optional
+            "method" calls every attribute method one by one, "columnar"
+            evaluates all the attributes declaring a `TransactionSpec` in a
+            single pass with the `ColumnarEngine` and falls back to the
+            methods for the others, by default "columnar"
+
+        Raises
+        ------
+        ValueError
+            if the mode is not recognized.
         """
+        if mode not in self.__CALCULATION_MODES__:
+            msg = f"Unknown calculation mode `{mode}`"
+            logger.error(msg)
+            raise ValueError(msg)
         self._last_date = get_last_date(self._btanalyzer, "last-date")
-        for iaa, aa in enumerate(self._attribute_names):
-            self._attributes[self._attribute_names[iaa]] = getattr(self, aa)()
+        specs = {}
+        if mode == "columnar":
+            specs = {el.method: el.spec for el in self._registry
+                     if el.spec is not None}
+            values = ColumnarEngine(self._btanalyzer).evaluate(specs)
+        for aa in self._attribute_names:
+            if aa in specs:
+                self._attributes[aa] = values[aa]
+            else:
+                with span(f"attribute.{aa}"):
+                    self._attributes[aa] = getattr(self, aa)()
+
+
+class ColumnarEngine:
+    """Evaluates many `TransactionSpec` at once with the date index of the
+    analyzer (see `BTAnalyzer.time_index`). The filters shared by several
+    specs are computed once as cumulative arrays, every count is then two
+    `searchsorted` lookups and a subtraction, every dollar amount is a sum
+    over the window only.
+    The results are identical to the ones of `limit_transaction_dataset`.
+    """
+
+    def __init__(self, btanalyzer: BTAnalyzer) -> None:
+        self._btanalyzer = btanalyzer
+        self._index = btanalyzer.time_index
+
+    def _window(
+        self,
+        spec: TransactionSpec
+    ) -> Tuple[pd.Timestamp, pd.Timestamp]:
+        """Returns the first and last date (included) of the spec."""
+        last_date = get_last_date(self._btanalyzer, spec.last_date)
+        first_date = last_date - timedelta(days=spec.ndays)
+        if spec.whichmonth is None:
+            return first_date, last_date
+        monthcheck = last_date.month + spec.whichmonth
+        yearcheck = last_date.year
+        while(monthcheck <= 0):
+            monthcheck = 12 + monthcheck
+            yearcheck -= 1
+        if monthcheck > 12:  # no date can match
+            return last_date, first_date
+        month_start = pd.Timestamp(year=yearcheck, month=monthcheck, day=1)
+        month_end = month_start + pd.offsets.MonthBegin(1) - \
+            pd.Timedelta(1, unit="ns")
+        return max(first_date, month_start), min(last_date, month_end)
+
+    def evaluate(self, specs: Dict[str, TransactionSpec]) -> Dict[str, Any]:
+        """Computes the value of every spec.
+
+        Parameters
+        ----------
+        specs : Dict[str, TransactionSpec]
+            the mapping of attribute names to their specification
+
+        Returns
+        -------
+        Dict[str, Any]
+            the mapping of attribute names to their value
+
+        Raises
+        ------
+        ValueError
+            if the aggregation of a spec is not recognized.
+        """
+        results = {}
+        for name, spec in specs.items():
+            with span(f"attribute.{name}"):
+                results[name] = self._evaluate(spec)
+        return results
+
+    def _evaluate(self, spec: TransactionSpec) -> Any:
+        first_date, last_date = self._window(spec)
+        filters = {"amt_thr": spec.amt_thr,
+                   "is_inc": spec.is_inc,
+                   "is_out": spec.is_out,
+                   "categories": spec.categories,
+                   "remove_internal": spec.remove_internal}
+        if spec.aggregation == "count":
+            return self._index.count(first_date, last_date, **filters)
+        if spec.aggregation == "amount":
+            return self._index.select(
+                first_date, last_date, **filters).sum()
+        msg = f"Unknown aggregation `{spec.aggregation}`"
+        logger.error(msg)
+        raise ValueError(msg)
+
+
+def calculate_transaction_spec(
+    btanalyzer: BTAnalyzer,
+    spec: TransactionSpec
+) -> Union[int, float]:
+    """
+    Computes a single spec with `limit_transaction_dataset`.
+
+    Parameters
+    ----------
+    btanalyzer : BTAnalyzer
+        object with all the transactions dataset
+    spec : TransactionSpec
+        the specification of the attribute
+
+    Returns
+    -------
+    Union[int, float]
+        the number of transactions or the total dollar amount
+
+    Raises
+    ------
+    ValueError
+        if the aggregation of the spec is not recognized.
+    """
+    transaction_mask = limit_transaction_dataset(
+        btanalyzer,
+        last_date=spec.last_date,
+        ndays=spec.ndays,
+        amt_thr=spec.amt_thr,
+        is_inc=spec.is_inc,
+        is_out=spec.is_out,
+        remove_internal=spec.remove_internal,
+        categories=list(spec.categories),
+        whichmonth=spec.whichmonth
+    )
+    if spec.aggregation == "count":
+        return btanalyzer.dfs[transaction_mask].shape[0]
+    elif spec.aggregation == "amount":
+        return btanalyzer.dfs[transaction_mask]['amount'].abs().sum()
+    msg = f"Unknown aggregation `{spec.aggregation}`"
+    logger.error(msg)
+    raise ValueError(msg)
 
 
 def limit_transaction_dataset(
@@ -158,43 +444,31 @@ def limit_transaction_dataset(
     last_date = get_last_date(btanalyzer, last_date)
     first_date = last_date - timedelta(days=ndays)
 
-    temporal_mask = (dataset.date >= first_date) & (dataset.date <= last_date)
-    amount_mask = dataset.amount.abs() > amt_thr
-
-    cashflow_mask = pd.Series(
-        np.ones(len(dataset)),
-        index=dataset.index,
-        dtype=bool
-    )
-    if is_inc:
-        cashflow_mask = cashflow_mask & (dataset.amount > 0)
-    if is_out:
-        cashflow_mask = cashflow_mask & (dataset.amount < 0)
-
-    if len(categories) >= 1:
-        category_mask = pd.Series(
-            np.zeros(len(dataset)),
-            index=dataset.index,
-            dtype=bool
-        )
-        for category in categories:
-            category_mask = category_mask | dataset[category]
+    # the mask is built in place, the temporaries are borrowed from the
+    # buffer pool of the worker
+    mask = btanalyzer.time_index.mask(first_date, last_date)
+    amounts = dataset.amount.to_numpy(dtype=float)
+    count_rows(len(dataset))
+    pool = get_buffer_pool()
+    with pool.borrowed(len(dataset), dtype=float) as abs_amounts, \
+            pool.borrowed(len(dataset), dtype=bool) as scratch:
+        np.abs(amounts, out=abs_amounts)
+        mask &= np.greater(abs_amounts, amt_thr, out=scratch)
+        if is_inc:
+            mask &= np.greater(amounts, 0, out=scratch)
+        if is_out:
+            mask &= np.less(amounts, 0, out=scratch)
+
+        if len(categories) >= 1:
+            scratch.fill(False)
+            for category in categories:
+                scratch |= dataset[category].to_numpy(dtype=bool)
+            mask &= scratch
+
+        if remove_internal:
+            mask &= np.logical_not(
+                dataset["is_internal"].to_numpy(dtype=bool), out=scratch)
 
-    else:
-        category_mask = pd.Series(
-            np.ones(len(dataset)),
-            index=dataset.index,
-            dtype=bool
-        )
-
-    external_mask = pd.Series(
-        np.ones(len(dataset)),
-        index=dataset.index,
-        dtype=bool
-    )
-    if remove_internal:
-        external_mask = external_mask & ~dataset["is_internal"]
-    
     if whichmonth is not None:
         monthcheck = last_date.month
         yearcheck = last_date.year
@@ -205,12 +479,10 @@ def limit_transaction_dataset(
             monthcheck = 12 + monthcheck
             yearcheck -= 1
 
-        temporal_mask = (temporal_mask) & (
-            dataset.date.dt.month == monthcheck) & (
-            dataset.date.dt.year == yearcheck)
+        mask &= ((dataset.date.dt.month == monthcheck) & (
+            dataset.date.dt.year == yearcheck)).to_numpy(dtype=bool)
 
-    return temporal_mask & amount_mask & cashflow_mask & category_mask \
-        & external_mask
+    return pd.Series(mask, index=dataset.index)
 
 
 def limit_historical_dataset(
@@ -253,13 +525,19 @@ def limit_historical_dataset(
         balances according to the conditions imposed
     """
 
-    if dataset is None:
-        dataset = btanalyzer.dfs_daily
     last_date = get_last_date(btanalyzer, last_date)
     first_date = last_date - timedelta(days=ndays)
-
-    temporal_mask = (dataset.date >= first_date) & (dataset.date <= last_date)
+    if dataset is None:
+        dataset = btanalyzer.dfs_daily
+        temporal_mask = pd.Series(
+            btanalyzer.daily_time_index.mask(first_date, last_date),
+            index=dataset.index
+        )
+    else:
+        temporal_mask = (dataset.date >= first_date) & (
+            dataset.date <= last_date)
     amount_mask = dataset.balance.abs() >= amt_thr
+    count_rows(len(dataset))
 
     overdraft_mask = pd.Series(
         np.ones(len(dataset)),
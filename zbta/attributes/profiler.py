@@ -0,0 +1,354 @@
+"""Profiler of the cost of the attributes over a corpus of payloads: the wall
+time, the memory allocated (tracemalloc) and the rows scanned by every
+attribute, ranked in a report joined to the metadata of the attributes
+(`attribute_list.csv`).
+
+Every payload is analyzed afresh for every pass, the attributes are then
+computed one by one in the order of `calculate_attributes`. The shared
+structures built on first use (the date index and its channels, the daily
+balances) are charged to the first attribute that needs them, as in
+production. The allocations are measured in a pass of their own, tracing
+the allocations slows down the code measured.
+
+Usage:
+    python -m zbta.attributes.profiler payloads/*.json \\
+        --attributes-csv attribute_list.csv --csv hot.csv --html hot.html
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import (
+    Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union)
+import pandas as pd
+from zbta.api.api import APIConnector
+from zbta.attributes.attributes import ZBTAGeneral
+from zbta.attributes.common import (
+    ColumnarEngine, ZBTACore, __ATTRIBUTES_CSV_COLUMNS__,
+    load_list_attributes_csv)
+from zbta.btanalyzer.btanalyzer import BTAnalyzer
+from zbta.core.tracing import counting_rows
+import logging
+from zbta.core.logs import get_logger
+
+logger = get_logger(__name__, logging.INFO)
+
+# the columns of the report after the metadata, ranked by total_ms
+__REPORT_COLUMNS__ = [
+    "rank", "calls", "total_ms", "share", "mean_ms", "median_ms", "p95_ms",
+    "max_ms", "rows_scanned", "ns_per_row", "alloc_peak_kb",
+    "alloc_net_kb"]
+
+
+class AttributeSample(NamedTuple):
+    """The cost of an attribute for a payload."""
+    payload: str
+    method: str
+    wall_ns: int
+    rows_scanned: int
+    alloc_peak_bytes: Optional[int] = None
+    alloc_net_bytes: Optional[int] = None
+
+
+class AttributeProfiler:
+    """Records the cost of every attribute of an engine class, see the
+    module documentation.
+
+    Example:
+        profiler = AttributeProfiler(mode="columnar")
+        for path in paths:
+            profiler.profile_file(path)
+        profiler.to_html("hot_attributes.html", "attribute_list.csv")
+    """
+    __MODES__ = ["method", "columnar"]
+
+    def __init__(
+        self,
+        engine_class: type = ZBTAGeneral,
+        mode: str = "columnar",
+        allocations: bool = True,
+        repeat: int = 1
+    ) -> None:
+        """
+        Parameters
+        ----------
+        engine_class : type, optional
+            the class of the attributes, a `ZBTACore`, by default
+            ZBTAGeneral
+        mode : str, optional
+            the calculation mode, see `ZBTACore.calculate_attributes`, by
+            default "columnar"
+        allocations : bool, optional
+            measure the allocations, in an extra pass, by default True
+        repeat : int, optional
+            the number of timed passes per payload, by default 1
+
+        Raises
+        ------
+        ValueError
+            if the mode is not recognized.
+        """
+        if mode not in self.__MODES__:
+            msg = f"Unknown calculation mode `{mode}`"
+            logger.error(msg)
+            raise ValueError(msg)
+        if not issubclass(engine_class, ZBTACore):
+            raise TypeError("The engine class must be a ZBTACore")
+        self._engine_class = engine_class
+        self._mode = mode
+        self._allocations = allocations
+        self._repeat = max(1, repeat)
+        self._samples = []
+        self._nb_payloads = 0
+
+    @property
+    def samples(self) -> List[AttributeSample]:
+        """Returns the samples recorded, one per attribute, payload and
+        pass."""
+        return self._samples
+
+    @property
+    def nb_payloads(self) -> int:
+        return self._nb_payloads
+
+    def _calculators(
+        self,
+        btanalyzer: BTAnalyzer
+    ) -> List[Callable[[], object]]:
+        """Returns the function computing every attribute as
+        `calculate_attributes` does."""
+        engine = self._engine_class(btanalyzer)
+        columnar = ColumnarEngine(btanalyzer) \
+            if self._mode == "columnar" else None
+        calculators = []
+        for el in engine.registry():
+            if columnar is not None and el.spec is not None:
+                calculators.append(
+                    lambda el=el: columnar.evaluate({el.method: el.spec}))
+            else:
+                calculators.append(getattr(engine, el.method))
+        return calculators
+
+    def profile_analyzer(
+        self,
+        analyze: Callable[[], BTAnalyzer],
+        label: str = ""
+    ) -> None:
+        """Profiles the attributes of a report. The samples are recorded
+        only if all the passes succeed.
+
+        Parameters
+        ----------
+        analyze : Callable[[], BTAnalyzer]
+            returns a fresh analyzer of the report, called once per pass
+        label : str, optional
+            the name of the payload in the samples, by default ""
+        """
+        methods = [el.method for el in self._engine_class.registry()]
+        samples = []
+        for _ in range(self._repeat):
+            for method, calculate in zip(
+                    methods, self._calculators(analyze())):
+                with counting_rows() as counter:
+                    start = time.perf_counter_ns()
+                    calculate()
+                    wall = time.perf_counter_ns() - start
+                samples.append(AttributeSample(
+                    label, method, wall, counter.rows))
+        if self._allocations:
+            allocations = self._measure_allocations(methods, analyze)
+            samples = [
+                el._replace(alloc_peak_bytes=allocations[el.method][0],
+                            alloc_net_bytes=allocations[el.method][1])
+                for el in samples]
+        self._samples.extend(samples)
+
+    def _measure_allocations(
+        self,
+        methods: List[str],
+        analyze: Callable[[], BTAnalyzer]
+    ) -> Dict[str, Tuple[Optional[int], int]]:
+        """Returns the peak (None before python 3.9) and net bytes
+        allocated by every attribute, in a pass of their own."""
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            calculators = self._calculators(analyze())
+            allocations = {}
+            for method, calculate in zip(methods, calculators):
+                if hasattr(tracemalloc, "reset_peak"):  # python >= 3.9
+                    tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                calculate()
+                current, peak = tracemalloc.get_traced_memory()
+                allocations[method] = (
+                    max(0, peak - before)
+                    if hasattr(tracemalloc, "reset_peak") else None,
+                    current - before)
+        finally:
+            if started:
+                tracemalloc.stop()
+        return allocations
+
+    def profile_payload(
+        self,
+        payload: Union[str, bytes, Dict],
+        label: str = ""
+    ) -> None:
+        """Profiles the attributes of a payload of the API.
+
+        Parameters
+        ----------
+        payload : Union[str, bytes, Dict]
+            the json request, a decoded request is copied for every pass
+        label : str, optional
+            the name of the payload in the samples, by default ""
+
+        Raises
+        ------
+        APIError
+            if the payload is invalid.
+        """
+        if isinstance(payload, dict):  # the analysis may modify it
+            payload = json.dumps(payload)
+        self.profile_analyzer(
+            lambda: APIConnector(payload).analyze(), label=label)
+        self._nb_payloads += 1
+
+    def profile_file(self, path: str) -> None:
+        """Profiles the attributes of the payload of a json file."""
+        with open(path, "rb") as hh:
+            self.profile_payload(hh.read(), label=os.path.basename(path))
+
+    def profile_corpus(self, paths: Iterable[str]) -> None:
+        """Profiles the payloads of json files, the invalid ones are
+        logged and skipped."""
+        for path in paths:
+            try:
+                self.profile_file(path)
+            except Exception as err:
+                logger.error("skipping `%s`: %s", path, err)
+
+    def report(self, attributes_csv: Optional[str] = None) -> pd.DataFrame:
+        """Returns the cost of the attributes, the most expensive first.
+
+        Parameters
+        ----------
+        attributes_csv : str, optional
+            the metadata of the attributes, a csv generated by
+            `create_list_attributes_csv`, by default the registry of the
+            engine class. The attributes missing from the csv are kept.
+
+        Returns
+        -------
+        pd.DataFrame
+            one row per attribute, the metadata columns then the costs:
+            the times per call in milliseconds, `share` of the time of all
+            the attributes, the mean rows scanned per call and the mean
+            allocations per payload in kilobytes
+        """
+        if attributes_csv is not None:
+            metadata = pd.DataFrame(
+                load_list_attributes_csv(attributes_csv),
+                columns=__ATTRIBUTES_CSV_COLUMNS__)
+        else:
+            metadata = pd.DataFrame(
+                [el.as_row() for el in self._engine_class.registry()],
+                columns=__ATTRIBUTES_CSV_COLUMNS__)
+        if not self._samples:
+            return pd.DataFrame(
+                columns=__ATTRIBUTES_CSV_COLUMNS__ + __REPORT_COLUMNS__)
+        samples = pd.DataFrame(self._samples, columns=AttributeSample._fields)
+        samples["wall_ms"] = samples["wall_ns"] / 1e6
+        grouped = samples.groupby("method")
+        costs = pd.DataFrame({
+            "calls": grouped.size(),
+            "total_ms": grouped["wall_ms"].sum(),
+            "mean_ms": grouped["wall_ms"].mean(),
+            "median_ms": grouped["wall_ms"].median(),
+            "p95_ms": grouped["wall_ms"].quantile(.95),
+            "max_ms": grouped["wall_ms"].max(),
+            "rows_scanned": grouped["rows_scanned"].mean(),
+            "alloc_peak_kb": grouped["alloc_peak_bytes"].mean() / 1024,
+            "alloc_net_kb": grouped["alloc_net_bytes"].mean() / 1024,
+        })
+        costs["share"] = costs["total_ms"] / costs["total_ms"].sum()
+        costs["ns_per_row"] = (costs["mean_ms"] * 1e6 / costs[
+            "rows_scanned"]).where(costs["rows_scanned"] > 0)
+        costs = costs.sort_values("total_ms", ascending=False)
+        costs["rank"] = range(1, len(costs) + 1)
+        costs = costs.rename_axis("Method").reset_index()
+        report = costs.merge(metadata, on="Method", how="left")
+        return report[__ATTRIBUTES_CSV_COLUMNS__ + __REPORT_COLUMNS__]
+
+    def to_csv(self, path: str, attributes_csv: Optional[str] = None) -> None:
+        """Writes the report to a csv file, see `report`."""
+        self.report(attributes_csv).to_csv(path, index=False)
+
+    def to_html(self, path: str, attributes_csv: Optional[str] = None) -> None:
+        """Writes the report to a standalone html page, see `report`."""
+        report = self.report(attributes_csv)
+        title = f"Cost of the attributes ({self._nb_payloads} payloads, " \
+            f"{self._mode} mode)"
+        table = report.to_html(
+            index=False, na_rep="", float_format=lambda el: f"{el:.3f}",
+            classes="report", border=0)
+        with open(path, "w", encoding="utf8") as hh:
+            hh.write(
+                "<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">"
+                f"<title>{title}</title><style>"
+                "body{font-family:sans-serif}"
+                "table.report{border-collapse:collapse;font-size:13px}"
+                "table.report th,table.report td{padding:3px 8px;"
+                "border-bottom:1px solid #ddd;text-align:right}"
+                "table.report td:nth-child(-n+5){text-align:left}"
+                "</style></head><body>"
+                f"<h1>{title}</h1>\n{table}\n</body></html>\n")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Ranks the attributes by cost over a corpus of payloads.")
+    parser.add_argument("payloads", nargs="+",
+                        help="json files, one payload per file")
+    parser.add_argument("--mode", default="columnar",
+                        choices=AttributeProfiler.__MODES__)
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="timed passes per payload")
+    parser.add_argument("--no-allocations", action="store_true",
+                        help="skip the tracemalloc pass")
+    parser.add_argument("--attributes-csv", default=None,
+                        help="metadata of the attributes, by default the "
+                        "registry")
+    parser.add_argument("--csv", default=None, help="csv report")
+    parser.add_argument("--html", default=None, help="html report")
+    parser.add_argument("--top", type=int, default=20,
+                        help="number of attributes printed")
+    args = parser.parse_args(argv)
+
+    profiler = AttributeProfiler(
+        mode=args.mode, allocations=not args.no_allocations,
+        repeat=args.repeat)
+    profiler.profile_corpus(args.payloads)
+    if profiler.nb_payloads == 0:
+        logger.error("no valid payload")
+        return 1
+    report = profiler.report(args.attributes_csv)
+    with pd.option_context("display.width", 200,
+                           "display.max_columns", 20):
+        print(report[["rank", "Method", "Attribute Code", "total_ms",
+                      "share", "median_ms", "rows_scanned",
+                      "alloc_peak_kb"]].head(args.top).to_string(
+                          index=False))
+    if args.csv is not None:
+        report.to_csv(args.csv, index=False)
+    if args.html is not None:
+        profiler.to_html(args.html, args.attributes_csv)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
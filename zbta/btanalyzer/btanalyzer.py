@@ -1,23 +1,23 @@
-from zbta.parsers.fiserv import ReportFiserv
 from zbta.btanalyzer.salary_like_tagger import SalaryLikeTagger
 from zbta.btanalyzer.internal_transfer_algo import InternalTransferTagger
+from zbta.btanalyzer.time_index import TransactionTimeIndex
+from zbta.btanalyzer.keyword_matcher import get_contained_matcher, get_exact_matcher
 from zbta.btanalyzer.assets.us_states import __DICT_STATES_US__
 from zbta.btanalyzer.assets.categories_general_match import __DICT_CATEGORIES_GENERAL_MATCH__
 from zbta.btanalyzer.assets.categories_general_contained import __DICT_CATEGORIES_GENERAL_CONTAINED__
 from zbta.btanalyzer.assets.categories_salary_like_fp import __DICT_EXCLUSIONS_SALARY_LIKE_FP__
 from zbta.btanalyzer.assets.categories_priorities import __DICT_CATEGORIES_PRIORITIES__
-from typing import Dict, List, Union, Optional
+from zbta.core.tracing import span
+from typing import TYPE_CHECKING, Dict, List, Union, Optional
 import pandas as pd
 import numpy as np
 import logging
+from zbta.core.logs import get_logger
 
-logger = logging.getLogger(__name__)
-fh = logging.StreamHandler()
-fh_formatter = logging.Formatter(
-    "[%(levelname)s] [%(asctime)s] [%(funcName)s] %(message)s")
-fh.setFormatter(fh_formatter)
-logger.addHandler(fh)
-logger.setLevel(logging.ERROR)
+if TYPE_CHECKING:  # the parsers are imported on first use
+    from zbta.parsers.fiserv import ReportFiserv
+
+logger = get_logger(__name__, logging.ERROR)
 
 
 class BTAnalyzer:
@@ -34,7 +34,7 @@ class BTAnalyzer:
 
     def __init__(
         self,
-        report: ReportFiserv,
+        report: "ReportFiserv",
         # dictionary of words to tag with exact match
         dict_kw_id_match: Dict = __DICT_CATEGORIES_GENERAL_MATCH__,
         # dictionary of words to tag, if they are contained
@@ -58,13 +58,17 @@ class BTAnalyzer:
         # do salary_like
         do_salary_like: bool = True,
         # enforce priorities on categories
-        do_enforce_priorities: bool = True
+        do_enforce_priorities: bool = True,
+        # compute the daily figures and the PII only when first accessed
+        lazy: bool = False
     ) -> None:
         self._report = report
         self._dfs = self._report.dfs
-        self._dfs_daily = self._report.dfs_daily
+        self._lazy = lazy
         self._dict_kw_id_match = dict_kw_id_match
+        self._exact_matcher = get_exact_matcher(dict_kw_id_match)
         self._dict_kw_id_contained = dict_kw_id_contained
+        self._contained_matcher = get_contained_matcher(dict_kw_id_contained)
         self._dict_salary_like_fp = dict_salary_like_fp
         self._dict_enforce_priorities = dict_enforce_priorities
         self._limit_kw_id_match = limit_kw_id_match
@@ -83,21 +87,28 @@ class BTAnalyzer:
         self._states = []
         self._emails = []
         self._phone_numbers = []
+        self._kycs_consolidated = False
         self._nb_trans = 0
         self._nb_inc_trans = 0
         self._nb_out_trans = 0
         self._nb_overdrafts_trans = 0
-        self._nb_overdrafts_days = 0
+        self._nb_overdrafts_days = None
         self._nb_accounts = 0
+        self._time_index = None
+        self._daily_time_index = None
         self._clean_up_description()
-        self._categorize_transactions()
+        with span("analyze.categorize"):
+            self._categorize_transactions()
         self._count_inc_out_over()
         self._validate_transactions()
-        self._consolidate_kycs()
+        if not self._lazy:
+            self._consolidate_kycs()
         if self._do_internal_transfers:
-            self._tag_internal_transfers()
+            with span("analyze.internal_transfers"):
+                self._tag_internal_transfers()
         if self._do_salary_like:
-            self._tag_salary_like()
+            with span("analyze.salary_like"):
+                self._tag_salary_like()
         if self._do_enforce_priorities:
             self._enforce_priorities()
 
@@ -107,10 +118,45 @@ class BTAnalyzer:
 
     @property
     def dfs_daily(self) -> pd.DataFrame:
-        return self._dfs_daily
+        return self._report.dfs_daily
+
+    @property
+    def is_daily_built(self) -> bool:
+        """Returns True once the daily balances are built, the reports
+        that do not build them lazily always have them."""
+        return getattr(self._report, "is_daily_built", True)
+
+    @property
+    def time_index(self) -> TransactionTimeIndex:
+        """Returns the date index of the tagged transactions, built on
+        first access.
+
+        Returns
+        -------
+        TransactionTimeIndex
+            the index over `dfs`
+        """
+        if self._time_index is None:
+            self._time_index = TransactionTimeIndex(self._dfs)
+        return self._time_index
 
     @property
-    def report(self) -> ReportFiserv:
+    def daily_time_index(self) -> TransactionTimeIndex:
+        """Returns the date index of the daily balances, built on first
+        access.
+
+        Returns
+        -------
+        TransactionTimeIndex
+            the index over `dfs_daily`
+        """
+        if self._daily_time_index is None:
+            self._daily_time_index = TransactionTimeIndex(
+                self.dfs_daily, amount_column=None)
+        return self._daily_time_index
+
+    @property
+    def report(self) -> "ReportFiserv":
         return self._report
 
     @property
@@ -119,6 +165,9 @@ class BTAnalyzer:
 
     @property
     def nb_overdrafts_days(self) -> int:
+        if self._nb_overdrafts_days is None:
+            self._nb_overdrafts_days = (
+                self.dfs_daily["balance"] < 0).sum()
         return self._nb_overdrafts_days
 
     @property
@@ -129,6 +178,41 @@ class BTAnalyzer:
     def nb_inc_trans(self) -> int:
         return self._nb_inc_trans
 
+    @property
+    def names(self) -> List[str]:
+        self._consolidate_kycs()
+        return self._names
+
+    @property
+    def emails(self) -> List[str]:
+        self._consolidate_kycs()
+        return self._emails
+
+    @property
+    def phone_numbers(self) -> List[str]:
+        self._consolidate_kycs()
+        return self._phone_numbers
+
+    @property
+    def streets(self) -> List[str]:
+        self._consolidate_kycs()
+        return self._streets
+
+    @property
+    def cities(self) -> List[str]:
+        self._consolidate_kycs()
+        return self._cities
+
+    @property
+    def zipcodes(self) -> List[str]:
+        self._consolidate_kycs()
+        return self._zipcodes
+
+    @property
+    def states(self) -> List[str]:
+        self._consolidate_kycs()
+        return self._states
+
     def _clean_up_description(self) -> None:
         """creates a cleaned up version of the description.
         """
@@ -156,12 +240,6 @@ class BTAnalyzer:
         2. The others they must be exactly in there.
         """
 
-        self._split_description = self._lower_description.str.split(
-            expand=True)
-
-        self._split_clean_description = self._clean_description.str.split(
-            expand=True)
-
         # Im here. This needs to be re-written/adapted
         # filter out the category to match
         if self._limit_kw_id_match != "none":
@@ -175,22 +253,14 @@ class BTAnalyzer:
                 self._dict_kw_id_match = {key: val for key, val in self._dict_kw_id_match.items(
                 ) if key in self._limit_kw_id_match}
 
+            # every word of a description is looked up once
+            keyword_in_description = self._exact_matcher.match(
+                self._lower_description,
+                self._clean_description,
+                categories=list(self._dict_kw_id_match)
+            )
             for category in self._dict_kw_id_match:
-                self._dfs[category] = False
-                for keyword in self._dict_kw_id_match[category]:
-                    # we need to use the full description if the keyword contains a digit
-                    # to time this
-                    if any(char.isdigit() for char in keyword):
-                        keyword_in_description = \
-                            (self._split_description == keyword).sum(
-                                axis=1).astype(bool)
-                    else:
-                        keyword_in_description = \
-                            (self._split_clean_description == keyword).sum(
-                                axis=1).astype(bool)
-
-                    self._dfs[category] = \
-                        self._dfs[category] | keyword_in_description
+                self._dfs[category] = keyword_in_description[category]
         if self._limit_kw_id_contained != "none":
             if self._limit_kw_id_contained != []:
                 if 'is_transfer' not in self._limit_kw_id_contained and self._do_internal_transfers:
@@ -202,20 +272,17 @@ class BTAnalyzer:
                 self._dict_kw_id_contained = {key: val for key, val in self._dict_kw_id_contained.items(
                 ) if key in self._limit_kw_id_contained}
 
+            # all the keywords are searched in one pass per description
+            keyword_in_description = self._contained_matcher.match(
+                self._lower_description,
+                self._clean_description,
+                categories=list(self._dict_kw_id_contained)
+            )
             for category in self._dict_kw_id_contained:
                 if category not in self._dfs:
                     self._dfs[category] = False
-                for keyword in self._dict_kw_id_contained[category]:
-                    # we need to use the full description if the keyword contains a digit
-                    if any(char.isdigit() for char in keyword):
-                        keyword_in_description = \
-                            self._lower_description.str.contains(keyword)
-                    else:
-                        keyword_in_description = \
-                            self._clean_description.str.contains(keyword)
-
-                    self._dfs[category] = \
-                        self._dfs[category] | keyword_in_description
+                self._dfs[category] = \
+                    self._dfs[category] | keyword_in_description[category]
 
         # clean up salary tagging to only positive
         if "is_salary" in self._dfs.columns.tolist():
@@ -233,13 +300,13 @@ class BTAnalyzer:
 
         # # Nweek, Month, Nday
         if self._do_nweek_nmonth_id:
-            self._dfs.loc[:, "month"] = (
-                self._dfs["date"].dt.month)
-            self._dfs.loc[:, "week"] = (
-                self._dfs["date"].dt.isocalendar().week)
+            self._dfs["month"] = (
+                self._dfs["date"].dt.month.astype(np.int8))
+            self._dfs["week"] = (
+                self._dfs["date"].dt.isocalendar().week.astype(np.int8))
 
-            self._dfs.loc[:, "day"] = (
-                self._dfs["date"].dt.dayofyear)
+            self._dfs["day"] = (
+                self._dfs["date"].dt.dayofyear.astype(np.int16))
 
     def _add_prop(self, prop, vector):
         """
@@ -263,8 +330,11 @@ class BTAnalyzer:
 
     def _consolidate_kycs(self):
         """
-        Extract and consolidates the PII from the accounts.
+        Extract and consolidates the PII from the accounts, once.
         """
+        if self._kycs_consolidated:
+            return
+        self._kycs_consolidated = True
         self._names = []
         self._streets = []
         self._cities = []
@@ -274,30 +344,30 @@ class BTAnalyzer:
         self._phone_numbers = []
 
         for account in self._report.accounts:
-            for name in account._owners_names:
+            for name in account.owners_names:
                 name = name.lower()
                 self._names = self._add_prop(name, self._names)
 
-            for email in account._email_addresses:
+            for email in account.email_addresses:
                 email = email.lower()
                 self._emails = self._add_prop(email, self._emails)
 
-            for phone in account._phone_numbers:
+            for phone in account.phone_numbers:
                 self._phone_numbers = self._add_prop(
                     phone, self._phone_numbers)
 
-            for street in account._streets:
+            for street in account.streets:
                 street = street.lower()
                 self._streets = self._add_prop(street, self._streets)
 
-            for city in account._cities:
+            for city in account.cities:
                 city = city.lower()
                 self._cities = self._add_prop(city, self._cities)
 
-            for zipcode in account._zipcodes:
+            for zipcode in account.zipcodes:
                 self._zipcodes = self._add_prop(zipcode, self._zipcodes)
 
-            for state in account._states:
+            for state in account.states:
                 state = state.upper()
                 if state in __DICT_STATES_US__.keys():
                     state = __DICT_STATES_US__[state]
@@ -334,8 +404,9 @@ class BTAnalyzer:
         self._nb_overdrafts_trans = (
             self._dfs["balance_acct"] < 0).sum()
 
-        self._nb_overdrafts_days = (
-            self._dfs_daily["balance"] < 0).sum()
+        if not self._lazy:
+            self._nb_overdrafts_days = (
+                self.dfs_daily["balance"] < 0).sum()
 
         self._nb_accounts = self._report.nb_accounts
 
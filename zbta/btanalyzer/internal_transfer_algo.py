@@ -1,7 +1,8 @@
 import numpy as np
 import pandas as pd
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from strsimpy.jaccard import Jaccard
+from zbta.core.buffers import get_buffer_pool
 
 
 class InternalTransferTagger:
@@ -30,10 +31,10 @@ class InternalTransferTagger:
             dtype=np.int64
         )
 
-        for record in transactions:
-            if record[4] == 1:
-                is_internal[record[0]] = record[4]
-                matched_transaction[record[0]] = record[5]
+        flagged = transactions[:, 4] == 1
+        is_internal[transactions[flagged, 0]] = 1
+        matched_transaction[transactions[flagged, 0]] = \
+            transactions[flagged, 5]
 
         self._dfs["is_internal"] = is_internal.astype(bool)
         self._dfs["matched_internal"] = matched_transaction
@@ -47,46 +48,69 @@ class InternalTransferTagger:
         """
         return self._dfs
 
+    @staticmethod
+    def _bucket_transactions(
+        transactions: np.ndarray
+    ) -> Dict[Tuple[int, int], List[int]]:
+        """
+        Group the transactions by date and amount.
+
+        Parameters
+        ----------
+        transactions : np.ndarray
+             numpy array with the transactions info
+
+        Returns
+        -------
+        Dict[Tuple[int, int], List[int]]
+            the rows of the array of every (date, amount in cents), in the
+            order of the array
+        """
+        buckets = {}
+        for row, key in enumerate(zip(
+                transactions[:, 2].tolist(), transactions[:, 3].tolist())):
+            buckets.setdefault(key, []).append(row)
+        return buckets
+
     @staticmethod
     def _is_internal_transfer(
-        transfer: int,
+        row: int,
         transactions: np.ndarray,
-        descriptions: np.ndarray
+        descriptions: np.ndarray,
+        buckets: Dict[Tuple[int, int], List[int]]
     ) -> Optional[int]:
         """
         Check if a transfer is internal or not.
 
         Parameters
         ----------
-        transfer : int
-            transaction index of the transfer to be checked
+        row : int
+            row of the transfer to be checked in the transactions array
         transactions : np.ndarray
              numpy array with the transactions info
+        descriptions : np.ndarray
+            numpy array with the transaction descriptions
+        buckets : Dict[Tuple[int, int], List[int]]
+            the rows grouped by date and amount, see `_bucket_transactions`
 
         Returns
         -------
         Optional[int]
-            the transaction index of the matching transfer is there is
-            one, or None if there isn't
+            the row of the matching transfer is there is one, or None if
+            there isn't
         """
-        index = np.where(transactions[:, 0] == transfer)[0]
-        description = descriptions[index][0]
-        account = transactions[index, 1]
-        date = transactions[index, 2]
-        amount = transactions[index, 3]
+        description = descriptions[row]
+        account = transactions[row, 1]
+        date = int(transactions[row, 2])
+        amount = int(transactions[row, 3])
 
-        # mask by date as it is the most restrictive
+        # same day (as it is the most restrictive) and opposite amount
         # NOTE: This could made a bit  more lenient by adding a small delta
-        mask = transactions[:, 2] == date
-        transactions_day = transactions[mask]
-        descriptions_day = descriptions[mask]
-        # require a different account number and opposite amount
-        mask = transactions_day[:, 1] != account
-        mask = mask & (transactions_day[:, 3] == -amount)
-        mask = mask & (transactions_day[:, 4] == 0)
-
-        potential_matches = transactions_day[mask]
-        potential_matches_descriptions = descriptions_day[mask]
+        # require a different account number and a transfer not matched yet
+        potential_matches = [
+            el for el in buckets.get((date, -amount), [])
+            if transactions[el, 1] != account and transactions[el, 4] == 0
+        ]
         # then for each potential matches we retain the one with the 
         # smallest distance (highest similarity) using hte Jacard k=1 shingle
         # distance.
@@ -94,20 +118,20 @@ class InternalTransferTagger:
 
         if len(potential_matches) > 0:
             description_similarity = np.zeros(len(potential_matches))
-            for i in range(len(potential_matches)):
+            for i, match in enumerate(potential_matches):
                 description_similarity[i] = jacObj.distance(
                     description,
-                    potential_matches_descriptions[i]
+                    descriptions[match]
                 )
             maximum_similarity = np.argmin(description_similarity)
-            return potential_matches[maximum_similarity, 0]
+            return potential_matches[maximum_similarity]
         else:
             return None
 
     @staticmethod
     def _flag_internal_transfer(
-        transfer: int,
-        matched_transfer: int,
+        row: int,
+        matched_row: int,
         transactions: np.ndarray
     ) -> np.ndarray:
         """
@@ -115,10 +139,10 @@ class InternalTransferTagger:
 
         Parameters
         ----------
-        transfer : int
-            transaction index of the internal transfer
-        matched_transfer : int
-            transaction index of the complimentary internal transfer
+        row : int
+            row of the internal transfer in the transactions array
+        matched_row : int
+            row of the complimentary internal transfer
         transactions : np.ndarray
             numpy array with the transactions info
 
@@ -128,14 +152,11 @@ class InternalTransferTagger:
             a modified transactions array with the internal transfers
             information set
         """
-        transfer_index = np.where(transactions[:, 0] == transfer)[0]
-        transactions[transfer_index, 4] = 1
-        transactions[transfer_index, 5] = matched_transfer
+        transactions[row, 4] = 1
+        transactions[row, 5] = transactions[matched_row, 0]
 
-        matched_transfer_index = \
-            np.where(transactions[:, 0] == matched_transfer)[0]
-        transactions[matched_transfer_index, 4] = 1
-        transactions[matched_transfer_index, 5] = transfer
+        transactions[matched_row, 4] = 1
+        transactions[matched_row, 5] = transactions[row, 0]
 
         return transactions
 
@@ -152,7 +173,7 @@ class InternalTransferTagger:
         -------
         np.ndarray
             a numpy array with this 6 columns: transaction index,
-            account_no (int), date (epoch), amount (int, cents),
+            account_no (int), date (days since epoch), amount (int, cents),
             is_internal (int, zeros), matched index (int, -1)
         np.ndarray
             a numpy array containing the transaction descriptions
@@ -161,21 +182,20 @@ class InternalTransferTagger:
             self._dfs.is_transfer
         ]
 
-        transactions = np.zeros(
-            (len(transfers), 6),
-            dtype=np.int64
-        )
+        # borrowed from the buffer pool of the worker, given back by
+        # `tag_internal_transfers`
+        transactions = get_buffer_pool().borrow(
+            6 * len(transfers), dtype=np.int64, fill=0).reshape(
+                len(transfers), 6)
 
         transactions[:, 0] = \
             transfers.index.to_numpy(copy=True)
         transactions[:, 1] = \
             transfers.account_number.astype('category').cat.codes.to_numpy(copy=True)
         transactions[:, 2] = \
-            (transfers.date.view(np.int64)/1e9).view(np.int64).to_numpy(copy=True)
+            transfers.day_ordinal.to_numpy(dtype=np.int64)
         transactions[:, 3] = \
             (100*transfers.amount).to_numpy(copy=True)
-        transactions[:, 4] = np.zeros(len(transfers))
-        transactions[:, 5] = np.zeros(len(transfers))
 
         descriptions = transfers.description.to_numpy(copy=True)
 
@@ -188,26 +208,36 @@ class InternalTransferTagger:
         We also require that opposite transfer to happen on the same day.
         """
         transactions, descriptions = self._create_transactions_array()
-
-        prospective_internal_transfers = \
-            self._dfs[
-                (self._dfs.is_transfer) &
-                (self._dfs.amount > 0)
-            ].index
-
-        for transfer in prospective_internal_transfers:
-            matched_transfer = \
-                self._is_internal_transfer(
-                    transfer,
-                    transactions,
-                    descriptions
-                )
-            if matched_transfer is not None:
-                # if a matching transfer has been found --> update hte transaction table
-                transactions = self._flag_internal_transfer(
-                    transfer,
-                    matched_transfer,
-                    transactions
-                )
-
-        self._add_internal_to_dataframe(transactions)
\ No newline at end of file
+        try:
+            # the candidates are looked up by (date, amount) instead of
+            # scanning the whole array for every transfer
+            buckets = self._bucket_transactions(transactions)
+            rows = {index: row for row, index in enumerate(
+                transactions[:, 0].tolist())}
+
+            prospective_internal_transfers = \
+                self._dfs[
+                    (self._dfs.is_transfer) &
+                    (self._dfs.amount > 0)
+                ].index
+
+            for transfer in prospective_internal_transfers:
+                row = rows[transfer]
+                matched_row = \
+                    self._is_internal_transfer(
+                        row,
+                        transactions,
+                        descriptions,
+                        buckets
+                    )
+                if matched_row is not None:
+                    # if a matching transfer has been found --> update hte transaction table
+                    transactions = self._flag_internal_transfer(
+                        row,
+                        matched_row,
+                        transactions
+                    )
+
+            self._add_internal_to_dataframe(transactions)
+        finally:
+            get_buffer_pool().release(transactions)
@@ -0,0 +1,403 @@
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+from collections import deque
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple, Type
+import pandas as pd
+import numpy as np
+import logging
+from zbta.core.logs import get_logger
+
+logger = get_logger(__name__, logging.ERROR)
+
+# the keywords containing one of these are regular expressions for
+# `str.contains`, they are not compiled into the automaton.
+__REGEX_METACHARACTERS__ = frozenset(".^$*+?{}[]\\|()")
+# the matchers of the dictionaries, compiled ahead of time by
+# `compile_assets`, a file per dictionary and python version
+__COMPILED_ASSETS_DIR__ = os.path.join(os.path.dirname(__file__), "compiled")
+# bump when the state of a matcher changes
+__COMPILED_FORMAT__ = 1
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over a set of literal keywords.
+
+    Every keyword is attached to one or more labels. A single pass over a
+    text returns the labels of all the keywords contained in it, whatever
+    the number of keywords.
+    """
+
+    def __init__(self, keywords: Dict[str, FrozenSet[str]]) -> None:
+        """
+        Parameters
+        ----------
+        keywords : Dict[str, FrozenSet[str]]
+            the labels of every (non empty) keyword
+        """
+        self._goto = [{}]  # the trie, state -> {character: state}
+        self._output = [frozenset()]  # the labels emitted in every state
+        for keyword, labels in keywords.items():
+            state = 0
+            for char in keyword:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._output.append(frozenset())
+                state = nxt
+            self._output[state] = self._output[state] | labels
+        # failure links, breadth first so that the links of the shorter
+        # suffixes are known first
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._output[nxt] = \
+                    self._output[nxt] | self._output[self._fail[nxt]]
+
+    @property
+    def nb_states(self) -> int:
+        return len(self._goto)
+
+    @property
+    def tables(self) -> Tuple[List, List, List]:
+        """Returns the goto, failure and output tables."""
+        return self._goto, self._fail, self._output
+
+    @classmethod
+    def from_tables(
+        cls,
+        goto: List[Dict[str, int]],
+        fail: List[int],
+        output: List[FrozenSet[str]]
+    ) -> "KeywordAutomaton":
+        """Returns the automaton of tables returned by `tables`."""
+        automaton = cls.__new__(cls)
+        automaton._goto, automaton._fail, automaton._output = \
+            goto, fail, output
+        return automaton
+
+    def search(self, text: str) -> FrozenSet[str]:
+        """Returns the labels of all the keywords contained in the text.
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        found = set()
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return frozenset(found)
+
+
+class KeywordMatcher:
+    """Tags descriptions with the categories of a dictionary of keywords.
+    The keywords with a digit are searched in the lower case description,
+    the others in the clean description (letters and spaces only).
+
+    Every distinct description is searched once, see `_search`.
+    """
+
+    def __init__(self, dict_kw: Dict[str, List[str]]) -> None:
+        """
+        Parameters
+        ----------
+        dict_kw : Dict[str, List[str]]
+            the keywords of every category
+        """
+        self._categories = list(dict_kw)
+        self._regex = []  # (category, keyword, column) for `str.contains`
+
+    @property
+    def categories(self) -> List[str]:
+        return self._categories
+
+    @staticmethod
+    def _column(keyword: str) -> str:
+        return "lower" if any(char.isdigit() for char in keyword) \
+            else "clean"
+
+    def _search(self, column: str, description: str) -> FrozenSet[str]:
+        """Returns the categories of a description."""
+        raise NotImplementedError
+
+    def _get_tables(self) -> Any:
+        """Returns the compiled keywords, builtin types only."""
+        raise NotImplementedError
+
+    def _set_tables(self, tables: Any) -> None:
+        raise NotImplementedError
+
+    def dumps(self) -> bytes:
+        """Returns the compiled matcher, see `loads`."""
+        return marshal.dumps(
+            (self._categories, self._regex, self._get_tables()))
+
+    @classmethod
+    def loads(cls, data: bytes) -> "KeywordMatcher":
+        """Returns the matcher serialized by `dumps`, without compiling
+        the keywords again."""
+        categories, regex, tables = marshal.loads(data)
+        matcher = cls.__new__(cls)
+        matcher._categories = categories
+        matcher._regex = [tuple(el) for el in regex]
+        matcher._set_tables(tables)
+        return matcher
+
+    def _scan(
+        self,
+        descriptions: pd.Series,
+        column: str,
+        categories: List[str]
+    ) -> np.ndarray:
+        """Returns the (rows x categories) boolean hits of one column.
+        """
+        codes, uniques = pd.factorize(descriptions)
+        hits = np.zeros((len(uniques) + 1, len(categories)), dtype=bool)
+        position = {category: i for i, category in enumerate(categories)}
+        for i, description in enumerate(uniques):
+            for category in self._search(column, description):
+                if category in position:
+                    hits[i, position[category]] = True
+        return hits[codes]  # the code of a missing description is -1
+
+    def match(
+        self,
+        lower_description: pd.Series,
+        clean_description: pd.Series,
+        categories: Optional[Sequence[str]] = None
+    ) -> Dict[str, np.ndarray]:
+        """Tags the descriptions.
+
+        Parameters
+        ----------
+        lower_description : pd.Series
+            the lower case descriptions
+        clean_description : pd.Series
+            the clean descriptions, same index
+        categories : Sequence[str], optional
+            the categories to tag, by default all of them
+
+        Returns
+        -------
+        Dict[str, np.ndarray]
+            the boolean mask of every category, in the order of the series
+        """
+        categories = self._categories if categories is None else [
+            el for el in categories if el in self._categories]
+        hits = self._scan(lower_description, "lower", categories) | \
+            self._scan(clean_description, "clean", categories)
+        results = {
+            category: hits[:, i] for i, category in enumerate(categories)}
+        for category, keyword, column in self._regex:
+            if category not in results:
+                continue
+            description = lower_description if column == "lower" \
+                else clean_description
+            results[category] = results[category] | description.str.contains(
+                keyword, na=False).to_numpy(dtype=bool)
+        return results
+
+
+class ContainedKeywordMatcher(KeywordMatcher):
+    """Equivalent to one `str.contains` per keyword. The keywords are
+    compiled once into two `KeywordAutomaton`, one per column.
+    """
+
+    def __init__(self, dict_kw: Dict[str, List[str]]) -> None:
+        super().__init__(dict_kw)
+        keywords = {"lower": {}, "clean": {}}
+        for category, list_kw in dict_kw.items():
+            for keyword in list_kw:
+                column = self._column(keyword)
+                if not keyword or \
+                        __REGEX_METACHARACTERS__.intersection(keyword):
+                    self._regex.append((category, keyword, column))
+                    continue
+                keywords[column].setdefault(keyword, set()).add(category)
+        self._automata = {
+            column: KeywordAutomaton(
+                {kw: frozenset(labels) for kw, labels in kws.items()})
+            for column, kws in keywords.items()
+        }
+        logger.debug(
+            "compiled %s categories into %s states",
+            len(self._categories),
+            sum(el.nb_states for el in self._automata.values()))
+
+    def _search(self, column: str, description: str) -> FrozenSet[str]:
+        return self._automata[column].search(description)
+
+    def _get_tables(self) -> Dict[str, Tuple[List, List, List]]:
+        return {column: automaton.tables
+                for column, automaton in self._automata.items()}
+
+    def _set_tables(self, tables: Dict[str, Tuple[List, List, List]]) -> None:
+        self._automata = {
+            column: KeywordAutomaton.from_tables(*el)
+            for column, el in tables.items()}
+
+
+class ExactKeywordMatcher(KeywordMatcher):
+    """Equivalent to comparing every keyword with every word of the
+    descriptions (split on white spaces). The keywords are inverted into
+    a word -> categories map, one per column, so that a description costs
+    one lookup per word.
+    """
+
+    def __init__(self, dict_kw: Dict[str, List[str]]) -> None:
+        super().__init__(dict_kw)
+        words = {"lower": {}, "clean": {}}
+        for category, list_kw in dict_kw.items():
+            for keyword in list_kw:
+                if keyword.split() != [keyword]:
+                    continue  # can never be equal to a single word
+                words[self._column(keyword)].setdefault(
+                    keyword, set()).add(category)
+        self._words = {
+            column: {word: frozenset(labels) for word, labels in ws.items()}
+            for column, ws in words.items()
+        }
+
+    def _search(self, column: str, description: str) -> FrozenSet[str]:
+        words = self._words[column]
+        found = set()
+        for word in description.split():
+            if word in words:
+                found.update(words[word])
+        return frozenset(found)
+
+    def _get_tables(self) -> Dict[str, Dict[str, FrozenSet[str]]]:
+        return self._words
+
+    def _set_tables(self, tables: Dict[str, Dict[str, FrozenSet[str]]]) -> None:
+        self._words = tables
+
+
+def _freeze(dict_kw: Dict[str, List[str]]) -> Tuple:
+    return tuple((category, tuple(list_kw))
+                 for category, list_kw in dict_kw.items())
+
+
+__MATCHERS__ = {}  # cache of the compiled dictionaries
+
+
+def _compiled_path(
+    matcher: Type[KeywordMatcher],
+    dict_kw: Dict[str, List[str]],
+    directory: str = __COMPILED_ASSETS_DIR__
+) -> str:
+    """Returns the file of a compiled dictionary, keyed by its content."""
+    digest = hashlib.sha256(
+        repr((__COMPILED_FORMAT__, _freeze(dict_kw))).encode()).hexdigest()
+    return os.path.join(
+        directory, f"{matcher.__name__}-{digest[:16]}."
+                   f"{sys.implementation.cache_tag}.marshal")
+
+
+def _load_compiled(
+    matcher: Type[KeywordMatcher],
+    dict_kw: Dict[str, List[str]]
+) -> Optional[KeywordMatcher]:
+    path = _compiled_path(matcher, dict_kw)
+    try:
+        with open(path, "rb") as hh:
+            return matcher.loads(hh.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, TypeError) as err:
+        logger.warning("ignoring the compiled dictionary %s: %s", path, err)
+        return None
+
+
+def _get_matcher(
+    matcher: Type[KeywordMatcher],
+    dict_kw: Dict[str, List[str]]
+) -> KeywordMatcher:
+    key = (matcher.__name__, _freeze(dict_kw))
+    if key not in __MATCHERS__:
+        __MATCHERS__[key] = _load_compiled(matcher, dict_kw) or \
+            matcher(dict_kw)
+    return __MATCHERS__[key]
+
+
+def get_contained_matcher(
+    dict_kw: Dict[str, List[str]]
+) -> ContainedKeywordMatcher:
+    """Returns the matcher of a dictionary of categories, compiled on the
+    first call only.
+    """
+    return _get_matcher(ContainedKeywordMatcher, dict_kw)
+
+
+def get_exact_matcher(
+    dict_kw: Dict[str, List[str]]
+) -> ExactKeywordMatcher:
+    """Returns the matcher of a dictionary of categories, compiled on the
+    first call only.
+    """
+    return _get_matcher(ExactKeywordMatcher, dict_kw)
+
+
+def compile_assets(
+    directory: str = __COMPILED_ASSETS_DIR__,
+    dictionaries: Optional[
+        Sequence[Tuple[Type[KeywordMatcher], Dict[str, List[str]]]]] = None
+) -> List[str]:
+    """Compiles dictionaries ahead of time, e.g. when building the image of
+    a service: `get_exact_matcher` and `get_contained_matcher` then load
+    them instead of compiling them. A compiled file is only used by the
+    same python version and dictionary.
+
+    Parameters
+    ----------
+    directory : str, optional
+        the directory of the compiled files, by default the one searched
+        by the matchers
+    dictionaries : Sequence[Tuple[Type[KeywordMatcher], Dict]], optional
+        the matcher and the dictionary of every file, by default the
+        dictionaries of the `BTAnalyzer`
+
+    Returns
+    -------
+    List[str]
+        the files written
+    """
+    if dictionaries is None:
+        from zbta.btanalyzer.assets.categories_general_match import \
+            __DICT_CATEGORIES_GENERAL_MATCH__
+        from zbta.btanalyzer.assets.categories_general_contained import \
+            __DICT_CATEGORIES_GENERAL_CONTAINED__
+        dictionaries = [
+            (ExactKeywordMatcher, __DICT_CATEGORIES_GENERAL_MATCH__),
+            (ContainedKeywordMatcher, __DICT_CATEGORIES_GENERAL_CONTAINED__),
+        ]
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for matcher, dict_kw in dictionaries:
+        path = _compiled_path(matcher, dict_kw, directory)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as hh:
+            hh.write(matcher(dict_kw).dumps())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    paths = compile_assets(*sys.argv[1:2])
+    print(f"{len(paths)} matchers compiled: {', '.join(paths)}",
+          file=sys.stderr)
@@ -3,15 +3,11 @@ from datetime import timedelta
 from typing import List, Dict
 import numpy as np
 import logging
+from zbta.core.logs import get_logger
+from zbta.core.buffers import get_buffer_pool
 from zbta.btanalyzer.assets.categories_salary_like_fp import __DICT_EXCLUSIONS_SALARY_LIKE_FP__
 
-logger = logging.getLogger(__name__)
-fh = logging.StreamHandler()
-fh_formatter = logging.Formatter(
-    "[%(levelname)s] [%(asctime)s] [%(funcName)s] %(message)s")
-fh.setFormatter(fh_formatter)
-logger.addHandler(fh)
-logger.setLevel(logging.ERROR)
+logger = get_logger(__name__, logging.ERROR)
 
 
 class SalaryLikeTagger:
@@ -95,45 +91,141 @@ class SalaryLikeTagger:
         description = transactions.clean_description_salarylike.str.split().str[
             :nwords]
         transactions["description_split"] = description.astype(str).str.lower()
-        ntrans = transactions.shape[0]
 
-        for idx in range(ntrans-1):
-            splitdesc = transactions["description_split"].iloc[idx]
-            list_repeated = [idx]
-            for idx_second in range(idx+1, ntrans):
-                splitdesc_two = transactions["description_split"].iloc[
-                    idx_second]
-                stringbase = transactions["clean_description_salarylike"].iloc[
-                    idx_second]
-                if len(stringbase) == 0:
-                    continue
+        indices = self._find_salary_like(transactions, nminfreq, diffmonths)
+        if len(indices) > 0:
+            self._dfs.loc[indices, "is_salary_like"] = True
+            self._dfs.loc[
+                self._dfs.amount < 0, "is_salary_like"] = False
+
+    @staticmethod
+    def _is_repeated(
+        words: List[str],
+        ncases: int
+    ) -> bool:
+        """Whether a description is a repeat of another one, given the number
+        of its words found in the other one: if less or equal to 3 words
+        require all match, if 4 only 3 out of 4, else 4.
+        """
+        nlensplit = len(words)
+        if nlensplit <= 3 and ncases == nlensplit and ncases > 0:
+            return True
+        elif nlensplit == 4 and ncases >= 3:
+            return True
+        return ncases >= 4
+
+    def _match_descriptions(
+        self,
+        descriptions: List[str]
+    ) -> Dict[str, List[str]]:
+        """
+        Find, for every distinct description, the descriptions it repeats.
+
+        Parameters
+        ----------
+        descriptions : List[str]
+            the distinct descriptions (first words, see `description_split`)
 
-                ncases = np.isin(splitdesc.split(),
-                                 splitdesc_two.split()).sum()
-                nlensplit = len(splitdesc.split())
-                nlensplit2 = len(splitdesc_two.split())
-                # if less or equal to 3 words require all match else if 4 only 3 out of 4
-                if nlensplit <= 3 and ncases == nlensplit and nlensplit2 > 0 and ncases > 0:
-                    list_repeated.append(idx_second)
-                elif nlensplit == 4 and ncases >= 3:
-                    list_repeated.append(idx_second)
-                elif ncases >= 4:
-                    list_repeated.append(idx_second)
-
-            if len(list_repeated) < nminfreq:
+        Returns
+        -------
+        Dict[str, List[str]]
+            the descriptions matching every description
+        """
+        # inverted index: word -> descriptions containing it
+        inverted = {}
+        for description in descriptions:
+            for word in set(description.split()):
+                inverted.setdefault(word, []).append(description)
+
+        matches = {}
+        for description in descriptions:
+            words = description.split()
+            ncases = {}  # number of the words found in every description
+            for word in set(words):
+                count = words.count(word)
+                for other in inverted[word]:
+                    ncases[other] = ncases.get(other, 0) + count
+            matches[description] = [
+                other for other, nb in ncases.items()
+                if self._is_repeated(words, nb)]
+        return matches
+
+    def _find_salary_like(
+        self,
+        transactions: pd.DataFrame,
+        nminfreq: int,
+        diffmonths: int
+    ) -> pd.Index:
+        """
+        Find the transactions repeated at least `nminfreq` times in
+        `diffmonths` different months.
+
+        Every transaction but the last one is compared with all the
+        following transactions (with a non empty description). The
+        transactions are grouped by description so that the comparisons
+        are made once per pair of distinct descriptions.
+
+        Parameters
+        ----------
+        transactions : pd.DataFrame
+            the candidate transactions, with `description_split`
+        nminfreq : int
+            the minimum number of repeats, including the transaction itself
+        diffmonths : int
+            the minimum number of different months, checked if more than 1
+
+        Returns
+        -------
+        pd.Index
+            the index of the salary like transactions
+        """
+        ntrans = transactions.shape[0]
+        if ntrans < 2:
+            return transactions.index[:0]
+
+        keys = transactions["description_split"].to_numpy()
+        months = transactions["date"].dt.month.to_numpy()
+        nonempty = transactions[
+            "clean_description_salarylike"].str.len().to_numpy() > 0
+        matches = self._match_descriptions(list(pd.unique(keys)))
+
+        # positions of the transactions of every description that can be
+        # repeats, and the months found from every position onwards
+        positions = {}
+        for key in matches:
+            positions[key] = np.flatnonzero((keys == key) & nonempty)
+        suffix_months = {}
+        for key, pos in positions.items():
+            bits = np.left_shift(1, months[pos].astype(np.int64))
+            suffix_months[key] = np.append(
+                np.bitwise_or.accumulate(bits[::-1])[::-1], 0)
+
+        is_salary_like = np.zeros(ntrans, dtype=bool)
+        first_repeat = {}  # the first position tagged for every description
+        for idx in range(ntrans-1):
+            starts = {
+                key: np.searchsorted(positions[key], idx, side="right")
+                for key in matches[keys[idx]]}
+            nrepeated = 1 + sum(
+                len(positions[key]) - start for key, start in starts.items())
+            if nrepeated < nminfreq:
                 continue
 
             # Transactions in different months
             if diffmonths > 1:
-                Nmonths = len(transactions.iloc[list_repeated].loc[
-                    :, "date"].dt.month.unique())
-                if Nmonths < diffmonths:
+                month_bits = 1 << int(months[idx])
+                for key, start in starts.items():
+                    month_bits |= int(suffix_months[key][start])
+                if bin(month_bits).count("1") < diffmonths:
                     continue
 
-            indices = transactions.iloc[list_repeated].index
-            self._dfs.loc[indices, "is_salary_like"] = True
-            self._dfs.loc[
-                self._dfs.amount < 0, "is_salary_like"] = False
+            is_salary_like[idx] = True
+            for key, start in starts.items():
+                first_repeat[key] = min(first_repeat.get(key, start), start)
+
+        for key, start in first_repeat.items():
+            is_salary_like[positions[key][start:]] = True
+        return transactions.index[is_salary_like]
 
     def _limit_transaction_dataset(
         self,
@@ -179,47 +271,34 @@ class SalaryLikeTagger:
         last_date = self._get_last_date(last_date)
         first_date = last_date - timedelta(days=ndays)
 
-        temporal_mask = (dataset.date >= first_date) & (
-            dataset.date <= last_date)
-        amount_mask = dataset.amount.abs() > amt_thr
-
-        cashflow_mask = pd.Series(
-            np.ones(len(dataset)),
-            index=dataset.index,
-            dtype=bool
-        )
-
-        if is_inc:
-            cashflow_mask = cashflow_mask & (dataset.amount > 0)
-        if is_out:
-            cashflow_mask = cashflow_mask & (dataset.amount < 0)
-
-        if len(categories) >= 1:
-            category_mask = pd.Series(
-                np.zeros(len(dataset)),
-                index=dataset.index,
-                dtype=bool
-            )
-            for category in categories:
-                category_mask = category_mask | dataset[category]
-
-        else:
-            category_mask = pd.Series(
-                np.ones(len(dataset)),
-                index=dataset.index,
-                dtype=bool
-            )
-
-        external_mask = pd.Series(
-            np.ones(len(dataset)),
-            index=dataset.index,
-            dtype=bool
-        )
-        if remove_internal:
-            external_mask = external_mask & ~dataset["is_internal"]
-
-        return temporal_mask & amount_mask & cashflow_mask & category_mask \
-            & external_mask
+        # the mask is built in place, the temporaries are borrowed from the
+        # buffer pool of the worker
+        dates = dataset.date.to_numpy(dtype="datetime64[ns]")
+        mask = dates >= pd.Timestamp(first_date).to_datetime64()
+        amounts = dataset.amount.to_numpy(dtype=float)
+        pool = get_buffer_pool()
+        with pool.borrowed(len(dataset), dtype=float) as abs_amounts, \
+                pool.borrowed(len(dataset), dtype=bool) as scratch:
+            mask &= np.less_equal(
+                dates, pd.Timestamp(last_date).to_datetime64(), out=scratch)
+            np.abs(amounts, out=abs_amounts)
+            mask &= np.greater(abs_amounts, amt_thr, out=scratch)
+            if is_inc:
+                mask &= np.greater(amounts, 0, out=scratch)
+            if is_out:
+                mask &= np.less(amounts, 0, out=scratch)
+
+            if len(categories) >= 1:
+                scratch.fill(False)
+                for category in categories:
+                    scratch |= dataset[category].to_numpy(dtype=bool)
+                mask &= scratch
+
+            if remove_internal:
+                mask &= np.logical_not(
+                    dataset["is_internal"].to_numpy(dtype=bool), out=scratch)
+
+        return pd.Series(mask, index=dataset.index)
 
     def _get_last_date(
         self,
@@ -0,0 +1,161 @@
+from typing import Dict, Optional, Sequence, Tuple
+import pandas as pd
+import numpy as np
+from zbta.core.tracing import count_rows
+
+
+class TransactionTimeIndex:
+    """Date sorted index over a table of transactions (or balances).
+
+    The dates are sorted once. For every combination of filters that is
+    queried (a "channel": threshold, direction, categories, internal
+    transfers) the mask and the cumulative number of transactions are
+    computed once and cached, so that any count over a window becomes two
+    `searchsorted` lookups and a subtraction instead of full comparisons
+    over the table. The amounts are summed over the rows of the window
+    only (see `select`): a sum of prefix sums would not give the same
+    float as summing the masked column.
+    """
+
+    def __init__(
+        self,
+        dataset: pd.DataFrame,
+        date_column: str = "date",
+        amount_column: Optional[str] = "amount"
+    ) -> None:
+        self._dataset = dataset
+        self._amount_column = amount_column
+        dates = dataset[date_column].to_numpy(dtype="datetime64[ns]").view(
+            np.int64)
+        if np.all(dates[1:] >= dates[:-1]):
+            self._order = None  # already sorted, no need to permute
+            self._dates = dates
+        else:
+            self._order = np.argsort(dates, kind="stable")
+            self._dates = dates[self._order]
+        self._abs_amounts = None
+        self._channels = {}  # cache of the cumulative arrays per channel
+
+    @property
+    def size(self) -> int:
+        """Returns the number of rows indexed."""
+        return len(self._dates)
+
+    def _sorted(self, values: np.ndarray) -> np.ndarray:
+        if self._order is None:
+            return values
+        return values[self._order]
+
+    def bounds(
+        self,
+        first_date: pd.Timestamp,
+        last_date: pd.Timestamp
+    ) -> Tuple[int, int]:
+        """Returns the bounds, in the sorted order, of the rows with a date
+        within [first_date, last_date].
+
+        Parameters
+        ----------
+        first_date : pd.Timestamp
+            the first date of the window (included)
+        last_date : pd.Timestamp
+            the last date of the window (included)
+
+        Returns
+        -------
+        Tuple[int, int]
+            the lower (included) and upper (excluded) bounds
+        """
+        lo = np.searchsorted(
+            self._dates, pd.Timestamp(first_date).value, side="left")
+        hi = np.searchsorted(
+            self._dates, pd.Timestamp(last_date).value, side="right")
+        return int(lo), int(max(lo, hi))
+
+    def mask(
+        self,
+        first_date: pd.Timestamp,
+        last_date: pd.Timestamp
+    ) -> np.ndarray:
+        """Returns the boolean mask, in the order of the table, of the rows
+        with a date within [first_date, last_date].
+        """
+        lo, hi = self.bounds(first_date, last_date)
+        mask = np.zeros(self.size, dtype=bool)
+        if self._order is None:
+            mask[lo:hi] = True
+        else:
+            mask[self._order[lo:hi]] = True
+        return mask
+
+    def _get_abs_amounts(self) -> np.ndarray:
+        if self._abs_amounts is None:
+            if self._amount_column is None:
+                raise ValueError("The index was built without amounts")
+            self._abs_amounts = np.abs(self._dataset[
+                self._amount_column].to_numpy(dtype=float))
+        return self._abs_amounts
+
+    def _channel(
+        self,
+        amt_thr: float = 0,
+        is_inc: bool = False,
+        is_out: bool = False,
+        categories: Sequence[str] = (),
+        remove_internal: bool = False
+    ) -> Dict[str, np.ndarray]:
+        """Returns the cached arrays of a channel, in the sorted order.
+        The filters have the same meaning as in `limit_transaction_dataset`.
+        """
+        key = (amt_thr, is_inc, is_out, tuple(categories), remove_internal)
+        if key in self._channels:
+            return self._channels[key]
+        amounts = self._dataset[self._amount_column].to_numpy(dtype=float)
+        count_rows(self.size)
+        mask = self._get_abs_amounts() > amt_thr
+        if is_inc:
+            mask &= amounts > 0
+        if is_out:
+            mask &= amounts < 0
+        if len(categories) >= 1:
+            mask &= np.logical_or.reduce([
+                self._dataset[category].to_numpy(dtype=bool)
+                for category in categories])
+        if remove_internal:
+            mask &= ~self._dataset["is_internal"].to_numpy(dtype=bool)
+        mask = self._sorted(mask)
+        counts = np.zeros(len(mask) + 1, dtype=np.int64)
+        np.cumsum(mask, out=counts[1:])
+        self._channels[key] = {"mask": mask, "counts": counts}
+        return self._channels[key]
+
+    def count(
+        self,
+        first_date: pd.Timestamp,
+        last_date: pd.Timestamp,
+        **filters
+    ) -> int:
+        """Returns the number of transactions of the channel within
+        [first_date, last_date].
+        """
+        lo, hi = self.bounds(first_date, last_date)
+        counts = self._channel(**filters)["counts"]
+        return int(counts[hi] - counts[lo])
+
+    def select(
+        self,
+        first_date: pd.Timestamp,
+        last_date: pd.Timestamp,
+        **filters
+    ) -> np.ndarray:
+        """Returns the absolute amounts of the transactions of the channel
+        within [first_date, last_date], in the order of the table. Summing
+        them gives exactly the same float as summing the masked column.
+        """
+        lo, hi = self.bounds(first_date, last_date)
+        channel = self._channel(**filters)
+        count_rows(hi - lo)
+        if self._order is None:
+            return self._get_abs_amounts()[lo:hi][channel["mask"][lo:hi]]
+        rows = np.sort(self._order[lo:hi][channel["mask"][lo:hi]])
+        return self._get_abs_amounts()[rows]
@@ -0,0 +1,221 @@
+"""Scratch buffers reused across the requests of a long-lived worker.
+
+The stages of the pipeline allocate the same temporary arrays for every
+request (boolean masks, absolute amounts, the array of the internal
+transfers). They borrow them instead from the pool of their thread and
+give them back when done, so that a steady-state worker stops churning the
+allocator. A borrowed array must never escape the stage that borrowed it
+(e.g. become the storage of a returned Series).
+
+The garbage collector hooks are optional and meant for workers: freeze the
+objects created by the imports and the warm-up requests, and defer the
+collections to the end of every request.
+"""
+import gc
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+import numpy as np
+import logging
+from zbta.core.logs import get_logger
+
+logger = get_logger(__name__, logging.ERROR)
+
+# the smallest buffer allocated, in number of items
+__MIN_CAPACITY__ = 64
+# the maximum size of the free buffers kept by a pool
+__DEFAULT_POOL_BYTES__ = 64 << 20
+
+
+class BufferPool:
+    """Free list of 1d numpy buffers, bucketed by dtype and by capacity
+    (powers of two). `borrow` returns a view of the requested size over a
+    free buffer of the bucket, or over a new one.
+
+    A pool is not thread safe, see `get_buffer_pool` for the pool of the
+    current thread.
+    """
+
+    def __init__(self, max_bytes: int = __DEFAULT_POOL_BYTES__) -> None:
+        """
+        Parameters
+        ----------
+        max_bytes : int, optional
+            the maximum size of the free buffers kept, the buffers released
+            over it are left to the allocator, by default 64MB. 0 disables
+            the reuse.
+        """
+        self._max_bytes = max_bytes
+        self._free = {}  # (dtype, capacity) -> free buffers
+        self._lent = {}  # id -> buffers borrowed
+        self._nb_bytes = 0  # the size of the free buffers
+        self._nb_hits = 0
+        self._nb_misses = 0
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @property
+    def nb_bytes(self) -> int:
+        """Returns the size of the free buffers kept by the pool."""
+        return self._nb_bytes
+
+    @property
+    def nb_lent(self) -> int:
+        """Returns the number of buffers borrowed and not released."""
+        return len(self._lent)
+
+    @property
+    def nb_hits(self) -> int:
+        return self._nb_hits
+
+    @property
+    def nb_misses(self) -> int:
+        return self._nb_misses
+
+    @staticmethod
+    def _capacity(size: int) -> int:
+        return max(__MIN_CAPACITY__, 1 << max(size - 1, 0).bit_length())
+
+    def borrow(
+        self,
+        size: int,
+        dtype: np.dtype = np.float64,
+        fill: Optional[object] = None
+    ) -> np.ndarray:
+        """Borrows a 1d array.
+
+        Parameters
+        ----------
+        size : int
+            the number of items
+        dtype : np.dtype, optional
+            the dtype of the items, by default np.float64
+        fill : object, optional
+            the value of every item, by default the content is undefined
+
+        Returns
+        -------
+        np.ndarray
+            the array, to give back with `release`
+        """
+        dtype = np.dtype(dtype)
+        if dtype.hasobject:
+            raise ValueError("Object arrays cannot be pooled")
+        key = (dtype.str, self._capacity(size))
+        free = self._free.get(key)
+        if free:
+            buffer = free.pop()
+            self._nb_bytes -= buffer.nbytes
+            self._nb_hits += 1
+        else:
+            buffer = np.empty(key[1], dtype=dtype)
+            self._nb_misses += 1
+        self._lent[id(buffer)] = buffer
+        array = buffer[:size]
+        if fill is not None:
+            array.fill(fill)
+        return array
+
+    def release(self, array: np.ndarray) -> None:
+        """Gives back an array returned by `borrow` (or a view of it). The
+        array must not be used afterwards.
+
+        Raises
+        ------
+        ValueError
+            if the array was not borrowed from the pool.
+        """
+        buffer = array
+        while buffer.base is not None:
+            buffer = buffer.base
+        if self._lent.pop(id(buffer), None) is None:
+            raise ValueError("The array was not borrowed from this pool")
+        if self._nb_bytes + buffer.nbytes > self._max_bytes:
+            return
+        self._free.setdefault(
+            (buffer.dtype.str, len(buffer)), []).append(buffer)
+        self._nb_bytes += buffer.nbytes
+
+    @contextmanager
+    def borrowed(
+        self,
+        size: int,
+        dtype: np.dtype = np.float64,
+        fill: Optional[object] = None
+    ) -> Iterator[np.ndarray]:
+        """Borrows an array for the duration of a `with` block, see
+        `borrow`."""
+        array = self.borrow(size, dtype=dtype, fill=fill)
+        try:
+            yield array
+        finally:
+            self.release(array)
+
+    def clear(self) -> None:
+        """Drops the free buffers."""
+        self._free = {}
+        self._nb_bytes = 0
+
+
+__POOLS__ = threading.local()
+
+
+def get_buffer_pool() -> BufferPool:
+    """Returns the pool of the current thread, created on first use."""
+    pool = getattr(__POOLS__, "pool", None)
+    if pool is None:
+        pool = __POOLS__.pool = BufferPool()
+    return pool
+
+
+def set_buffer_pool(pool: BufferPool) -> None:
+    """Replaces the pool of the current thread, e.g. to change its size
+    or to disable the reuse with `BufferPool(max_bytes=0)`."""
+    __POOLS__.pool = pool
+
+
+def tune_gc(
+    thresholds: Optional[Tuple[int, int, int]] = None,
+    freeze: bool = True
+) -> None:
+    """Tunes the garbage collector of a worker, once it is warmed up.
+
+    Parameters
+    ----------
+    thresholds : Tuple[int, int, int], optional
+        the thresholds of the generations, see `gc.set_threshold`, by
+        default unchanged
+    freeze : bool, optional
+        move every object alive (modules, compiled dictionaries, schemas)
+        to the permanent generation, so that the collections stop
+        traversing them, by default True
+    """
+    if thresholds is not None:
+        gc.set_threshold(*thresholds)
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    logger.debug("gc thresholds %s, %s frozen objects",
+                 gc.get_threshold(), gc.get_freeze_count())
+
+
+@contextmanager
+def deferred_gc(generation: int = 0) -> Iterator[None]:
+    """Disables the automatic collections for the duration of a request
+    and runs a single collection at its end.
+
+    Parameters
+    ----------
+    generation : int, optional
+        the generation collected at the end, by default 0 (the youngest)
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+        gc.collect(generation)
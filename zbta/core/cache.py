@@ -0,0 +1,476 @@
+"""On-disk cache of the analyzed transactions.
+
+The tagged transactions (`BTAnalyzer.dfs`) and the daily balances
+(`BTAnalyzer.dfs_daily`) of a report are stored as a bundle of `.npy`
+files, one per column, and reopened memory-mapped: on a hit the numeric
+columns are not copied, only the text columns are decoded.
+
+An entry is keyed by a hash of the `bt_data` of the request and of the
+version of everything that drives the analysis (keyword dictionaries,
+tagger parameters, package version). The directories of the versions are
+named `v<format>-<16 hex>` and hold a marker file, the ones of another
+version are purged when the cache is opened (only those: the root of the
+cache may hold other directories). The least recently used entries are
+evicted when the cache grows over its size.
+
+The daily balances are built lazily by the analyzer (see
+`ReportFiserv.dfs_daily`). An entry stores them only if they were built
+when it was written, a hit without them rebuilds them on first access with
+the loader given to `AnalysisCache.get` and adds them to the entry.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from zbta.btanalyzer.time_index import TransactionTimeIndex
+from zbta.core.common import canonical_dumps, hash_version
+from zbta.parsers.registry import __DEFAULT_PROVIDER__
+import logging
+from zbta.core.logs import get_logger
+
+logger = get_logger(__name__, logging.ERROR)
+
+# bump when the layout of an entry changes
+__CACHE_FORMAT__ = 4
+__MASKED_ARRAYS__ = (
+    pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)
+__META_FILE__ = "meta.json"
+# written in the directory of every version, only the marked directories
+# are ever purged
+__MARKER_FILE__ = ".zbta-cache"
+__VERSION_DIRECTORY__ = re.compile(r"^v[0-9]+-[0-9a-f]{16}$")
+
+
+class CacheError(Exception):
+    """A frame cannot be stored in the cache.
+
+    Parameters
+    ----------
+    Exception : general exception error
+        the general exception.
+    """
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+def _save_frame(dataset: pd.DataFrame, directory: str, name: str) -> Dict:
+    """Saves every column of a frame in its own `.npy` file.
+
+    Returns
+    -------
+    Dict
+        the description of the frame, to reopen it with `_load_frame`
+
+    Raises
+    ------
+    CacheError
+        if the frame has a column or an index that cannot be stored.
+    """
+    if not isinstance(dataset.index, pd.RangeIndex):
+        raise CacheError(f"`{name}` does not have a RangeIndex")
+    columns = []
+    for icol, (column, values) in enumerate(dataset.items()):
+        path = os.path.join(directory, f"{name}.{icol}")
+        values = values.array
+        dtype = str(values.dtype)
+        if isinstance(values, pd.arrays.PandasArray) and \
+                values.dtype.numpy_dtype != object:
+            np.save(path + ".npy", values.to_numpy())
+            kind = "numpy"
+        elif isinstance(values, pd.arrays.DatetimeArray) and \
+                values.tz is None:
+            np.save(path + ".npy", values.to_numpy())
+            kind = "numpy"
+        elif isinstance(values, __MASKED_ARRAYS__):
+            np.save(path + ".npy", values.to_numpy(
+                dtype=values.dtype.numpy_dtype, na_value=0))
+            np.save(path + ".mask.npy", np.asarray(values.isna()))
+            kind = "masked"
+        elif isinstance(values, pd.Categorical):
+            categories = values.categories.tolist()
+            if not all(isinstance(el, (str, int, float))
+                       for el in categories):
+                raise CacheError(
+                    f"`{name}.{column}` has categories that are not json")
+            np.save(path + ".npy", values.codes)
+            with open(path + ".json", "w", encoding="utf8") as hh:
+                json.dump({"categories": categories,
+                           "ordered": bool(values.ordered)}, hh)
+            kind = "categorical"
+        elif isinstance(values, pd.arrays.PandasArray):
+            values = values.to_numpy().tolist()
+            if not all(el is None or isinstance(el, (str, int, float))
+                       for el in values):
+                raise CacheError(
+                    f"`{name}.{column}` has values that are not json")
+            with open(path + ".json", "w", encoding="utf8") as hh:
+                json.dump(values, hh)
+            kind = "object"
+        else:
+            raise CacheError(
+                f"`{name}.{column}` has an unsupported dtype {values.dtype}")
+        columns.append({"name": column, "kind": kind, "dtype": dtype})
+    return {"columns": columns, "index": [
+        dataset.index.start, dataset.index.stop, dataset.index.step]}
+
+
+def _load_frame(directory: str, name: str, meta: Dict) -> pd.DataFrame:
+    """Reopens a frame saved by `_save_frame`, memory-mapped."""
+    data = {}
+    for icol, column in enumerate(meta["columns"]):
+        path = os.path.join(directory, f"{name}.{icol}")
+        if column["kind"] == "numpy":
+            data[column["name"]] = np.load(path + ".npy", mmap_mode="r")
+        elif column["kind"] == "masked":
+            dtype = pd.api.types.pandas_dtype(column["dtype"])
+            if isinstance(dtype, pd.BooleanDtype):
+                array = pd.arrays.BooleanArray
+            elif dtype.kind == "f":
+                array = pd.arrays.FloatingArray
+            else:
+                array = pd.arrays.IntegerArray
+            data[column["name"]] = array(
+                np.load(path + ".npy", mmap_mode="r"),
+                np.load(path + ".mask.npy", mmap_mode="r"))
+        elif column["kind"] == "categorical":
+            with open(path + ".json", "r", encoding="utf8") as hh:
+                categories = json.load(hh)
+            data[column["name"]] = pd.Categorical.from_codes(
+                np.load(path + ".npy", mmap_mode="r"),
+                dtype=pd.CategoricalDtype(**categories))
+        else:
+            with open(path + ".json", "r", encoding="utf8") as hh:
+                values = json.load(hh)
+            array = np.empty(len(values), dtype=object)
+            array[:] = values
+            data[column["name"]] = array
+    return pd.DataFrame(
+        data, index=pd.RangeIndex(*meta["index"]), copy=False)
+
+
+class ReportSnapshot:
+    """The figures of a report needed by the attributes, restored from the
+    cache."""
+
+    def __init__(self, max_date: pd.Timestamp, min_date: pd.Timestamp,
+                 nb_accounts: int) -> None:
+        self._max_date = max_date
+        self._min_date = min_date
+        self._nb_accounts = nb_accounts
+
+    @property
+    def max_date(self) -> pd.Timestamp:
+        return self._max_date
+
+    @property
+    def min_date(self) -> pd.Timestamp:
+        return self._min_date
+
+    @property
+    def nb_accounts(self) -> int:
+        return self._nb_accounts
+
+
+class AnalyzerSnapshot:
+    """A read only stand-in for `BTAnalyzer`, restored from the cache: it
+    has the tables and the figures that the attributes use. The numeric
+    columns are memory-mapped and read only.
+    """
+
+    def __init__(
+        self,
+        dfs: pd.DataFrame,
+        dfs_daily: Optional[pd.DataFrame],
+        report: ReportSnapshot,
+        figures: Dict,
+        load_daily: Optional[Callable[[], pd.DataFrame]] = None
+    ) -> None:
+        """
+        Parameters
+        ----------
+        dfs : pd.DataFrame
+            the tagged transactions
+        dfs_daily : pd.DataFrame, optional
+            the daily balances, None if not stored
+        report : ReportSnapshot
+            the figures of the report
+        figures : Dict
+            the figures of the analyzer
+        load_daily : Callable[[], pd.DataFrame], optional
+            builds the daily balances if not stored, by default None
+        """
+        self._dfs = dfs
+        self._dfs_daily = dfs_daily
+        self._report = report
+        self._figures = figures
+        self._load_daily = load_daily
+        self._time_index = None
+        self._daily_time_index = None
+
+    @property
+    def dfs(self) -> pd.DataFrame:
+        return self._dfs
+
+    @property
+    def dfs_daily(self) -> pd.DataFrame:
+        if self._dfs_daily is None:
+            self._dfs_daily = self._load_daily()
+        return self._dfs_daily
+
+    @property
+    def report(self) -> ReportSnapshot:
+        return self._report
+
+    @property
+    def time_index(self) -> TransactionTimeIndex:
+        if self._time_index is None:
+            self._time_index = TransactionTimeIndex(self._dfs)
+        return self._time_index
+
+    @property
+    def daily_time_index(self) -> TransactionTimeIndex:
+        if self._daily_time_index is None:
+            self._daily_time_index = TransactionTimeIndex(
+                self._dfs_daily, amount_column=None)
+        return self._daily_time_index
+
+    @property
+    def nb_accounts(self) -> int:
+        return self._report.nb_accounts
+
+    @property
+    def nb_inc_trans(self) -> int:
+        return self._figures["nb_inc_trans"]
+
+    @property
+    def nb_overdrafts_trans(self) -> int:
+        return self._figures["nb_overdrafts_trans"]
+
+    @property
+    def nb_overdrafts_days(self) -> int:
+        if "nb_overdrafts_days" not in self._figures:
+            self._figures["nb_overdrafts_days"] = int(
+                (self.dfs_daily["balance"] < 0).sum())
+        return self._figures["nb_overdrafts_days"]
+
+
+class AnalysisCache:
+    """Size bounded on-disk cache of analyzed reports.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        version: str,
+        max_bytes: int = 1 << 30
+    ) -> None:
+        """
+        Parameters
+        ----------
+        directory : str
+            the root directory of the cache, shared by all the versions
+        version : str
+            the version of the analysis, see `hash_version`
+        max_bytes : int, optional
+            the maximum size of the entries, by default 1GB
+        """
+        self._root = directory
+        self._version = f"v{__CACHE_FORMAT__}-{version}"
+        self._directory = os.path.join(directory, self._version)
+        self._max_bytes = max_bytes
+        os.makedirs(self._directory, exist_ok=True)
+        open(os.path.join(self._directory, __MARKER_FILE__), "a").close()
+        self._purge_versions()
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    @property
+    def version(self) -> str:
+        return self._version
+
+    def _purge_versions(self) -> None:
+        """Removes the entries of the other versions, e.g. written before
+        the keyword dictionaries changed. Only the directories named as a
+        version and holding the marker of the cache are removed."""
+        for el in os.listdir(self._root):
+            path = os.path.join(self._root, el)
+            if el == self._version or \
+                    not __VERSION_DIRECTORY__.match(el) or \
+                    not os.path.isfile(os.path.join(path, __MARKER_FILE__)):
+                continue
+            logger.info("purging the cache version %s", el)
+            shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def key(request: Dict) -> str:
+        """Returns the key of a request: a hash of its `bt_data` and of its
+        data provider."""
+        return hashlib.sha256(canonical_dumps([
+            request["meta"].get("data_provider", __DEFAULT_PROVIDER__).lower(),
+            request["bt_data"]
+        ])).hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self._directory, key)
+
+    def get(
+        self,
+        key: str,
+        load_daily: Optional[Callable[[], pd.DataFrame]] = None
+    ) -> Optional[AnalyzerSnapshot]:
+        """Returns the snapshot of the analysis, None on a miss.
+
+        Parameters
+        ----------
+        key : str
+            the key of the request, see `key`
+        load_daily : Callable[[], pd.DataFrame], optional
+            builds the daily balances of the report if the entry does not
+            have them, they are then added to the entry. Without it such an
+            entry is a miss, by default None
+        """
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, __META_FILE__), "r",
+                      encoding="utf8") as hh:
+                meta = json.load(hh)
+            dfs = _load_frame(entry, "dfs", meta["dfs"])
+            dfs_daily = None
+            if meta["dfs_daily"] is not None:
+                dfs_daily = _load_frame(entry, "dfs_daily", meta["dfs_daily"])
+        except (OSError, ValueError, KeyError) as err:
+            if os.path.isdir(entry):
+                logger.error("corrupted cache entry %s: %s", key, err)
+                shutil.rmtree(entry, ignore_errors=True)
+            return None
+        if dfs_daily is None and load_daily is None:
+            return None
+        os.utime(entry)  # most recently used
+        report = ReportSnapshot(
+            max_date=pd.Timestamp(meta["report"]["max_date"]),
+            min_date=pd.Timestamp(meta["report"]["min_date"]),
+            nb_accounts=meta["report"]["nb_accounts"])
+
+        def fill_daily() -> pd.DataFrame:
+            dfs_daily = load_daily()
+            self._add_daily(key, dfs_daily)
+            return dfs_daily
+
+        return AnalyzerSnapshot(dfs, dfs_daily, report, meta["figures"],
+                                load_daily=fill_daily)
+
+    def _add_daily(self, key: str, dfs_daily: pd.DataFrame) -> None:
+        """Adds the daily balances to an entry that does not have them, the
+        metadata of the entry is replaced atomically."""
+        entry = self._entry(key)
+        meta_path = os.path.join(entry, __META_FILE__)
+        try:
+            with open(meta_path, "r", encoding="utf8") as hh:
+                meta = json.load(hh)
+            if meta["dfs_daily"] is not None:
+                return
+            meta["dfs_daily"] = _save_frame(dfs_daily, entry, "dfs_daily")
+            meta["figures"]["nb_overdrafts_days"] = int(
+                (dfs_daily["balance"] < 0).sum())
+            tmp = f"{meta_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf8") as hh:
+                json.dump(meta, hh)
+            os.replace(tmp, meta_path)
+        except (CacheError, OSError, ValueError, KeyError) as err:
+            logger.warning("not caching the daily balances of %s: %s",
+                           key, err)
+
+    def put(self, key: str, btanalyzer: Any) -> bool:
+        """Stores the analysis of a report, see `BTAnalyzer`. The daily
+        balances and the figures computed from them are only stored if the
+        analyzer already built them, storing does not build them.
+
+        Returns
+        -------
+        bool
+            whether the analysis was stored.
+        """
+        entry = self._entry(key)
+        if os.path.isdir(entry):
+            return True
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self._directory)
+        try:
+            figures = ["nb_inc_trans", "nb_overdrafts_trans"]
+            dfs_daily = None
+            if btanalyzer.is_daily_built:
+                figures.append("nb_overdrafts_days")
+                dfs_daily = _save_frame(
+                    btanalyzer.dfs_daily, tmp, "dfs_daily")
+            meta = {
+                "dfs": _save_frame(btanalyzer.dfs, tmp, "dfs"),
+                "dfs_daily": dfs_daily,
+                "report": {
+                    "max_date": btanalyzer.report.max_date.isoformat(),
+                    "min_date": btanalyzer.report.min_date.isoformat(),
+                    "nb_accounts": int(btanalyzer.report.nb_accounts)},
+                "figures": {
+                    el: int(getattr(btanalyzer, el)) for el in figures},
+            }
+            with open(os.path.join(tmp, __META_FILE__), "w",
+                      encoding="utf8") as hh:
+                json.dump(meta, hh)
+            os.rename(tmp, entry)
+        except CacheError as err:
+            logger.warning("not caching %s: %s", key, err)
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+        except OSError:  # stored by another process in the meantime
+            shutil.rmtree(tmp, ignore_errors=True)
+            return os.path.isdir(entry)
+        self.evict()
+        return True
+
+    def _entries(self) -> List[Dict]:
+        entries = []
+        for el in os.listdir(self._directory):
+            path = os.path.join(self._directory, el)
+            if el.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(path, name))
+                for name in os.listdir(path))
+            entries.append(
+                {"path": path, "size": size,
+                 "used": os.path.getmtime(path)})
+        return entries
+
+    def evict(self) -> int:
+        """Removes the least recently used entries until the cache fits in
+        its size.
+
+        Returns
+        -------
+        int
+            the number of entries removed
+        """
+        entries = sorted(self._entries(), key=lambda el: el["used"])
+        total = sum(el["size"] for el in entries)
+        nb_removed = 0
+        while entries and total > self._max_bytes:
+            entry = entries.pop(0)
+            shutil.rmtree(entry["path"], ignore_errors=True)
+            total -= entry["size"]
+            nb_removed += 1
+        return nb_removed
+
+    def clear(self) -> None:
+        shutil.rmtree(self._directory, ignore_errors=True)
+        os.makedirs(self._directory, exist_ok=True)
+        open(os.path.join(self._directory, __MARKER_FILE__), "a").close()
+
+    @property
+    def size(self) -> int:
+        """Returns the size of the entries in bytes."""
+        return sum(el["size"] for el in self._entries())
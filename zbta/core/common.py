@@ -1,7 +1,24 @@
-from typing import Dict, Tuple, Any
+from typing import Callable, Dict, List, Optional, Tuple, Any
 from collections import deque
+from copy import deepcopy
+import hashlib
+import json
+import numbers
 import re
-from jsonschema import ValidationError, validate, SchemaError
+# jsonschema is imported by the first validation, see `CompiledSchema`
+
+__VALIDATION_MODES__ = ["full", "fast"]
+# the keywords of the array items that the fast path checks itself, the
+# arrays whose items use any other keyword are always validated in full.
+__FAST_PATH_KEYWORDS__ = {
+    "type", "required", "properties", "enum", "description"}
+__FAST_PATH_TYPES__ = {
+    "string": str,
+    "number": numbers.Number,
+    "object": dict,
+    "array": list,
+    "boolean": bool,
+}
 
 
 class APIError(Exception):
@@ -51,12 +68,156 @@ def _get_validation_bad_key(path: deque, message: str) -> str:
             key = "."
     return key
 
-def validate_schema(obj: Dict, schema: Dict, schema_name: str) -> Tuple[bool, str]:
+def _compile_items_check(
+    schema: Dict
+) -> Optional[Callable[[List], bool]]:
+    """Compiles the schema of the items of an array into a check of all
+    the items at once, one column (property) at a time.
+
+    The check only says whether the items are valid: a positive answer is
+    the answer of jsonschema, a negative one must be confirmed by it, for
+    the error message. Returns None if the schema uses keywords outside of
+    `__FAST_PATH_KEYWORDS__`.
+    """
+    if not isinstance(schema, dict) or set(schema) - __FAST_PATH_KEYWORDS__:
+        return None
+    types = schema.get("type")
+    if types is not None:
+        types = [types] if isinstance(types, str) else types
+        if any(el not in __FAST_PATH_TYPES__ for el in types):
+            return None
+        pytypes = tuple(__FAST_PATH_TYPES__[el] for el in types)
+        allow_bool = "boolean" in types
+    enum = schema.get("enum")
+    if enum is not None:
+        if not all(isinstance(el, str) for el in enum):
+            return None
+        enum = set(enum)
+    required = schema.get("required", [])
+    properties = {}
+    for key, subschema in schema.get("properties", {}).items():
+        properties[key] = _compile_items_check(subschema)
+        if properties[key] is None:
+            return None
+
+    def check(values: List) -> bool:
+        if types is not None and not all(
+                isinstance(el, pytypes)
+                and (allow_bool or not isinstance(el, bool))
+                for el in values):
+            return False
+        if enum is not None and not all(
+                isinstance(el, str) and el in enum for el in values):
+            return False
+        if not required and not properties:
+            return True
+        objects = [el for el in values if isinstance(el, dict)]
+        if not all(el.keys() >= set(required) for el in objects):
+            return False
+        return all(
+            check_property([el[key] for el in objects if key in el])
+            for key, check_property in properties.items())
+
+    return check
+
+
+class CompiledSchema:
+    """A schema checked once against its meta schema, with its validator.
+
+    For the fast validation the items of the arrays with a simple enough
+    schema (e.g. the transactions of an account) are checked column by
+    column instead of item by item. The rest of the document is validated
+    by a validator of the schema without these items.
+    """
+
+    def __init__(self, schema: Dict) -> None:
+        from jsonschema.validators import validator_for
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        self._schema = schema
+        self._validator = cls(schema)
+        self._items_checks = []  # (path of the array, check of the items)
+        fast_schema = deepcopy(schema)
+        self._find_items_checks(fast_schema, [])
+        self._fast_validator = cls(fast_schema) if self._items_checks \
+            else None
+
+    def _find_items_checks(self, schema: Dict, path: List[str]) -> None:
+        for key, subschema in schema.get("properties", {}).items():
+            if not isinstance(subschema, dict):
+                continue
+            check = _compile_items_check(subschema.get("items"))
+            if check is not None:
+                del subschema["items"]
+                self._items_checks.append((path + [key], check))
+            else:
+                self._find_items_checks(subschema, path + [key])
+
+    def _check_items(self, obj: Any) -> bool:
+        for path, check in self._items_checks:
+            items = obj
+            for key in path:
+                if not isinstance(items, dict) or key not in items:
+                    items = None
+                    break
+                items = items[key]
+            if isinstance(items, list) and not check(items):
+                return False
+        return True
+
+    def validate(self, obj: Any, mode: str = "full") -> None:
+        """Validates `obj`, same as `jsonschema.validate`.
+
+        Raises
+        ------
+        ValidationError
+            the best match of the errors, if `obj` is not valid.
+        """
+        validator = self._validator
+        if mode == "fast" and self._fast_validator is not None \
+                and self._check_items(obj):
+            validator = self._fast_validator
+        from jsonschema.exceptions import best_match
+        error = best_match(validator.iter_errors(obj))
+        if error is not None:
+            raise error
+
+
+__COMPILED_SCHEMAS__ = {}  # id(schema) -> (schema, CompiledSchema)
+
+
+def compile_schema(schema: Dict) -> CompiledSchema:
+    """Returns the compiled schema, compiled on the first call only.
+
+    Raises
+    ------
+    SchemaError
+        if the schema is not valid.
+    """
+    key = id(schema)
+    if key not in __COMPILED_SCHEMAS__ or \
+            __COMPILED_SCHEMAS__[key][0] is not schema:
+        __COMPILED_SCHEMAS__[key] = (schema, CompiledSchema(schema))
+    return __COMPILED_SCHEMAS__[key][1]
+
+
+def validate_schema(
+    obj: Dict,
+    schema: Dict,
+    schema_name: str,
+    mode: str = "full"
+) -> Tuple[bool, str]:
     """
     Validates `obj` against `schema`. Does not throw any exceptions.
+    The schema is compiled once, see `compile_schema`. With the "fast"
+    mode the items of the arrays are checked column by column, the error
+    messages are the same.
     """
+    from jsonschema import ValidationError, SchemaError
+    if mode not in __VALIDATION_MODES__:
+        return False, f"Unknown validation mode `{mode}`"
     try:
-        validate(obj, schema)
+        compile_schema(schema).validate(obj, mode=mode)
     except ValidationError as err:
         is_valid = False
         message = err.message
@@ -75,4 +236,18 @@ def validate_schema(obj: Dict, schema: Dict, schema_name: str) -> Tuple[bool, st
     else:  # if valid schema
         is_valid = True
         final_error_message = None
-    return is_valid, final_error_message
\ No newline at end of file
+    return is_valid, final_error_message
+
+
+def canonical_dumps(obj: Any) -> bytes:
+    """Returns the json of an object with sorted keys and no spaces, the
+    input of the hashes."""
+    return json.dumps(
+        obj, sort_keys=True, separators=(",", ":"), default=str).encode()
+
+
+def hash_version(*objects: Any) -> str:
+    """Returns a version hash of json serializable objects, e.g. the
+    keyword dictionaries and the parameters of the taggers.
+    """
+    return hashlib.sha256(canonical_dumps(list(objects))).hexdigest()[:16]
@@ -0,0 +1,106 @@
+import importlib
+import json
+from typing import Any, Callable, Dict, Optional, Union
+import logging
+from zbta.core.logs import get_logger
+
+logger = get_logger(__name__, logging.ERROR)
+
+# the json backends, by order of preference. orjson and pysimdjson are
+# optional (pip install zbta[fast-json]), the standard library is the
+# fallback. The faster backends are stricter than the standard library,
+# e.g. they reject NaN and Infinity, which are not valid json anyway.
+__JSON_BACKENDS__ = ["orjson", "simdjson", "json"]
+
+
+def _load_backend(name: str) -> Optional[Callable[[Any], Any]]:
+    """Returns the `loads` function of a backend, None if not installed.
+    """
+    if name == "json":
+        return json.loads
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        return None
+    return getattr(module, "loads", None)
+
+
+class JSONDecoder:
+    """Decodes json payloads with the fastest backend installed.
+    """
+
+    def __init__(self, backend: Optional[str] = None) -> None:
+        """
+        Parameters
+        ----------
+        backend : str, optional
+            one of `__JSON_BACKENDS__`, by default the first installed
+
+        Raises
+        ------
+        ValueError
+            if the backend is unknown or not installed.
+        """
+        if backend is not None and backend not in __JSON_BACKENDS__:
+            msg = f"Unknown json backend `{backend}`"
+            logger.error(msg)
+            raise ValueError(msg)
+        for name in [backend] if backend else __JSON_BACKENDS__:
+            loads = _load_backend(name)
+            if loads is not None:
+                break
+        else:
+            msg = f"The json backend `{backend}` is not installed"
+            logger.error(msg)
+            raise ValueError(msg)
+        self._backend = name
+        self._loads = loads
+
+    @property
+    def backend(self) -> str:
+        return self._backend
+
+    def decode(
+        self,
+        payload: Union[str, bytes, bytearray, memoryview, Dict]
+    ) -> Any:
+        """Decodes a payload.
+
+        Parameters
+        ----------
+        payload : Union[str, bytes, bytearray, memoryview, Dict]
+            the json document. A dictionary is considered already decoded
+            and is returned as is.
+
+        Returns
+        -------
+        Any
+            the decoded document
+
+        Raises
+        ------
+        ValueError
+            if the payload is not valid json (`json.JSONDecodeError` is a
+            `ValueError`)
+        TypeError
+            if the payload is neither a document nor a dictionary.
+        """
+        if isinstance(payload, dict):
+            return payload
+        if not isinstance(payload, (str, bytes, bytearray, memoryview)):
+            raise TypeError(
+                f"Expecting a json document, got {type(payload).__name__}")
+        if self._backend == "json" and isinstance(payload, memoryview):
+            payload = payload.tobytes()
+        return self._loads(payload)
+
+
+__DECODER__ = JSONDecoder()
+
+
+def decode_json(
+    payload: Union[str, bytes, bytearray, memoryview, Dict]
+) -> Any:
+    """Decodes a payload with the default decoder, see `JSONDecoder.decode`.
+    """
+    return __DECODER__.decode(payload)
@@ -0,0 +1,45 @@
+"""The loggers of the package. The loggers of the modules propagate to the
+`zbta` logger, the only one with a handler, so that the messages are not
+printed once per module handler and the imports do not create one handler
+per module.
+"""
+import logging
+
+__LOG_FORMAT__ = "[%(levelname)s] [%(asctime)s] [%(funcName)s] %(message)s"
+__PACKAGE_LOGGER__ = "zbta"
+__HANDLER__ = None  # the handler of the package, created on first use
+
+
+def _get_handler() -> logging.Handler:
+    global __HANDLER__
+    if __HANDLER__ is None:
+        __HANDLER__ = logging.StreamHandler()
+        __HANDLER__.setFormatter(logging.Formatter(__LOG_FORMAT__))
+        logging.getLogger(__PACKAGE_LOGGER__).addHandler(__HANDLER__)
+    return __HANDLER__
+
+
+def get_logger(name: str, level: int = logging.ERROR) -> logging.Logger:
+    """Returns the logger of a module.
+
+    Parameters
+    ----------
+    name : str
+        the name of the module, `__name__`
+    level : int, optional
+        the level of the logger, by default logging.ERROR
+
+    Returns
+    -------
+    logging.Logger
+        the logger, with the handler of the package. The modules run as a
+        script (`__main__`) get the handler themselves.
+    """
+    handler = _get_handler()
+    logger = logging.getLogger(name)
+    if name != __PACKAGE_LOGGER__ and \
+            not name.startswith(__PACKAGE_LOGGER__ + ".") and \
+            handler not in logger.handlers:
+        logger.addHandler(handler)
+    logger.setLevel(level)
+    return logger
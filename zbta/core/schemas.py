@@ -77,7 +77,11 @@ __API_SCHEMA__ = {
                         },
                         "data_provider": {
                             "type": "string",
-                            "pattern": "fiserv_alldata"
+                            "description": "a registered provider, see `zbta.parsers.registry`"
+                        },
+                        "trace": {
+                            "type": "boolean",
+                            "description": "attach the durations of the stages to the response, see `zbta.core.tracing`"
                         }
                     }
                 },
@@ -95,6 +99,22 @@ __API_SCHEMA__ = {
     }
 }
 
+# the `bt_data` of the fiserv_alldata requests, see `zbta.parsers.registry`
+__FISERV_BT_DATA_SCHEMA__ = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "type": "object",
+    "required": ["data"],
+    "properties": {
+        "data": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["accountinfo"]
+            }
+        }
+    }
+}
+
 __ACCOUNT_SCHEMA__ = {
     "$schema": "https://json-schema.org/draft/2020-12/schema",
     "type": "object",
@@ -0,0 +1,308 @@
+"""Latency instrumentation of the pipeline: named spans timed with the
+monotonic nanosecond clock.
+
+The stages open spans with `span(name)`. They are recorded by the tracer
+of the current context only (see `tracing`), without one a span is a
+shared no-op and costs a context variable lookup. A request is traced when
+the instrumentation is enabled (`enable_instrumentation`), the durations
+then feed the Prometheus style histograms of the process, or when the
+request asks for its trace, which is attached to the response.
+
+The spans of the pipeline:
+    cache.get, cache.put                the cache of the analyses
+    parse                               the report, its accounts included
+    parse.account                       every account
+    parse.end_of_day                    the daily balances of every account
+    analyze                             the BTAnalyzer, its stages included
+    analyze.categorize                  the keyword categories
+    analyze.internal_transfers
+    analyze.salary_like
+    attributes                          all the attributes
+    attribute.<method>                  every attribute
+
+The filters of the attributes also count the rows they scan, for the
+profiler of the attributes (see `counting_rows`).
+"""
+import bisect
+import contextvars
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+from contextlib import contextmanager
+
+__INSTRUMENTATION__ = os.environ.get("ZBTA_INSTRUMENTATION", "") == "1"
+# the upper bounds of the buckets of the histograms, in seconds
+__DEFAULT_BUCKETS__ = (
+    .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5,
+    1., 2.5, 5., 10.)
+__METRIC_NAME__ = "zbta_span_duration_seconds"
+
+
+class SpanRecord(NamedTuple):
+    """A closed span."""
+    name: str
+    start_ns: int  # since the start of the tracer
+    duration_ns: int
+    depth: int  # the number of spans open when it started
+
+
+class _Span:
+    __slots__ = ("_tracer", "_name", "_start", "_depth")
+
+    def __init__(self, tracer: "Tracer", name: str) -> None:
+        self._tracer = tracer
+        self._name = name
+
+    def __enter__(self) -> "_Span":
+        self._depth = self._tracer._depth
+        self._tracer._depth += 1
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args) -> None:
+        end = time.perf_counter_ns()
+        tracer = self._tracer
+        tracer._depth -= 1
+        tracer._spans.append(SpanRecord(
+            self._name, self._start - tracer._origin, end - self._start,
+            self._depth))
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+__NO_SPAN__ = _NoSpan()
+
+
+class Tracer:
+    """The spans of a request, in the order they closed."""
+
+    def __init__(self) -> None:
+        self._origin = time.perf_counter_ns()
+        self._spans = []
+        self._depth = 0
+
+    @property
+    def spans(self) -> List[SpanRecord]:
+        return self._spans
+
+    def span(self, name: str) -> _Span:
+        return _Span(self, name)
+
+    def as_payload(self) -> List[Dict]:
+        """Returns the spans in the order they started, times in
+        milliseconds, for the response."""
+        return [
+            {"name": el.name, "start_ms": el.start_ns / 1e6,
+             "duration_ms": el.duration_ns / 1e6, "depth": el.depth}
+            for el in sorted(self._spans, key=lambda el: el.start_ns)]
+
+
+__TRACER__ = contextvars.ContextVar("zbta_tracer", default=None)
+
+
+def span(name: str):
+    """Returns a context manager timing a stage, recorded by the tracer of
+    the current context if any.
+
+    Parameters
+    ----------
+    name : str
+        the name of the stage, see the module documentation
+    """
+    tracer = __TRACER__.get()
+    if tracer is None:
+        return __NO_SPAN__
+    return _Span(tracer, name)
+
+
+@contextmanager
+def tracing() -> Iterator[Tracer]:
+    """Records the spans of the current context (thread, task) in a
+    tracer, the tracer already recording them if nested."""
+    tracer = __TRACER__.get()
+    if tracer is not None:
+        yield tracer
+        return
+    tracer = Tracer()
+    token = __TRACER__.set(tracer)
+    try:
+        yield tracer
+    finally:
+        __TRACER__.reset(token)
+
+
+__ROWS__ = contextvars.ContextVar("zbta_rows", default=None)
+
+
+class RowCounter:
+    """The number of rows scanned in a context, see `counting_rows`."""
+    __slots__ = ("rows",)
+
+    def __init__(self) -> None:
+        self.rows = 0
+
+
+def count_rows(nb: int) -> None:
+    """Adds the rows scanned by a filter to the counter of the current
+    context, if any: a full pass over a table counts its number of rows, a
+    lookup in a window of the date index the rows of the window."""
+    counter = __ROWS__.get()
+    if counter is not None:
+        counter.rows += nb
+
+
+@contextmanager
+def counting_rows() -> Iterator[RowCounter]:
+    """Counts the rows scanned in the current context (thread, task)."""
+    counter = RowCounter()
+    token = __ROWS__.set(counter)
+    try:
+        yield counter
+    finally:
+        __ROWS__.reset(token)
+
+
+def enable_instrumentation(enabled: bool = True) -> None:
+    """Traces every request of the process into the histograms, see
+    `get_histograms`. Also enabled by the ZBTA_INSTRUMENTATION=1
+    environment variable."""
+    global __INSTRUMENTATION__
+    __INSTRUMENTATION__ = enabled
+
+
+def is_instrumentation_enabled() -> bool:
+    return __INSTRUMENTATION__
+
+
+class SpanHistograms:
+    """Cumulative histograms of the durations of the spans, one per name,
+    in the Prometheus text format. Thread safe.
+    """
+
+    def __init__(self, buckets: Sequence[float] = __DEFAULT_BUCKETS__) -> None:
+        """
+        Parameters
+        ----------
+        buckets : Sequence[float], optional
+            the upper bounds of the buckets in seconds, by default 100us to
+            10s
+        """
+        self._bounds_ns = [int(el * 1e9) for el in buckets]
+        self._buckets = list(buckets)
+        self._lock = threading.Lock()
+        self._counts = {}  # name -> counts per bucket, +Inf last
+        self._sums = {}  # name -> total in ns
+
+    def observe(self, name: str, duration_ns: int) -> None:
+        with self._lock:
+            self._observe(name, duration_ns)
+
+    def _observe(self, name: str, duration_ns: int) -> None:
+        counts = self._counts.get(name)
+        if counts is None:
+            counts = self._counts[name] = [0] * (len(self._bounds_ns) + 1)
+            self._sums[name] = 0
+        counts[bisect.bisect_left(self._bounds_ns, duration_ns)] += 1
+        self._sums[name] += duration_ns
+
+    def add(self, tracer: Tracer) -> None:
+        """Observes every span of a tracer."""
+        with self._lock:
+            for el in tracer.spans:
+                self._observe(el.name, el.duration_ns)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = {}
+            self._sums = {}
+
+    def export(self) -> str:
+        """Returns the histograms in the Prometheus text format."""
+        lines = [
+            f"# HELP {__METRIC_NAME__} Duration of the stages of the "
+            "pipeline.",
+            f"# TYPE {__METRIC_NAME__} histogram"]
+        with self._lock:
+            for name in sorted(self._counts):
+                cumulative = 0
+                bounds = [repr(el) for el in self._buckets] + ["+Inf"]
+                for bound, count in zip(bounds, self._counts[name]):
+                    cumulative += count
+                    lines.append(
+                        f'{__METRIC_NAME__}_bucket{{span="{name}",'
+                        f'le="{bound}"}} {cumulative}')
+                lines.append(f'{__METRIC_NAME__}_sum{{span="{name}"}} '
+                             f'{self._sums[name] / 1e9}')
+                lines.append(f'{__METRIC_NAME__}_count{{span="{name}"}} '
+                             f'{cumulative}')
+        return "\n".join(lines) + "\n"
+
+
+__HISTOGRAMS__ = SpanHistograms()
+
+
+def get_histograms() -> SpanHistograms:
+    """Returns the histograms of the process."""
+    return __HISTOGRAMS__
+
+
+__SPAN_LABEL__ = re.compile(r'span="([^"]*)"')
+
+
+def merge_prometheus(texts: Iterable[str]) -> str:
+    """Sums the series of several exports of the histograms, e.g. the ones
+    of the workers of a server, into a single export.
+
+    Parameters
+    ----------
+    texts : Iterable[str]
+        the exports, see `SpanHistograms.export`, with the same buckets
+
+    Returns
+    -------
+    str
+        the export of the sums, in the Prometheus text format
+    """
+    comments = []
+    spans = {}  # span -> series -> value, in the order of the exports
+    for text in texts:
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith("#"):
+                if line not in comments:
+                    comments.append(line)
+                continue
+            series, value = line.rsplit(" ", 1)
+            match = __SPAN_LABEL__.search(series)
+            values = spans.setdefault(match.group(1) if match else "", {})
+            values[series] = values.get(series, 0.) + float(value)
+    lines = list(comments)
+    for name in sorted(spans):
+        for series, value in spans[name].items():
+            lines.append(f"{series} {int(value)}" if value.is_integer()
+                         else f"{series} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(path: Optional[str] = None) -> str:
+    """Returns the histograms of the process in the Prometheus text format
+    and writes them atomically to `path` if given, e.g. for the textfile
+    collector of the node exporter."""
+    text = __HISTOGRAMS__.export()
+    if path is not None:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf8") as hh:
+            hh.write(text)
+        os.replace(tmp, path)
+    return text
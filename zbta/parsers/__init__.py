@@ -1,5 +1,11 @@
-__VALID_PARSERS__ = ["fiserv_alldata"]
+from zbta.parsers.registry import (
+    __BUILTIN_PROVIDERS__, __DEFAULT_PROVIDER__, ProviderSpec, Provider,
+    available_providers, get_provider, register_provider)
+
+# kept for backward compatibility, the providers are in the registry
+__VALID_PARSERS__ = [el.name for el in __BUILTIN_PROVIDERS__]
 
 __MAPPING_VALID_PARSERS__ = {
-    "fiserv_alldata": ("fiserv", "AccountFiserv", "ReportFiserv"),
+    el.name: (el.module.rsplit(".", 1)[-1], el.account_class, el.report_class)
+    for el in __BUILTIN_PROVIDERS__
 }
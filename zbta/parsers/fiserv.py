@@ -1,27 +1,32 @@
 import logging
-from datetime import timedelta, datetime
-import warnings
+from zbta.core.logs import get_logger
+from datetime import datetime
 import numpy as np
 from typing import Dict, List
 from zbta.core.common import validate_schema, APIError, NoTransactionError, NoValidAccountError
 from zbta.core.schemas import __ACCOUNT_SCHEMA__
+from zbta.core.tracing import span
 import pandas as pd
 
-logger = logging.getLogger(__name__)
-fh = logging.StreamHandler()
-fh_formatter = logging.Formatter(
-    "[%(levelname)s] [%(asctime)s] [%(funcName)s] %(message)s")
-fh.setFormatter(fh_formatter)
-logger.addHandler(fh)
-logger.setLevel(logging.ERROR)
+logger = get_logger(__name__, logging.ERROR)
 
 
 class AccountAbstract:
     """Represents the abstract class for the Account Classes.
+    In lazy mode the PII is only extracted when first accessed. The
+    `validation_mode` of the payload is the one of `validate_schema`.
     """
 
-    def __init__(self, payload: Dict) -> None:
+    def __init__(
+        self,
+        payload: Dict,
+        lazy: bool = False,
+        validation_mode: str = "full"
+    ) -> None:
         self._payload = payload
+        self._lazy = lazy
+        self._validation_mode = validation_mode
+        self._pii_loaded = False
         if not isinstance(self._payload, dict):
             logger.error("Expecting a dictionary")
             raise TypeError("Expecting a dictionary")
@@ -55,6 +60,7 @@ class AccountAbstract:
 
     @property
     def owners_names(self):
+        self._load_pii()
         return self._owners_names
 
     @property
@@ -95,30 +101,37 @@ class AccountAbstract:
 
     @property
     def email_addresses(self):
+        self._load_pii()
         return self._email_addresses
 
     @property
     def phone_numbers(self):
+        self._load_pii()
         return self._phone_numbers
 
     @property
     def addresses(self):
+        self._load_pii()
         return self._addresses
 
     @property
     def cities(self):
+        self._load_pii()
         return self._cities
 
     @property
     def states(self):
+        self._load_pii()
         return self._states
 
     @property
     def streets(self):
+        self._load_pii()
         return self._streets
 
     @property
     def zipcodes(self):
+        self._load_pii()
         return self._zipcodes
 
     @property
@@ -173,11 +186,15 @@ class AccountAbstract:
         # reset the index
         self._transactions.index = pd.RangeIndex(self._nb_transactions)
         # turn dates into pandas datetime objects
-        self._transactions.date = pd.to_datetime(self._transactions.date)
-        # convert amount and balance to float
-        self._transactions.loc[
-            :, ['amount', 'balance']] = self._transactions.loc[
-            :, ['amount', 'balance']].astype(float)
+        if not pd.api.types.is_datetime64_ns_dtype(self._transactions.date):
+            self._transactions.date = pd.to_datetime(self._transactions.date)
+        # convert amount and balance to float, unless they already are
+        to_float = [el for el in ['amount', 'balance']
+                    if self._transactions[el].dtype != np.float64]
+        if to_float:
+            self._transactions.loc[
+                :, to_float] = self._transactions.loc[
+                :, to_float].astype(float)
         # convert description and status to str
         self._transactions.loc[
             :, ['description', 'status']] = self._transactions.loc[
@@ -197,6 +214,24 @@ class AccountAbstract:
             self._days_span = (self._transactions["date"].max()
                             - self._transactions["date"].min()).days
 
+    @property
+    def lazy(self) -> bool:
+        return self._lazy
+
+    def _extract_pii(self) -> None:
+        """Extracts the PII from the payload, see `_load_pii`.
+        """
+        pass
+
+    def _load_pii(self) -> None:
+        """Extracts and standardizes the PII, once.
+        """
+        if self._pii_loaded:
+            return
+        self._pii_loaded = True
+        self._extract_pii()
+        self._standardize_pii()
+
     def _standardize_pii(self):
         for idx, city in enumerate(self._cities):
             self._cities[idx] = city.lower()
@@ -216,21 +251,27 @@ class AccountFiserv(AccountAbstract):
     Note that multiple accounts form a Report object.
     """
 
-    def __init__(self, payload: Dict) -> None:
-        super().__init__(payload)
+    def __init__(
+        self,
+        payload: Dict,
+        lazy: bool = False,
+        validation_mode: str = "full"
+    ) -> None:
+        super().__init__(payload, lazy=lazy, validation_mode=validation_mode)
         self._transactions_columns_reqs = [
             'date', 'amount', 'balance', 'description', 'status']
         self._validate_schema()
         self._extract_curr_balance()
-        self._owners_info()
+        self._extract_account_number()
         self._extract_transactions()
         self._standardize_transactions()  # from abstract class
-        self._standardize_pii()  # from abstract class
+        if not lazy:
+            self._load_pii()  # from abstract class
 
     def _validate_schema(self) -> None:
         is_valid, error_message = validate_schema(
-            self._payload, __ACCOUNT_SCHEMA__, "account_schema"
-        )
+            self._payload, __ACCOUNT_SCHEMA__, "account_schema",
+            mode=self._validation_mode)
         if not is_valid:
             raise APIError(f"invalid account structure: `{error_message}`")
 
@@ -240,6 +281,12 @@ class AccountFiserv(AccountAbstract):
         self._current_balance = [el for el in self._payload['accountinfo']["AcctBal"]
                                  if el["BalType"] == "Current"][0]['CurAmt']["Amt"]
 
+    def _extract_account_number(self) -> None:
+        """Extracts the account number from the payload.
+        """
+        self._account_number_orig = self._payload['accountinfo'][
+            'FIAcctInfo']['FIAcctId']['AcctId']
+
     def _owners_info(self):
         """
         Parse the PII information from the account.
@@ -250,39 +297,44 @@ class AccountFiserv(AccountAbstract):
                 "FIAcctInfo"]["AcctOwnerName"].lower())
         else:
             self._owners_names.append("")
-        self._account_number_orig = self._payload['accountinfo'][
-            'FIAcctInfo']['FIAcctId']['AcctId']
+
+    def _extract_pii(self) -> None:
+        self._owners_info()
 
     def _get_trans(self) -> None:
         """Extracts the transactions from the raw report.
+        The records are walked once: every field goes into its own column
+        (in the order of first appearance, NaN when missing) and the
+        amount is read from `CurAmt` with the sign of `TrnType`.
         """
-        self._transactions = pd.DataFrame(self._payload["banktrans"][
-            "result"]["DepAcctTrnInqRs"]["DepAcctTrns"]["BankAcctTrnRec"])
-        df_amounts = self._transactions["CurAmt"].apply(pd.Series)
-        self._transactions.loc[:, "amount"] = df_amounts["Amt"]
-        self._transactions = self._transactions.rename(
+        records = self._payload["banktrans"][
+            "result"]["DepAcctTrnInqRs"]["DepAcctTrns"]["BankAcctTrnRec"]
+        nb_records = len(records)
+        columns = {}
+        amounts = [np.nan]*nb_records
+        for irecord, record in enumerate(records):
+            for key, value in record.items():
+                if key not in columns:
+                    columns[key] = [np.nan]*nb_records
+                columns[key][irecord] = value
+            amount = record["CurAmt"]["Amt"]
+            # make sure signs are ok
+            trn_type = record["TrnType"]
+            trn_type = trn_type.lower() if isinstance(trn_type, str) else None
+            if trn_type == "debit":
+                amount = -1*abs(amount)
+            elif trn_type == "credit":
+                amount = abs(amount)
+            amounts[irecord] = amount
+        columns.pop("CurAmt", None)
+        columns["amount"] = amounts
+        columns["status"] = ["posted"]*nb_records
+
+        self._transactions = pd.DataFrame(columns).rename(
             columns={"PostedDt": "date",
                      "Memo": "description",
-                     "TrnID": "id"})
-        self._transactions.loc[:, "status"] = "posted"
-
-        # make sure signs are ok
-        self._transactions.loc[
-            self._transactions.TrnType.str.lower() == "debit", "amount"] = -1*(
-            self._transactions.loc[
-                self._transactions.TrnType.str.lower() == "debit",
-                "amount"].abs()
-        )
-        self._transactions.loc[
-            self._transactions.TrnType.str.lower() == "credit", "amount"] = (
-            self._transactions.loc[
-                self._transactions.TrnType.str.lower() == "credit",
-                "amount"].abs()
-        )
-        self._transactions = self._transactions.rename(
-            columns={"Category": "category"})
-
-        self._transactions.drop('CurAmt', axis=1, inplace=True)
+                     "TrnID": "id",
+                     "Category": "category"})
 
         self._nb_transactions = self._transactions.shape[0]
 
@@ -315,51 +367,50 @@ class AccountFiserv(AccountAbstract):
                 'date', 'amount', 'status', 'description', 'balance'])
 
         else:
-            self._transactions['status'] = (
-                self._transactions['status'].str.lower().apply(
-                    lambda x: 'pending' if "pending" in x else 'posted'))
-
-            # removing pending trans
-            self._transactions = self._transactions.loc[
-                self._transactions.status != "pending"]
+            is_pending = self._transactions['status'].str.lower().apply(
+                lambda x: "pending" in x).to_numpy(dtype=bool)
+            dates = pd.to_datetime(
+                self._transactions["date"], format="%Y-%m-%d")
+            # the pending transactions are removed and the others sorted
+            # in a single copy of the table, only the keys are sorted
+            keys = pd.DataFrame({
+                "date": dates, "id": self._transactions["id"]})[~is_pending]
+            order = keys.sort_values(
+                by=["date", "id"], ascending=[True, True]).index
+            self._transactions = self._transactions.loc[order]
+            self._transactions["status"] = "posted"
+            self._transactions["date"] = dates.loc[order]
 
             self._nb_transactions = self._transactions.shape[0]
-            with warnings.catch_warnings():
-                # Not sure why the other copy in place do not raise the
-                # Setting values in-place is fine, ignore the warning in Pandas >= 1.5.0
-                # This can be removed, if Pandas 1.5.0 does not need to be supported any longer.
-                # See also: https://stackoverflow.com/q/74057367/859591
-                warnings.filterwarnings(
-                    "ignore",
-                    category=FutureWarning,
-                    message=(
-                        ".*will attempt to set the values inplace instead of always setting a new array. "
-                        "To retain the old behavior, use either.*"
-                    ),
-                )
-                self._transactions.loc[:, "date"] = pd.to_datetime(
-                    self._transactions["date"], format="%Y-%m-%d")
-            self._transactions = self._transactions.sort_values(
-                by=["date", "id"], ascending=[True, True])
-            self._transactions.loc[:,
-                                   "amount"] = self._transactions.loc[:, "amount"]
-
-            self._transactions.loc[:, "amount_collected"] = 0
-            self._transactions.loc[:, "amount_collected"] = (
+            self._transactions["amount_collected"] = (
                 self._transactions["amount"].cumsum())
             starting_amount = self._current_balance - self._transactions[
                 "amount"].sum()
-            self._transactions.loc[:, "balance"] = (
+            self._transactions["balance"] = (
                 self._transactions["amount_collected"] + starting_amount)
 
 
 class ReportFiserv:
     """Represents a full report.
+    In lazy mode the daily balances and the PII of the accounts are only
+    computed when first accessed. The accounts are validated with
+    `validation_mode`, "fast" for the provider (see `ProviderSpec`).
     """
     __INVALID_ACCT_TYPE__ = ["CCA"]
-
-    def __init__(self, payload: Dict, acct_ins: AccountAbstract) -> None:
+    # the columns of the merged transactions with few distinct values
+    __CATEGORICAL_COLUMNS__ = [
+        "status", "category", "account_number", "TrnType", "SubCategory"]
+
+    def __init__(
+        self,
+        payload: Dict,
+        acct_ins: AccountAbstract,
+        lazy: bool = False,
+        validation_mode: str = "full"
+    ) -> None:
         self._acct_ins = acct_ins  # the account class
+        self._lazy = lazy
+        self._validation_mode = validation_mode
         self._accts = []  # the accounts objects
         self._payload = payload  # the json payload
         self._nb_accounts = 0  # the number of accounts in the report
@@ -369,6 +420,7 @@ class ReportFiserv:
         self._min_date = None  # the minimum date accross accounts
         self._max_date = None  # the maximum date accross accounts
         self._dfs = None  # the merged transactions
+        self._df_daily = None  # the merged daily balances
         self._create_accts()
         self._merge_accts()  # creates a single view of the accounts
 
@@ -378,13 +430,16 @@ class ReportFiserv:
         self._nb_accounts_rep = len(self._payload['bt_data']['data'])
         for icc, acc in enumerate(self._payload['bt_data']['data']):
             if acc['accountinfo']['FIAcctInfo']['FIAcctId']['AcctType'] not in self.__INVALID_ACCT_TYPE__:
-                _acc = self._acct_ins(acc)
+                with span("parse.account"):
+                    _acc = self._acct_ins(
+                        acc, lazy=self._lazy,
+                        validation_mode=self._validation_mode)
                 if _acc.nb_transactions != 0:
                     _acc._account_number = icc
                     self._accts.append(_acc)
                     self._nb_transactions[icc] = self._accts[-1].nb_transactions
         if len(self._accts) != self._nb_accounts:
-            logging.debug(
+            logger.debug(
                 "some accounts were ignored because invalid type or no transactions found.")
         self._nb_accounts = len(self._accts)
         self._nb_transactions_tot = sum(
@@ -467,13 +522,26 @@ class ReportFiserv:
 
     @property
     def dfs_daily(self) -> pd.DataFrame:
+        if self._df_daily is None:
+            self._merge_daily()
         return self._df_daily
 
+    @property
+    def is_daily_built(self) -> bool:
+        """Returns True once the daily balances are built."""
+        return self._df_daily is not None
+
+    @property
+    def lazy(self) -> bool:
+        return self._lazy
+
     def _merge_accts(self) -> None:
         """Merges the different tables into a single view.
+        The transactions of every account are already sorted by date, the
+        merged table is their merge by date (the accounts being in the
+        order of their number) taken in a single copy. The tables of the
+        accounts are left untouched.
         """
-        self._dfs = [
-            self._get_trans_table(x) for x in self._accts]
         self._min_date = np.min(
             [x.oldest_balance_date for x in self._accts
                 if x.oldest_balance_date is not None])
@@ -481,16 +549,49 @@ class ReportFiserv:
             [x.most_recent_balance_date for x in self._accts
                 if x.most_recent_balance_date is not None])
 
-        self._dfs = pd.concat(self._dfs)
-        self._dfs = self._dfs.sort_values(
-            by=["date", "account_number"]).reset_index(drop=True).rename(
-                columns={"balance": "balance_acct"})
-
-        self._dfs.loc[:, "out"] = (
-            self._dfs["amount"] < 0).astype("int64")
+        tables = [x.transactions for x in self._accts]
+        dfs = pd.concat(tables, ignore_index=True)
+        # the account number follows the columns of the first account, as
+        # if it had been added to every table before the concatenation
+        dfs.insert(
+            len(tables[0].columns),
+            "account_number",
+            np.repeat([x.account_number for x in self._accts],
+                      [len(x) for x in tables]))
+        # a stable sort of sorted runs is their k-way merge
+        order = np.argsort(
+            dfs["date"].to_numpy(dtype="datetime64[ns]"), kind="stable")
+        self._dfs = dfs.take(order)
+        self._dfs.index = pd.RangeIndex(len(self._dfs))
+        self._dfs.rename(columns={"balance": "balance_acct"}, inplace=True)
+
+        self._compact_dtypes()
         # self._categorise_transactions()
-        self._daily_bals = [
-            self._get_end_of_day(acc) for acc in self._accts]
+        if not self._lazy:
+            self._merge_daily()
+
+    def _compact_dtypes(self) -> None:
+        """Adds the derived columns of the merged transactions with the
+        smallest dtypes: `out` (int8) and `day_ordinal` (int32, days since
+        epoch, the buckets of the internal transfers).
+        The columns with few distinct values are made categorical.
+        """
+        amounts = self._dfs["amount"].to_numpy(dtype=float)
+        self._dfs["out"] = (amounts < 0).astype(np.int8)
+        self._dfs["day_ordinal"] = self._dfs["date"].to_numpy(
+            dtype="datetime64[ns]").astype("datetime64[D]").view(
+                np.int64).astype(np.int32)
+        for column in self.__CATEGORICAL_COLUMNS__:
+            if column in self._dfs:
+                self._dfs[column] = self._dfs[column].astype("category")
+
+    def _merge_daily(self) -> None:
+        """Sums the end of day balances of the accounts into a single view.
+        """
+        self._daily_bals = []
+        for acc in self._accts:
+            with span("parse.end_of_day"):
+                self._daily_bals.append(self._get_end_of_day(acc))
         self._df_daily = pd.concat(self._daily_bals).groupby(by="date")[
             "balance"].sum().to_frame().reset_index()
 
@@ -507,73 +608,53 @@ class ReportFiserv:
 
         df = account.transactions
 
-        dateloopvar = account.oldest_balance_date
         ndays = int((account.most_recent_balance_date
                      - account.oldest_balance_date).days)+1
-
         #  Make sure all dates are included between min and max date
+        calendar = account.oldest_balance_date + pd.to_timedelta(
+            np.arange(ndays), unit="D")
+
         if df.shape[0] == 0:
-            list_balances = [account.current_balance]*ndays
-            list_dates = [dateloopvar + timedelta(days=idays)
-                          for idays in range(0, ndays)]
             return pd.DataFrame(
-                {"date": list_dates, "balance": list_balances})
-            # return pd.DataFrame(columns=["date", "balance"])
-
-        list_dates = [0.]*ndays
-        list_balances = [0.]*ndays
-        Ncases = 0
+                {"date": calendar, "balance": [account.current_balance]*ndays})
 
+        # the transactions of an account are sorted by date, the groups
+        # of `groupby` are sorted too
         df_endofday = df.loc[
-            :, ["date", "balance"]].groupby(by="date").last().reset_index(
-        ).sort_values(by="date")
-
-        df = df.sort_values(by="date", ascending=True)
+            :, ["date", "balance"]].groupby(by="date").last().reset_index()
 
         day_bal = df["balance"].iloc[0] - df["amount"].iloc[0]
-        counter_orig = 0
-        Ncases = 0
-        while (dateloopvar <= account.most_recent_balance_date):
-            condition = dateloopvar == df_endofday["date"].values[counter_orig]
-
-            if condition:
-                day_bal = df_endofday["balance"].values[counter_orig]
-                if counter_orig < df_endofday.shape[0]-1:
-                    counter_orig += 1
-            elif day_bal is not None:
-                list_dates[Ncases] = dateloopvar
-                list_balances[Ncases] = day_bal
-                Ncases += 1
-
-            dateloopvar += timedelta(days=1)
+
+        # The end of day balances are matched in order while walking the
+        # calendar, a date that is not on the calendar (e.g. before the
+        # oldest balance date) stops the matching of the following ones.
+        # Every day that is not matched is filled with the last matched
+        # balance (or the balance before the first transaction).
+        day = pd.Timedelta(days=1).value
+        offsets = df_endofday["date"].values.astype(
+            "datetime64[ns]").view(np.int64) - calendar[0].value
+        on_calendar = (offsets >= 0) & (offsets % day == 0) & \
+            (offsets < ndays * day)
+        nmatched = len(offsets) if on_calendar.all() else int(
+            np.argmin(on_calendar))
+        matched = offsets[:nmatched] // day
+
+        is_filler = np.ones(ndays, dtype=bool)
+        is_filler[matched] = False
+        if not is_filler.any():
+            fillers = pd.DataFrame({"date": [], "balance": []})
+        else:
+            balances = np.concatenate([
+                [day_bal], df_endofday["balance"].values[:nmatched]])
+            fillers = pd.DataFrame({
+                "date": calendar[is_filler],
+                "balance": balances[np.searchsorted(
+                    matched, np.flatnonzero(is_filler), side="right")]
+            })
 
         df_endofday = pd.concat(
-            [
-                df_endofday,
-                pd.DataFrame(
-                    {"date": list_dates[:Ncases],
-                     "balance": list_balances[:Ncases]}
-                )
-            ],
+            [df_endofday, fillers],
             ignore_index=True
         ).sort_values(by="date")
 
         return df_endofday
-
-    def _get_trans_table(self, account):
-        """
-        Return transaction table from an account and add account_number.
-
-        Parameters
-        ------------
-
-        account: AccontAbstrct object
-            account object
-        """
-        transtable = account.transactions
-        if transtable.shape[0] > 0:
-            transtable.loc[:, "account_number"] = account.account_number
-        else:
-            transtable["account_number"] = None
-
-        return transtable
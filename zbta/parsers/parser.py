@@ -1,55 +1,60 @@
-from typing import Dict
-from zbta.parsers import __VALID_PARSERS__, __MAPPING_VALID_PARSERS__
-from zbta.parsers.fiserv import ReportFiserv
+from typing import TYPE_CHECKING, Dict
+from zbta.parsers.registry import __DEFAULT_PROVIDER__, get_provider
 import logging
-import importlib
-from zbta.core.common import APIError
+from zbta.core.logs import get_logger
 
-logger = logging.getLogger(__name__)
-fh = logging.StreamHandler()
-fh_formatter = logging.Formatter(
-    "[%(levelname)s] [%(asctime)s] [%(funcName)s] %(message)s")
-fh.setFormatter(fh_formatter)
-logger.addHandler(fh)
-logger.setLevel(logging.ERROR)
+if TYPE_CHECKING:  # the parsers are imported on first use
+    from zbta.parsers.fiserv import ReportFiserv
+
+logger = get_logger(__name__, logging.ERROR)
 
 class Parser:
     """Provides a single interface to parser any report.
     """
     
-    def __init__(self, payload: Dict) -> None:
+    def __init__(self, payload: Dict, lazy: bool = False) -> None:
+        """
+        Parameters
+        ----------
+        payload : Dict
+            the request
+        lazy : bool, optional
+            create a lazy report, see `ReportFiserv`, ignored by the
+            providers without lazy reports, by default False
+        """
         self._payload = payload
+        self._lazy = lazy
         self._acct_ins = None
         self._rep_ins = None
+        self._options = {}  # the options the Report class takes
         self._report = None
-        self._data_provider = self._payload["meta"].get("data_provider", "fiserv_alldata").lower()
+        self._data_provider = self._payload["meta"].get(
+            "data_provider", __DEFAULT_PROVIDER__).lower()
 
     def _get_classes_instances(self) -> None:
-        """Constructs the instance classes and report classes.
+        """Constructs the instance classes and report classes, the module
+        of the provider is imported the first time it is seen.
 
         Raises
         ------
         APIError
             if `data_provider` is invalid or not recognized.
         """
-        if self._data_provider not in __VALID_PARSERS__:
-            msg = f"Unknown parser `{self._data_provider}`"
-            logger.error(msg)
-            raise APIError(msg)
-        mod, acct_cls, rep_cls = __MAPPING_VALID_PARSERS__[self._data_provider]
-        # 1.1 import the module and account class
-        mod = importlib.import_module(f"zbta.parsers.{mod}")
-        self._rep_ins = getattr(mod, rep_cls)
-        self._acct_ins = getattr(mod, acct_cls)
+        provider = get_provider(self._data_provider)
+        self._rep_ins = provider.report_class
+        self._acct_ins = provider.account_class
+        self._options = provider.report_options(
+            lazy=self._lazy, validation_mode=provider.validation_mode)
 
     def parse(self) -> None:
         """Parses the report provided.
         """
         self._get_classes_instances()
-        self._report = self._rep_ins(self._payload, acct_ins=self._acct_ins)
+        self._report = self._rep_ins(
+            self._payload, acct_ins=self._acct_ins, **self._options)
 
     @property
-    def report(self) -> ReportFiserv:
+    def report(self) -> "ReportFiserv":
         """Returns the report instance.
 
         Returns
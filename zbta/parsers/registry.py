@@ -0,0 +1,255 @@
+"""Registry of the data providers (aggregators) that the parsers support.
+
+A provider declares, without importing anything, the module of its parser,
+its Account and Report classes and the schema of the `bt_data` of its
+requests. The module of a provider is imported the first time one of its
+requests is seen, so that adding providers does not slow down the start of
+the workers that never see them.
+
+Besides the built-in providers, the packages can declare theirs with an
+entry point of the `zbta.providers` group, pointing to a `ProviderSpec`:
+
+    entry_points={
+        "zbta.providers": [
+            "plaid = zbta_plaid.provider:PLAID_PROVIDER",
+        ]
+    }
+
+The module of the entry point is imported when the registry is first
+looked up, it must only define the spec (the parser lives in `module`).
+
+The Report class of a provider is constructed as
+`report_class(request, acct_ins=account_class, **options)` and must expose
+what `BTAnalyzer` reads, as `ReportFiserv` does (`dfs`, `dfs_daily`,
+`accounts`, `max_date`, `min_date`, `nb_accounts`, `nb_transactions`). The
+options are only passed if its constructor declares them (or takes
+**kwargs):
+    lazy             bool, build the daily balances and the PII on first
+                     access (then also expose `is_daily_built`)
+    validation_mode  str, the mode of `validate_schema` for the accounts,
+                     "fast" for the providers with a `fast_path`
+"""
+import importlib
+import inspect
+from typing import Any, Dict, List, NamedTuple, Optional
+from zbta.core.common import APIError
+import logging
+from zbta.core.logs import get_logger
+
+logger = get_logger(__name__, logging.ERROR)
+
+__ENTRY_POINT_GROUP__ = "zbta.providers"
+__DEFAULT_PROVIDER__ = "fiserv_alldata"
+
+
+class ProviderSpec(NamedTuple):
+    """The declaration of a provider.
+
+    Attributes
+    ----------
+    name : str
+        the `data_provider` of the requests, lower case
+    module : str
+        the module of the parser, imported on first use
+    account_class : str
+        the name of the Account class in `module`
+    report_class : str
+        the name of the Report class in `module`
+    schema : str, optional
+        the schema of the `bt_data` of the requests, as "module:attribute",
+        by default None (not validated)
+    fast_path : bool, optional
+        the records of the provider (its `bt_data` and its accounts) are
+        flat enough to be validated column by column, see the "fast" mode
+        of `validate_schema`, by default False
+
+    The constructor of the Report class is described in the module
+    documentation.
+    """
+    name: str
+    module: str
+    account_class: str
+    report_class: str
+    schema: Optional[str] = None
+    fast_path: bool = False
+
+
+class Provider:
+    """A registered provider, its parser module is imported on the first
+    access to its classes and its schema module on the first access to
+    `schema`."""
+
+    def __init__(self, spec: ProviderSpec) -> None:
+        self._spec = spec
+        self._module = None
+        self._schema = None
+        self._report_keywords = None  # the options of the Report class
+
+    @property
+    def spec(self) -> ProviderSpec:
+        return self._spec
+
+    @property
+    def name(self) -> str:
+        return self._spec.name
+
+    @property
+    def fast_path(self) -> bool:
+        return self._spec.fast_path
+
+    @property
+    def validation_mode(self) -> str:
+        """Returns the mode of `validate_schema` for the requests."""
+        return "fast" if self._spec.fast_path else "full"
+
+    @property
+    def is_loaded(self) -> bool:
+        """Returns True once the parser module is imported."""
+        return self._module is not None
+
+    def _load(self) -> Any:
+        if self._module is None:
+            logger.debug("importing the parser of `%s`", self.name)
+            self._module = importlib.import_module(self._spec.module)
+        return self._module
+
+    @property
+    def account_class(self) -> type:
+        return getattr(self._load(), self._spec.account_class)
+
+    @property
+    def report_class(self) -> type:
+        return getattr(self._load(), self._spec.report_class)
+
+    def report_options(self, **options: Any) -> Dict[str, Any]:
+        """Returns the options of the Report class (`lazy`,
+        `validation_mode`) that its constructor declares, the others are
+        dropped. See the module documentation.
+        """
+        if self._report_keywords is None:
+            parameters = inspect.signature(
+                self.report_class.__init__).parameters.values()
+            if any(el.kind == el.VAR_KEYWORD for el in parameters):
+                self._report_keywords = set(options)
+            else:
+                self._report_keywords = {el.name for el in parameters}
+        dropped = [el for el in options if el not in self._report_keywords]
+        if dropped:
+            logger.debug("the Report class of `%s` does not take %s",
+                         self.name, dropped)
+        return {key: val for key, val in options.items()
+                if key in self._report_keywords}
+
+    @property
+    def schema(self) -> Optional[Dict]:
+        """Returns the schema of the `bt_data`, None if not declared."""
+        if self._schema is None and self._spec.schema is not None:
+            module, attribute = self._spec.schema.split(":")
+            self._schema = getattr(importlib.import_module(module), attribute)
+        return self._schema
+
+
+__PROVIDERS__ = {}  # name -> Provider
+__BUILTIN_PROVIDERS__ = [
+    ProviderSpec(
+        name="fiserv_alldata",
+        module="zbta.parsers.fiserv",
+        account_class="AccountFiserv",
+        report_class="ReportFiserv",
+        schema="zbta.core.schemas:__FISERV_BT_DATA_SCHEMA__",
+        fast_path=True),
+]
+_discovered = False
+
+
+def register_provider(spec: ProviderSpec, replace: bool = False) -> None:
+    """Registers a provider, its modules are not imported.
+
+    Parameters
+    ----------
+    spec : ProviderSpec
+        the declaration of the provider
+    replace : bool, optional
+        replace a provider of the same name, by default False
+
+    Raises
+    ------
+    ValueError
+        if the provider is already registered and `replace` is False.
+    """
+    name = spec.name.lower()
+    if name in __PROVIDERS__ and not replace:
+        raise ValueError(f"The provider `{name}` is already registered")
+    __PROVIDERS__[name] = Provider(spec._replace(name=name))
+
+
+def _entry_points() -> List[Any]:
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # python < 3.8
+        return []
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        return list(eps.select(group=__ENTRY_POINT_GROUP__))
+    return list(eps.get(__ENTRY_POINT_GROUP__, []))
+
+
+def discover_providers() -> None:
+    """Registers the providers declared by the entry points of the
+    `zbta.providers` group, once. The built-in providers win the name
+    conflicts, an invalid entry point is logged and skipped."""
+    global _discovered
+    if _discovered:
+        return
+    _discovered = True
+    for entry_point in _entry_points():
+        try:
+            spec = entry_point.load()
+            if callable(spec) and not isinstance(spec, ProviderSpec):
+                spec = spec()
+            if not isinstance(spec, ProviderSpec):
+                raise TypeError(f"expected a ProviderSpec, got `{spec}`")
+            register_provider(spec)
+        except Exception as err:
+            logger.error("ignoring the provider entry point `%s`: %s",
+                         entry_point.name, err)
+
+
+def available_providers() -> List[str]:
+    """Returns the names of the registered providers."""
+    discover_providers()
+    return list(__PROVIDERS__)
+
+
+def get_provider(name: str) -> Provider:
+    """Returns a registered provider.
+
+    Parameters
+    ----------
+    name : str
+        the `data_provider` of a request, case insensitive
+
+    Returns
+    -------
+    Provider
+        the provider
+
+    Raises
+    ------
+    APIError
+        if the provider is not recognized.
+    """
+    name = name.lower()
+    provider = __PROVIDERS__.get(name)
+    if provider is None:
+        discover_providers()
+        provider = __PROVIDERS__.get(name)
+    if provider is None:
+        msg = f"Unknown parser `{name}`"
+        logger.error(msg)
+        raise APIError(msg)
+    return provider
+
+
+for _spec in __BUILTIN_PROVIDERS__:
+    register_provider(_spec)
@@ -1,14 +1,9 @@
 from abc import abstractclassmethod, ABC
 from zbta.btanalyzer.btanalyzer import BTAnalyzer
 import logging
+from zbta.core.logs import get_logger
 
-logger = logging.getLogger(__name__)
-fh = logging.StreamHandler()
-fh_formatter = logging.Formatter(
-    "[%(levelname)s] [%(asctime)s] [%(funcName)s] %(message)s")
-fh.setFormatter(fh_formatter)
-logger.addHandler(fh)
-logger.setLevel(logging.ERROR)
+logger = get_logger(__name__, logging.ERROR)
 
 
 class TriggerAbstract(ABC):